@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+import itertools
+
+import numpy as np
+
+from master_batch import run_batch
+from master_output import read_run
+from master_surrogate import total_flux
+from master_sweep import ORBIT_ELEMENTS, sweep_specs
+
+# reduction of the linear interpolation error when a cell is halved
+REFINEMENT_GAIN = 4.0
+
+
+def relative_difference(a, b):
+    """Maximum difference between two quantities, relative to their largest
+    absolute value."""
+    norm = max(np.abs(a).max(), np.abs(b).max())
+    if norm == 0:
+        return 0.0
+    return float(np.abs(a - b).max() / norm)
+
+
+class AdaptiveSweep(object):
+    """Sweep over some orbital elements that refines the grid of orbits only
+    where the flux changes fast.
+
+    The swept elements span a box that is divided in cells. The campaign
+    starts from a coarse grid; at every round the cells with the largest
+    estimated error are halved along every swept element and only the new
+    corners are run. The error of a cell is the linear interpolation error
+    measured when its parent was refined, scaled by REFINEMENT_GAIN, or the
+    variation of the quantity between its corners (local gradient times the
+    cell size) for the cells of the initial grid.
+
+    Inputs
+    ------
+    - axes (dict):
+        the (lower, upper) bounds of each swept element, by name (see
+        master_sweep.ORBIT_ELEMENTS), e.g. {'sma': (6778., 7378.),
+        'inc': (50., 100.)}.
+    - orbit (list):
+        the orbit (sma, ecc, inc, raan, aop) giving the elements which are
+        not swept.
+    - begin_epoch, end_epoch (str):
+        the analysis interval, in the form YEAR/MONTH/DAY/HOUR.
+    - n_initial (int or dict):
+        the number of points of the initial grid along each swept element.
+    - max_level (int):
+        the maximum number of times a cell of the initial grid is halved.
+    - prefix (str):
+        the beginning of the run identifiers (see master_sweep.run_id).
+    - quantity (function):
+        extracts the quantity driving the refinement from the tables of a run
+        (see master_surrogate.total_flux).
+    - spec:
+        the other entries of the run specifications (see
+        master_batch.complete_spec).
+
+    Example
+    -------
+        sweep = AdaptiveSweep({'sma': (6778., 7378.), 'inc': (50., 100.)},
+                              [7000., 0.001, 0., 0., 0.], '2016/01/01/00',
+                              '2017/01/01/00', path='C:/results')
+        sweep.run(tolerance=0.05, max_runs=200)
+        value = sweep.predict([7100., 0.001, 63., 0., 0.])
+    """
+    def __init__(self, axes, orbit, begin_epoch, end_epoch, n_initial=3,
+                 max_level=3, prefix='adaptive', quantity=total_flux,
+                 **spec):
+        unknown = set(axes) - set(ORBIT_ELEMENTS)
+        if unknown:
+            raise ValueError("Unknown orbital elements: {}.".format(
+                ', '.join(sorted(unknown))))
+        self.names = [name for name in ORBIT_ELEMENTS if name in axes]
+        self.bounds = np.array([axes[name] for name in self.names],
+                               dtype=float)
+        self.orbit = [float(item) for item in orbit]
+        self.begin_epoch = begin_epoch
+        self.end_epoch = end_epoch
+        if not isinstance(n_initial, dict):
+            n_initial = dict((name, n_initial) for name in self.names)
+        self.max_level = max_level
+        self.prefix = prefix
+        self.quantity = quantity
+        self.spec = spec
+        # number of lattice steps of each cell of the initial grid
+        self.__step = 2 ** max_level
+        self.__size = np.array([(n_initial[name] - 1) * self.__step
+                                for name in self.names])
+        if (self.__size <= 0).any():
+            raise ValueError("The initial grid needs at least 2 points along "
+                             "each swept element.")
+        # quantity and result of each sampled lattice point
+        self.values = {}
+        self.results = {}
+        self.failed = []
+        # leaf cells (level, index) and their estimated error
+        self.cells = {}
+        for index in itertools.product(*[range(n_initial[name] - 1)
+                                         for name in self.names]):
+            self.cells[(0, index)] = None
+        self.history = []
+
+    @property
+    def n_runs(self):
+        return len(self.results)
+
+    def point(self, key):
+        """Returns the orbit of a lattice point."""
+        fraction = np.asarray(key, dtype=float) / self.__size
+        values = self.bounds[:, 0] + fraction * (self.bounds[:, 1] -
+                                                 self.bounds[:, 0])
+        orbit = list(self.orbit)
+        for name, value in zip(self.names, values):
+            orbit[ORBIT_ELEMENTS.index(name)] = float(value)
+        return orbit
+
+    def corners(self, cell):
+        """Returns the lattice points of the corners of a cell."""
+        level, index = cell
+        step = self.__step // 2 ** level
+        return [tuple((i + o) * step for i, o in zip(index, offset))
+                for offset in itertools.product((0, 1), repeat=len(index))]
+
+    def children(self, cell):
+        level, index = cell
+        return [(level + 1, tuple(2 * i + o for i, o in zip(index, offset)))
+                for offset in itertools.product((0, 1), repeat=len(index))]
+
+    def interpolate(self, cell, key):
+        """Multilinear interpolation of the quantity at a lattice point, from
+        the corners of a cell."""
+        level, index = cell
+        step = float(self.__step // 2 ** level)
+        lower = np.array(index) * step
+        t = (np.asarray(key, dtype=float) - lower) / step
+        value = 0.0
+        for offset, corner in zip(itertools.product((0, 1),
+                                                    repeat=len(index)),
+                                  self.corners(cell)):
+            weight = np.prod([ti if o else 1.0 - ti
+                              for ti, o in zip(t, offset)])
+            value = value + weight * self.values[corner]
+        return value
+
+    def error(self, cell):
+        """Estimated relative interpolation error of a cell, None if some of
+        its corners have not been run successfully."""
+        corners = self.corners(cell)
+        if any(corner not in self.values for corner in corners):
+            return None
+        if self.cells.get(cell) is not None:
+            return self.cells[cell]
+        values = [self.values[corner] for corner in corners]
+        return max(relative_difference(a, b)
+                   for a, b in itertools.combinations(values, 2))
+
+    def refinable(self, tolerance):
+        """Returns the leaf cells to refine, largest error first."""
+        candidates = []
+        for cell in self.cells:
+            error = self.error(cell)
+            if (cell[0] < self.max_level and error is not None and
+                    error > tolerance):
+                candidates.append((error, cell))
+        candidates.sort(reverse=True)
+        return [cell for error, cell in candidates]
+
+    def run(self, tolerance=0.05, max_runs=None, processes=None):
+        """Runs the campaign until no cell has an estimated error larger than
+        tolerance, the cells cannot be halved any more or max_runs runs have
+        been executed.
+
+        Returns
+        -------
+        - max_error (float):
+            the largest estimated error of the cells.
+        """
+        if not self.values:
+            initial = set()
+            for cell in self.cells:
+                initial.update(self.corners(cell))
+            self.__execute(sorted(initial), processes)
+            self.__record(tolerance)
+        while True:
+            budget = None if max_runs is None else max_runs - self.n_runs
+            refined = []
+            keys = set()
+            for cell in self.refinable(tolerance):
+                new = set(corner for child in self.children(cell)
+                          for corner in self.corners(child)
+                          if corner not in self.results) - keys
+                if budget is not None and len(keys) + len(new) > budget:
+                    break
+                refined.append(cell)
+                keys.update(new)
+            if not refined:
+                break
+            self.__execute(sorted(keys), processes)
+            for cell in refined:
+                self.__refine(cell)
+            self.__record(tolerance)
+        return self.history[-1]['max_error']
+
+    def predict(self, orbit):
+        """Predicts the quantity for an orbit inside the swept box, by
+        multilinear interpolation over the leaf cell containing it."""
+        values = np.array([orbit[ORBIT_ELEMENTS.index(name)]
+                           for name in self.names], dtype=float)
+        key = ((values - self.bounds[:, 0]) /
+               (self.bounds[:, 1] - self.bounds[:, 0]) * self.__size)
+        if (key < 0).any() or (key > self.__size).any():
+            raise ValueError("The orbit is outside the swept elements.")
+        for cell in self.cells:
+            level, index = cell
+            step = self.__step // 2 ** level
+            lower = np.array(index) * step
+            if ((key >= lower) & (key <= lower + step)).all():
+                return self.interpolate(cell, key)
+
+    def __execute(self, keys, processes):
+        orbits = [self.point(key) for key in keys]
+        specs = sweep_specs(orbits, [(self.begin_epoch, self.end_epoch)],
+                            self.prefix, **self.spec)
+        by_name = dict((spec['sim_name'], key)
+                       for spec, key in zip(specs, keys))
+        for result in run_batch(specs, processes):
+            key = by_name[result['sim_name']]
+            self.results[key] = result
+            if result['status'] != 'done':
+                self.failed.append(result)
+                continue
+            self.values[key] = np.asarray(self.quantity(read_run(
+                result['output_path'], result['spec']['run_id'])))
+
+    def __refine(self, cell):
+        del self.cells[cell]
+        # interpolation error of the parent at the new corners
+        errors = [relative_difference(self.interpolate(cell, corner),
+                                      self.values[corner])
+                  for child in self.children(cell)
+                  for corner in self.corners(child)
+                  if corner in self.values]
+        error = max(errors) / REFINEMENT_GAIN if errors else None
+        for child in self.children(cell):
+            self.cells[child] = error
+
+    def __record(self, tolerance):
+        errors = [error for error in (self.error(cell) for cell in self.cells)
+                  if error is not None]
+        self.history.append({'n_runs': self.n_runs,
+                             'n_cells': len(self.cells),
+                             'max_error': max(errors) if errors else None,
+                             'above_tolerance': sum(error > tolerance
+                                                    for error in errors)})
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""Compaction of the folders of completed runs into a few archive files.
+
+Every file of a run folder (input and output) is appended to an archive
+file together with, for the numeric output files, their parsed values as
+raw float64 arrays. An index gives the offset of every file, so that a
+single output file is read straight from the archive through a memory map,
+without extracting anything.
+
+Usage:
+    python master_archive.py pack ARCHIVE RUN_FOLDER [RUN_FOLDER ...]
+                                  [--keep]
+    python master_archive.py list ARCHIVE
+    python master_archive.py extract ARCHIVE SIM_NAME DESTINATION
+"""
+import argparse
+import json
+import mmap
+import os
+import sys
+
+import numpy as np
+
+from master_input import SANDBOX_CLOUDS, SANDBOX_DATA, remove_run_folder
+from master_output import OutputTable, read_output
+
+# an archive file is closed once it is larger than this, in bytes
+ARCHIVE_SIZE = 2 ** 31
+ARCHIVE_FORMAT = 'pack_{:03d}'
+# index of the archive file of every run
+RUNS_INDEX = 'runs.json'
+# the arrays are aligned to their item size, as required by numpy.memmap
+ALIGNMENT = 8
+
+
+def write_json(filename, content):
+    """Writes a JSON file atomically."""
+    tmp_filename = '{}.tmp{}'.format(filename, os.getpid())
+    with open(tmp_filename, 'w') as f_out:
+        json.dump(content, f_out)
+        f_out.flush()
+        os.fsync(f_out.fileno())
+    if os.path.isfile(filename):
+        os.remove(filename)
+    os.rename(tmp_filename, filename)
+
+
+def read_json(filename, default):
+    if not os.path.isfile(filename):
+        return default
+    with open(filename, 'r') as f_in:
+        return json.load(f_in)
+
+
+def run_files(run_path):
+    """Returns the files of a run folder, as paths relative to the folder
+    (e.g. 'output/master_d02.txt'), sorted. The links to the population data
+    (SANDBOX_DATA and SANDBOX_CLOUDS) are not entered: on Windows they are
+    directory junctions, which os.walk does not recognise as links."""
+    names = []
+    for root, folders, files in os.walk(run_path):
+        relative = os.path.relpath(root, run_path)
+        if relative == '.':
+            folders[:] = [name for name in folders
+                          if name not in (SANDBOX_DATA, SANDBOX_CLOUDS)]
+        folders[:] = [name for name in folders
+                      if not os.path.islink(os.path.join(root, name))]
+        for name in files:
+            if relative == '.':
+                names.append(name)
+            else:
+                names.append('/'.join(relative.split(os.sep) + [name]))
+    return sorted(names)
+
+
+class RunArchive(object):
+    """Archive of the folders of completed runs.
+
+    The archive is a folder with the archive files (pack_NNN.bin), the index
+    of each of them (pack_NNN.json) and the archive file of every run
+    (runs.json). The bytes of a run are written and synced before the
+    indexes are replaced, and the indexes before the run folder is removed,
+    so that an interruption never loses a run. The indexes are written once
+    per call to pack, so the runs are best packed in large batches.
+
+    Runs are identified by their 'sim_name', the name of their folder. Once a
+    run has been packed its folder is gone, so the run is executed again if
+    it is launched with the same name (see MasterRun.check_simulation).
+
+    Inputs
+    ------
+    - archive_path (str):
+        the folder of the archive. It is created if it does not exist.
+
+    Example
+    -------
+        archive = RunArchive('C:/results/archive')
+        archive.pack([result['output_path'].rsplit('/', 1)[0]
+                      for result in results if result['status'] == 'done'])
+        tables = archive.read_run('orbit_001', 'master')
+    """
+    def __init__(self, archive_path):
+        self.archive_path = archive_path
+        if not os.path.isdir(archive_path):
+            os.makedirs(archive_path)
+        self.__runs = read_json(self.__path(RUNS_INDEX), {})
+        self.__indexes = {}
+        self.__maps = {}
+
+    def runs(self):
+        """Returns the names of the archived runs, sorted."""
+        return sorted(self.__runs)
+
+    def files(self, sim_name):
+        """Returns the files of an archived run, relative to its folder."""
+        return sorted(self.__entries(sim_name))
+
+    def pack(self, run_paths, remove=True):
+        """Appends run folders to the archive.
+
+        Inputs
+        ------
+        - run_paths (list):
+            the folders of the runs (MasterRun.run_path).
+        - remove (bool):
+            if True each folder is removed once the run is in the archive.
+
+        Returns
+        -------
+        - packed (list):
+            the names of the runs added to the archive.
+        """
+        packed = []
+        numbers = set()
+        try:
+            for run_path in run_paths:
+                run_path = run_path.rstrip('/\\')
+                sim_name = os.path.basename(run_path)
+                if sim_name in self.__runs:
+                    raise ValueError("The run {} is already in the "
+                                     "archive.".format(sim_name))
+                number = self.__current()
+                numbers.add(number)
+                self.__index(number)[sim_name] = self.__append(number,
+                                                               run_path)
+                self.__runs[sim_name] = number
+                packed.append((sim_name, run_path))
+        finally:
+            # the runs appended before an error are indexed too
+            self.__write_indexes(numbers)
+        if remove:
+            for _, run_path in packed:
+                remove_run_folder(run_path)
+        return [sim_name for sim_name, _ in packed]
+
+    def read_bytes(self, sim_name, name):
+        """Returns the content of a file of an archived run."""
+        entry = self.__entry(sim_name, name)
+        buffer = self.__map(self.__runs[sim_name])
+        return buffer[entry['offset']:entry['offset'] + entry['length']]
+
+    def read_table(self, sim_name, name):
+        """Returns an output file of an archived run as an OutputTable, whose
+        data is memory-mapped from the archive file.
+
+        Inputs
+        ------
+        - name (str):
+            the name of the output file (e.g. 'master_d02.txt') or its path
+            relative to the run folder.
+        """
+        if '/' not in name:
+            name = 'output/' + name
+        entry = self.__entry(sim_name, name)
+        if entry['data'] is None:
+            raise ValueError("{} of {} has no numeric data.".format(
+                name, sim_name))
+        offset, shape = entry['data']
+        data = np.memmap(self.__bin(self.__runs[sim_name]), dtype=float,
+                         mode='r', offset=offset, shape=tuple(shape))
+        return OutputTable(os.path.basename(name), entry['header'], data)
+
+    def read_run(self, sim_name, run_id=None):
+        """Returns the numeric output files of an archived run, by file name,
+        as master_output.read_run does for a run folder."""
+        tables = {}
+        for name, entry in sorted(self.__entries(sim_name).items()):
+            basename = name[len('output/'):]
+            if not name.startswith('output/') or '/' in basename:
+                continue
+            if run_id is not None and not basename.startswith(run_id):
+                continue
+            if entry['data'] is not None:
+                tables[basename] = self.read_table(sim_name, name)
+        return tables
+
+    def extract(self, sim_name, path):
+        """Writes the folder of an archived run inside path."""
+        run_path = '/'.join([path, sim_name])
+        for name in self.files(sim_name):
+            filename = '/'.join([run_path, name])
+            folder = os.path.dirname(filename)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            with open(filename, 'wb') as f_out:
+                f_out.write(self.read_bytes(sim_name, name))
+        return run_path
+
+    def close(self):
+        """Releases the memory maps of the archive files."""
+        for item in self.__maps.values():
+            item.close()
+        self.__maps = {}
+
+    def __append(self, number, run_path):
+        entries = {}
+        filename = self.__bin(number)
+        with open(filename, 'ab') as f_out:
+            # the bytes after the last indexed run, left by an interrupted
+            # pack, are not referenced and simply skipped
+            f_out.seek(0, os.SEEK_END)
+            for name in run_files(run_path):
+                source = '/'.join([run_path, name])
+                with open(source, 'rb') as f_in:
+                    content = f_in.read()
+                entry = {'offset': f_out.tell(), 'length': len(content),
+                         'header': None, 'data': None}
+                f_out.write(content)
+                table = None
+                if name.startswith('output/'):
+                    try:
+                        table = read_output(source)
+                    except ValueError:
+                        pass
+                if table is not None and table.data.size:
+                    f_out.write(b'\0' * (-f_out.tell() % ALIGNMENT))
+                    data = np.ascontiguousarray(table.data, dtype=float)
+                    entry['header'] = table.header
+                    entry['data'] = [f_out.tell(), list(data.shape)]
+                    f_out.write(data.tostring())
+                entries[name] = entry
+        if number in self.__maps:
+            # the archive file grew, the map is renewed when next needed
+            self.__maps.pop(number).close()
+        return entries
+
+    def __write_indexes(self, numbers):
+        """Syncs the archive files the runs were appended to, then replaces
+        their indexes and the index of the runs."""
+        if not numbers:
+            return
+        for number in sorted(numbers):
+            with open(self.__bin(number), 'ab') as f_out:
+                os.fsync(f_out.fileno())
+        for number in sorted(numbers):
+            write_json(self.__path(ARCHIVE_FORMAT.format(number) + '.json'),
+                       self.__index(number))
+        write_json(self.__path(RUNS_INDEX), self.__runs)
+
+    def __current(self):
+        """Returns the number of the archive file the next run goes into."""
+        number = max(self.__runs.values()) if self.__runs else 0
+        filename = self.__bin(number)
+        if (os.path.isfile(filename) and
+                os.path.getsize(filename) >= ARCHIVE_SIZE):
+            number += 1
+        return number
+
+    def __index(self, number):
+        if number not in self.__indexes:
+            self.__indexes[number] = read_json(
+                self.__path(ARCHIVE_FORMAT.format(number) + '.json'), {})
+        return self.__indexes[number]
+
+    def __entries(self, sim_name):
+        if sim_name not in self.__runs:
+            raise KeyError("The run {} is not in the archive.".format(
+                sim_name))
+        return self.__index(self.__runs[sim_name])[sim_name]
+
+    def __entry(self, sim_name, name):
+        entries = self.__entries(sim_name)
+        if name not in entries:
+            raise KeyError("{} is not a file of the run {}.".format(
+                name, sim_name))
+        return entries[name]
+
+    def __map(self, number):
+        if number not in self.__maps:
+            with open(self.__bin(number), 'rb') as f_in:
+                self.__maps[number] = mmap.mmap(f_in.fileno(), 0,
+                                                access=mmap.ACCESS_READ)
+        return self.__maps[number]
+
+    def __bin(self, number):
+        return self.__path(ARCHIVE_FORMAT.format(number) + '.bin')
+
+    def __path(self, name):
+        return '/'.join([self.archive_path, name])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Packs the folders of completed MASTER runs into an "
+                    "archive.")
+    commands = parser.add_subparsers(dest='command')
+    pack = commands.add_parser('pack', help="append run folders to the "
+                                            "archive and remove them")
+    pack.add_argument('archive')
+    pack.add_argument('run_paths', nargs='+')
+    pack.add_argument('--keep', action='store_true',
+                      help="do not remove the run folders")
+    listing = commands.add_parser('list', help="list the archived runs")
+    listing.add_argument('archive')
+    extract = commands.add_parser('extract', help="restore the folder of "
+                                                  "an archived run")
+    extract.add_argument('archive')
+    extract.add_argument('sim_name')
+    extract.add_argument('destination')
+    args = parser.parse_args(argv)
+    archive = RunArchive(args.archive)
+    if args.command == 'pack':
+        packed = archive.pack(args.run_paths, remove=not args.keep)
+        print '{} runs packed into {}'.format(len(packed), args.archive)
+    elif args.command == 'list':
+        for sim_name in archive.runs():
+            print sim_name
+    else:
+        print archive.extract(args.sim_name, args.destination)
+    archive.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import traceback
+
+from master_cache import ResultCache, data_version, executable_version
+from master_timing import PhaseRecorder, add_hook, remove_hook
+from master_validation import check_specs, format_problems
+from master_input import (MasterRun, MASTER_PATH, MASTER_EXECUTABLE,
+                          DATA_PATH_DEFAULT, DATA_CLOUD_PATH_DEFAULT,
+                          DEFAULT_SWITCHES, DEFAULT_SIZE_LIMITS,
+                          DIST_2D_DEFAULT, DIST_3D_DEFAULT)
+
+# default values of the optional entries of a run specification
+SPEC_DEFAULT = {'run_id': 'master',
+                'path': MASTER_PATH,
+                'data_path': DATA_PATH_DEFAULT,
+                'data_cloud_path': DATA_CLOUD_PATH_DEFAULT,
+                'scenario_id': 1,
+                'switches': DEFAULT_SWITCHES,
+                'size_limits': DEFAULT_SIZE_LIMITS,
+                'analysis_mode': 1,
+                'distribution_2D': DIST_2D_DEFAULT,
+                'distribution_3D': DIST_3D_DEFAULT,
+                'overwrite': False,
+                'cache_path': None,
+                'cache_max_entries': None,
+                'cache_max_size': None,
+                'data_version': None,
+                'master_path': MASTER_PATH,
+                'executable': MASTER_EXECUTABLE,
+                'stage_path': None,
+                'products': None}
+
+# entries that must be present in every run specification
+SPEC_REQUIRED = ('sim_name', 'orbit', 'begin_epoch', 'end_epoch')
+
+# fingerprints of the data folders, computed once per process
+_data_versions = {}
+
+
+def complete_spec(spec):
+    """Returns a copy of the run specification where the missing optional
+    entries are replaced by their default value (see SPEC_DEFAULT).
+
+    Inputs
+    ------
+    - spec (dict):
+        the run specification. The entries 'sim_name', 'orbit',
+        'begin_epoch' and 'end_epoch' are mandatory. The other entries have
+        the same name of the arguments of MasterRun and
+        MasterRun.set_master_input.
+    """
+    for key in SPEC_REQUIRED:
+        if key not in spec:
+            raise KeyError("The run specification has no '{}'.".format(key))
+    full_spec = dict(SPEC_DEFAULT)
+    full_spec.update(spec)
+    return full_spec
+
+
+def validate_batch(specs):
+    """Checks a whole batch of run specifications before any run is started
+    and raises ValueError listing every problem found (see
+    master_validation.check_specs)."""
+    problems = []
+    full_specs = []
+    for i, spec in enumerate(specs):
+        missing = [key for key in SPEC_REQUIRED if key not in spec]
+        if missing:
+            problems.append((i, spec.get('sim_name'), "missing {}".format(
+                ', '.join(missing))))
+            full_specs.append(None)
+        else:
+            full_specs.append(complete_spec(spec))
+    problems.extend(check_specs(full_specs))
+    if problems:
+        problems.sort(key=lambda item: item[0])
+        raise ValueError(format_problems(problems))
+
+
+def make_run(spec):
+    """Creates the MasterRun associated to a complete run specification."""
+    return MasterRun(sim_name=spec['sim_name'],
+                     run_id=spec['run_id'],
+                     path=spec['path'],
+                     data_path=spec['data_path'],
+                     data_cloud_path=spec['data_cloud_path'],
+                     switches=spec['switches'],
+                     size_limits=spec['size_limits'],
+                     distribution_2D=spec['distribution_2D'],
+                     distribution_3D=spec['distribution_3D'],
+                     master_path=spec['master_path'],
+                     executable=spec['executable'],
+                     stage_path=spec['stage_path'],
+                     products=spec['products'])
+
+
+def prepare_run(run, spec):
+    """Creates the run folder and writes all the input files of a run.
+
+    Returns
+    -------
+    - True:
+        if the inputs have been written.
+    - False:
+        if the run folder already exists and must not be overwritten.
+    """
+    if not run.check_simulation(overwrite=spec['overwrite']):
+        return False
+    run.set_master_config()
+    run.set_master_input(spec['orbit'], spec['begin_epoch'],
+                         spec['end_epoch'], scenario_id=spec['scenario_id'],
+                         switches=spec['switches'],
+                         size_limits=spec['size_limits'],
+                         analysis_mode=spec['analysis_mode'])
+    run.set_master_default()
+    return True
+
+
+def run_simulation(spec):
+    """Executes the whole pipeline of a single run: folder creation, input
+    files generation and call to MASTER.
+
+    The function never raises, so that one failing run does not stop the
+    others in a batch.
+
+    Returns
+    -------
+    - result (dict):
+        'sim_name' and 'run_id' of the run, the complete run 'spec', the
+        'output_path' and the
+        'status' of the run, which is one of 'done', 'skipped' (the folder
+        already existed) or 'failed'. For failed runs 'error' contains the
+        error message or the return code of the executable. 'cached' is True
+        when the outputs come from the result cache (see make_cache).
+        'timings' has the phases of the run (see master_timing.PhaseRecorder).
+    """
+    result = new_result(spec)
+    recorder = PhaseRecorder(spec.get('sim_name'))
+    add_hook(recorder)
+    try:
+        spec = complete_spec(spec)
+        result['spec'] = spec
+        run = make_run(spec)
+        result['output_path'] = run.output_path
+        if not prepare_run(run, spec):
+            result['status'] = 'skipped'
+            return result
+        cache = make_cache(spec)
+        return_code = run.call(cache=cache)
+        result['cached'] = cache is not None and cache.hits > 0
+        if return_code == 0:
+            result['status'] = 'done'
+        else:
+            result['error'] = 'MASTER exited with code {}'.format(return_code)
+    except Exception:
+        result['error'] = traceback.format_exc()
+    finally:
+        remove_hook(recorder)
+        result['timings'] = recorder.events
+    return result
+
+
+def new_result(spec):
+    """Returns the result of a run before its execution (see
+    run_simulation)."""
+    return {'sim_name': spec.get('sim_name'),
+            'run_id': spec.get('run_id'),
+            'output_path': None,
+            'status': 'failed',
+            'error': None,
+            'cached': False,
+            'spec': spec,
+            'timings': []}
+
+
+def cache_version(spec):
+    """Returns the version of the results of a complete run specification:
+    the 'data_version' of the spec, or the fingerprint of its 'data_path'
+    (see master_cache.data_version) if None, and the fingerprint of the
+    executable."""
+    version = spec['data_version']
+    if version is None:
+        if spec['data_path'] not in _data_versions:
+            _data_versions[spec['data_path']] = data_version(
+                spec['data_path'])
+        version = _data_versions[spec['data_path']]
+    return '{}|{}'.format(version, executable_version(spec['master_path'],
+                                                      spec['executable']))
+
+
+def make_cache(spec):
+    """Returns the result cache of a complete run specification, or None if
+    the run does not use the cache. 'cache_max_entries' and 'cache_max_size'
+    (bytes) limit the cache (see master_cache.ResultCache)."""
+    if spec['cache_path'] is None:
+        return None
+    return ResultCache(spec['cache_path'], cache_version(spec),
+                       max_entries=spec['cache_max_entries'],
+                       max_size=spec['cache_max_size'])
+
+
+def run_batch(specs, processes=None, validate=True):
+    """Runs a list of MASTER simulations on a pool of worker processes.
+
+    The results are returned as soon as each run finishes, therefore not in
+    the order of the specifications. On Windows the function must be called
+    from inside an `if __name__ == '__main__':` block.
+
+    Inputs
+    ------
+    - specs (list):
+        the run specifications (see complete_spec). Every run must have a
+        different 'sim_name'.
+    - processes (int):
+        maximum number of runs executed at the same time. Default value is
+        the number of cores.
+    - validate (bool):
+        if True the whole batch is checked before starting the first run
+        (see validate_batch).
+
+    Returns
+    -------
+    - generator of the results of run_simulation.
+    """
+    specs = list(specs)
+    if validate:
+        validate_batch(specs)
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(run_simulation, specs):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Benchmarks of the wrapper, run against the stand-in executable of
+master_stub.py, so that no MASTER installation is needed.
+
+Usage:
+    python master_benchmark.py [--runs 40] [--workers 1 2 4 8]
+                               [--mean 0.2] [--output bench_output.txt]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from master_batch import run_batch
+from master_input import (master_input_file, master_default_file,
+                          DIST_2D_DEFAULT, DIST_3D_DEFAULT)
+from master_timing import summarize
+
+REPO_PATH = os.path.dirname(os.path.abspath(__file__))
+STUB = '/'.join([REPO_PATH, 'master_stub.py'])
+ORBIT = [7178.0, 0.001, 60.0, 316.0, 0.0]
+BEGIN_EPOCH = '2016/04/01/00'
+END_EPOCH = '2016/06/07/00'
+
+
+def make_stub_installation(path):
+    """Creates a folder that looks like a MASTER installation: the default
+    folder with the templates of the input files (taken from default_inputs)
+    and empty data folders.
+
+    Returns
+    -------
+    - master_path (str)
+    """
+    master_path = '/'.join([path, 'master'])
+    os.makedirs('/'.join([master_path, 'data', 'clouds']))
+    shutil.copytree('/'.join([REPO_PATH, 'default_inputs']),
+                    '/'.join([master_path, 'default']))
+    return master_path
+
+
+def stub_command(distribution='fixed', mean=0.2, spread=0.1, cpu=False,
+                 seed=0):
+    """Returns the command that starts the stand-in executable."""
+    command = [sys.executable, STUB, '--distribution', distribution,
+               '--mean', str(mean), '--spread', str(spread),
+               '--seed', str(seed)]
+    if cpu:
+        command.append('--cpu')
+    return command
+
+
+def bench_input_generation(master_path, n_runs=200):
+    """Measures the rate of generation of master.inp and default.def.
+
+    Returns
+    -------
+    - rates (dict):
+        the number of files written per second by master_input_file and
+        master_default_file.
+    """
+    input_path = tempfile.mkdtemp()
+    template_path = '/'.join([master_path, 'default'])
+    try:
+        start = time.time()
+        for i in range(n_runs):
+            master_input_file('run{}'.format(i), ORBIT, BEGIN_EPOCH,
+                              END_EPOCH, input_path=input_path,
+                              template_path=template_path)
+        input_time = time.time() - start
+        start = time.time()
+        for i in range(n_runs):
+            master_default_file(DIST_2D_DEFAULT, DIST_3D_DEFAULT, input_path,
+                                template_path)
+        default_time = time.time() - start
+    finally:
+        shutil.rmtree(input_path)
+    return {'master_input_file': n_runs / input_time,
+            'master_default_file': n_runs / default_time}
+
+
+def bench_throughput(master_path, workers, n_runs=40, **stub):
+    """Runs n_runs stub simulations with the given number of workers.
+
+    Returns
+    -------
+    - stats (dict):
+        'wall_time' of the batch in seconds, 'throughput' in runs per
+        second, 'overhead' (mean time per run spent in the wrapper, in
+        seconds), 'execution' (mean time per run spent in the executable)
+        and the number of 'failed' runs.
+    """
+    path = tempfile.mkdtemp()
+    command = stub_command(**stub)
+    specs = [{'sim_name': 'run{:05d}'.format(i),
+              'run_id': 'run{:05d}'.format(i),
+              'path': path,
+              'orbit': [ORBIT[0] + i, ORBIT[1], ORBIT[2], ORBIT[3], ORBIT[4]],
+              'begin_epoch': BEGIN_EPOCH,
+              'end_epoch': END_EPOCH,
+              'master_path': master_path,
+              'data_path': '/'.join([master_path, 'data']),
+              'data_cloud_path': '/'.join([master_path, 'data', 'clouds']),
+              'executable': command} for i in range(n_runs)]
+    events = []
+    failed = 0
+    try:
+        start = time.time()
+        for result in run_batch(specs, workers):
+            events.extend(result['timings'])
+            failed += result['status'] != 'done'
+        wall_time = time.time() - start
+    finally:
+        shutil.rmtree(path)
+    totals = summarize(events)
+    execution = totals.pop('execution', 0.0)
+    return {'workers': workers,
+            'wall_time': wall_time,
+            'throughput': n_runs / wall_time,
+            'overhead': sum(totals.values()) / n_runs,
+            'execution': execution / n_runs,
+            'failed': failed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Wrapper benchmarks.')
+    parser.add_argument('--runs', type=int, default=40)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--distribution', default='fixed')
+    parser.add_argument('--mean', type=float, default=0.2)
+    parser.add_argument('--spread', type=float, default=0.1)
+    parser.add_argument('--cpu', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results as JSON')
+    args = parser.parse_args(argv)
+
+    path = tempfile.mkdtemp()
+    try:
+        master_path = make_stub_installation(path)
+        results = {'input_generation': bench_input_generation(master_path),
+                   'throughput': []}
+        for workers in args.workers:
+            results['throughput'].append(bench_throughput(
+                master_path, workers, args.runs,
+                distribution=args.distribution, mean=args.mean,
+                spread=args.spread, cpu=args.cpu, seed=args.seed))
+    finally:
+        shutil.rmtree(path)
+
+    rates = results['input_generation']
+    print 'input generation: %.0f master.inp/s, %.0f default.def/s' % (
+        rates['master_input_file'], rates['master_default_file'])
+    print '%8s %10s %10s %12s %12s %7s' % ('workers', 'wall [s]', 'runs/s',
+                                           'overhead [s]', 'exec [s]',
+                                           'failed')
+    for item in results['throughput']:
+        print '%8d %10.2f %10.2f %12.4f %12.4f %7d' % (
+            item['workers'], item['wall_time'], item['throughput'],
+            item['overhead'], item['execution'], item['failed'])
+    if args.output:
+        with open(args.output, 'w') as f_out:
+            json.dump(results, f_out, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import shutil
+import time
+
+from master_input import MasterInputTemplate
+
+# input files that fully define a MASTER run
+CACHE_INPUT_FILES = ['master.inp', 'default.def', 'default.sdf',
+                     'default.con']
+ENTRY_INFO = 'entry.json'
+
+
+def data_version(data_path):
+    """Returns a fingerprint of the MASTER population data. The fingerprint
+    is built from the name, size and modification time of every file in the
+    data folder, so it changes whenever the data is updated.
+
+    Inputs
+    ------
+    - data_path (str):
+        the path to the MASTER data folder.
+    """
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(data_path, followlinks=True):
+        dirs.sort()
+        for name in sorted(files):
+            stat = os.stat(os.path.join(root, name))
+            digest.update('{}|{}|{}\n'.format(
+                os.path.relpath(os.path.join(root, name), data_path),
+                stat.st_size, int(stat.st_mtime)))
+    return digest.hexdigest()
+
+
+def executable_version(master_path, executable):
+    """Returns a fingerprint of the MASTER executable, built from its name,
+    size and modification time. A command given as a list (see
+    master_input.MasterRun) is fingerprinted from its arguments."""
+    if isinstance(executable, (list, tuple)):
+        return hashlib.sha1(repr(list(executable))).hexdigest()
+    filename = '/'.join([master_path, executable])
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return hashlib.sha1(filename).hexdigest()
+    return hashlib.sha1('{}|{}|{}'.format(
+        executable, stat.st_size, int(stat.st_mtime))).hexdigest()
+
+
+def normalized_input(filename):
+    """Returns the content of an input file without comment lines and with
+    the values of each line separated by a single space. The run identifier
+    of master.inp is removed, since it does not change the results."""
+    if os.path.basename(filename) == 'master.inp':
+        content = MasterInputTemplate(filename).render(run_id=[['']])
+        lines = content.splitlines()
+    else:
+        with open(filename, 'r') as f_in:
+            lines = f_in.readlines()
+    return '\n'.join(' '.join(line.split()) for line in lines
+                     if not line.startswith('#'))
+
+
+def input_key(input_path, version=''):
+    """Returns the hash that identifies the results of a run, computed from
+    its input files and from the version of the MASTER data."""
+    digest = hashlib.sha1(version)
+    for name in CACHE_INPUT_FILES:
+        digest.update('\n{}\n'.format(name))
+        digest.update(normalized_input('/'.join([input_path, name])))
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """Content-addressed store of MASTER outputs.
+
+    Every entry is a folder named after the hash of the run inputs (see
+    input_key) containing a copy of the output files. The least recently used
+    entries are removed when the maximum number of entries or the maximum
+    size is exceeded. The cache folder can be shared by several processes.
+
+    Inputs
+    ------
+    - cache_path (str):
+        the folder where the results are stored.
+    - version (str):
+        the version of the MASTER data (see data_version). Results obtained
+        with a different version are never returned.
+    - max_entries (int):
+        maximum number of stored runs. None for no limit.
+    - max_size (int):
+        maximum size of the cache in bytes. None for no limit.
+    """
+    def __init__(self, cache_path, version='', max_entries=None,
+                 max_size=None):
+        self.__cache_path = cache_path
+        self.__version = version
+        self.__max_entries = max_entries
+        self.__max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(cache_path):
+            try:
+                os.makedirs(cache_path)
+            except OSError:
+                if not os.path.isdir(cache_path):
+                    raise
+
+    @property
+    def cache_path(self):
+        return self.__cache_path
+
+    def key(self, input_path):
+        return input_key(input_path, self.__version)
+
+    def load(self, input_path, output_path, run_id):
+        """Copies the stored outputs of a run with the same inputs in the
+        output folder. The files are renamed with the new run identifier.
+
+        Returns
+        -------
+        - True:
+            if the results were in the cache.
+        - False:
+            otherwise.
+        """
+        entry = '/'.join([self.__cache_path, self.key(input_path)])
+        try:
+            with open('/'.join([entry, ENTRY_INFO]), 'r') as f_in:
+                info = json.load(f_in)
+            for name in info['files']:
+                new_name = name
+                if name.startswith(info['run_id']):
+                    new_name = run_id + name[len(info['run_id']):]
+                shutil.copy('/'.join([entry, name]),
+                            '/'.join([output_path, new_name]))
+            os.utime(entry, None)
+        except (IOError, OSError, ValueError, KeyError):
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, input_path, output_path, run_id):
+        """Stores the outputs of a completed run."""
+        key = self.key(input_path)
+        entry = '/'.join([self.__cache_path, key])
+        if os.path.isdir(entry):
+            return key
+        tmp_entry = '{}.tmp{}'.format(entry, os.getpid())
+        if os.path.isdir(tmp_entry):
+            shutil.rmtree(tmp_entry)
+        os.makedirs(tmp_entry)
+        files = sorted(name for name in os.listdir(output_path)
+                       if os.path.isfile('/'.join([output_path, name])))
+        size = 0
+        for name in files:
+            shutil.copy('/'.join([output_path, name]),
+                        '/'.join([tmp_entry, name]))
+            size += os.path.getsize('/'.join([tmp_entry, name]))
+        with open('/'.join([tmp_entry, ENTRY_INFO]), 'w') as f_out:
+            json.dump({'run_id': run_id, 'files': files, 'size': size,
+                       'version': self.__version, 'created': time.time()},
+                      f_out)
+        try:
+            os.rename(tmp_entry, entry)
+        except OSError:
+            # stored in the meantime by another process
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+        self.evict()
+        return key
+
+    def entries(self):
+        """Returns the list of (key, last use time, size) of the entries,
+        from the least to the most recently used."""
+        entries = []
+        for key in os.listdir(self.__cache_path):
+            entry = '/'.join([self.__cache_path, key])
+            try:
+                with open('/'.join([entry, ENTRY_INFO]), 'r') as f_in:
+                    size = json.load(f_in)['size']
+                entries.append((key, os.path.getmtime(entry), size))
+            except (IOError, OSError, ValueError, KeyError):
+                continue
+        entries.sort(key=lambda item: item[1])
+        return entries
+
+    def evict(self):
+        """Removes the least recently used entries until the limits on the
+        number of entries and on the size are satisfied."""
+        entries = self.entries()
+        total_size = sum(item[2] for item in entries)
+        while entries and (
+                (self.__max_entries is not None and
+                 len(entries) > self.__max_entries) or
+                (self.__max_size is not None and
+                 total_size > self.__max_size)):
+            key, _, size = entries.pop(0)
+            shutil.rmtree('/'.join([self.__cache_path, key]),
+                          ignore_errors=True)
+            total_size -= size
+
+    def invalidate(self):
+        """Removes all the entries, e.g. when the population data changes."""
+        for key in os.listdir(self.__cache_path):
+            shutil.rmtree('/'.join([self.__cache_path, key]),
+                          ignore_errors=True)
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+
+from master_batch import run_batch
+from master_input import remove_run_folder
+from master_output import OutputTable, read_run
+from utils import print_warning
+
+# default percentiles of the ensemble statistics
+PERCENTILES_DEFAULT = (5, 50, 95)
+
+
+def perturbed_orbits(orbit, covariance, n_members, seed=None):
+    """Samples orbits from a normal distribution around an orbit.
+
+    Inputs
+    ------
+    - orbit (list):
+        the nominal orbit (sma, ecc, inc, raan, aop), in km and degrees.
+    - covariance (array):
+        the 5x5 covariance matrix of the orbital elements. A list of 5
+        values is taken as the diagonal (variances).
+    - n_members (int):
+        the number of orbits.
+    - seed (int):
+        seed of the random generator, for reproducible ensembles.
+
+    Returns
+    -------
+    - orbits (numpy.ndarray):
+        array with shape (n_members, 5). The eccentricity is kept in [0, 1),
+        the inclination in [0, 180] degrees and RAAN and AoP in [0, 360)
+        degrees.
+    """
+    covariance = np.asarray(covariance, dtype=float)
+    if covariance.ndim == 1:
+        covariance = np.diag(covariance)
+    random = np.random.RandomState(seed)
+    orbits = random.multivariate_normal(np.asarray(orbit, dtype=float),
+                                        covariance, n_members)
+    orbits[:, 1] = np.clip(np.abs(orbits[:, 1]), 0.0, 1.0 - 1e-9)
+    # an inclination beyond the poles is the same orbital plane
+    orbits[:, 2] = np.abs(orbits[:, 2])
+    orbits[:, 2] = np.where(orbits[:, 2] > 180.0, 360.0 - orbits[:, 2],
+                            orbits[:, 2])
+    orbits[:, 3:5] = np.mod(orbits[:, 3:5], 360.0)
+    return orbits
+
+
+def ensemble_specs(spec, covariance, n_members, seed=None):
+    """Returns the run specifications of the members of an ensemble around
+    the orbit of spec. Every member runs in its own folder ('sim_name'
+    followed by the member index) but keeps the run identifier, so that the
+    output files of all members have the same names."""
+    specs = []
+    for i, orbit in enumerate(perturbed_orbits(spec['orbit'], covariance,
+                                               n_members, seed)):
+        member_spec = dict(spec)
+        member_spec.update({'sim_name': '{}_m{:04d}'.format(
+                                spec['sim_name'], i),
+                            'orbit': [float(item) for item in orbit]})
+        specs.append(member_spec)
+    return specs
+
+
+class StreamingQuantile(object):
+    """Estimate of a quantile of every element of a stream of arrays, with
+    the P-square algorithm (Jain and Chlamtac, 1985). Only five markers per
+    element are kept, whatever the number of arrays.
+
+    Inputs
+    ------
+    - p (float):
+        the quantile, between 0 and 1.
+    """
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self.__first = []
+        # desired positions of the markers and their increments
+        self.__desired = np.array([1.0, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5.0])
+        self.__increment = np.array([0.0, p / 2, p, (1 + p) / 2, 1.0])
+
+    def add(self, x):
+        x = np.array(x, dtype=float)
+        self.count += 1
+        if self.count <= 5:
+            self.__first.append(x)
+            if self.count == 5:
+                self.__q = np.sort(np.array(self.__first), axis=0)
+                self.__n = np.ones(self.__q.shape) * np.arange(1.0, 6.0)[
+                    (slice(None),) + (None,) * x.ndim]
+                self.__first = []
+            return
+        q = self.__q
+        n = self.__n
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        # cell of x between the markers
+        k = (x[None] >= q[1:4]).sum(axis=0)
+        index = np.arange(5)[(slice(None),) + (None,) * x.ndim]
+        n += index > k
+        self.__desired += self.__increment
+        desired = self.__desired[(slice(None),) + (None,) * x.ndim]
+        for i in range(1, 4):
+            d = desired[i] - n[i]
+            move = (((d >= 1) & (n[i + 1] - n[i] > 1)) |
+                    ((d <= -1) & (n[i - 1] - n[i] < -1)))
+            if not move.any():
+                continue
+            d = np.sign(d)
+            parabolic = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) /
+                (n[i + 1] - n[i]) +
+                (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+            neighbour_q = np.where(d > 0, q[i + 1], q[i - 1])
+            neighbour_n = np.where(d > 0, n[i + 1], n[i - 1])
+            linear = q[i] + d * (neighbour_q - q[i]) / (neighbour_n - n[i])
+            inside = (q[i - 1] < parabolic) & (parabolic < q[i + 1])
+            q[i] = np.where(move, np.where(inside, parabolic, linear), q[i])
+            n[i] = np.where(move, n[i] + d, n[i])
+
+    def value(self):
+        """Returns the current estimate of the quantile."""
+        if self.count == 0:
+            raise ValueError("No values have been added.")
+        if self.count < 5:
+            return np.percentile(np.array(self.__first), 100 * self.p,
+                                 axis=0)
+        if self.count == 5:
+            # the markers are still the sorted values
+            return np.percentile(self.__q, 100 * self.p, axis=0)
+        return np.array(self.__q[2])
+
+
+class TableStatistics(object):
+    """Online mean, variance and percentiles of the same output table of the
+    members of an ensemble. The values are added one table at a time and
+    never stored.
+
+    Inputs
+    ------
+    - percentiles (list):
+        the percentiles estimated, between 0 and 100.
+    """
+    def __init__(self, percentiles=PERCENTILES_DEFAULT):
+        self.count = 0
+        self.__quantiles = dict((p, StreamingQuantile(p / 100.0))
+                                for p in percentiles)
+        self.__first = None
+
+    def add(self, table):
+        if self.__first is None:
+            self.__first = table
+            self.__n_axes = max(1, len(table.distributions))
+            self.__mean = np.zeros(table.data[:, self.__n_axes:].shape)
+            self.__m2 = np.zeros(self.__mean.shape)
+        elif table.data.shape != self.__first.data.shape:
+            raise ValueError("Table {} has shape {} instead of {}.".format(
+                table.filename, table.data.shape, self.__first.data.shape))
+        values = np.asarray(table.data[:, self.__n_axes:], dtype=float)
+        # Welford's update
+        self.count += 1
+        delta = values - self.__mean
+        self.__mean += delta / self.count
+        self.__m2 += delta * (values - self.__mean)
+        for quantile in self.__quantiles.values():
+            quantile.add(values)
+
+    def mean(self):
+        return self.__table(self.__mean)
+
+    def variance(self):
+        """Returns the sample variance (zero with a single member)."""
+        return self.__table(self.__m2 / max(1, self.count - 1))
+
+    def std(self):
+        return self.__table(np.sqrt(self.__m2 / max(1, self.count - 1)))
+
+    def percentile(self, p):
+        return self.__table(self.__quantiles[p].value())
+
+    def __table(self, values):
+        if self.__first is None:
+            raise ValueError("No tables have been added.")
+        first = self.__first
+        return OutputTable(first.filename, first.header, np.column_stack(
+            [first.data[:, :self.__n_axes], values]))
+
+
+class EnsembleStatistics(object):
+    """Online statistics of all the output tables of an ensemble, by file
+    name (see TableStatistics)."""
+    def __init__(self, percentiles=PERCENTILES_DEFAULT):
+        self.percentiles = percentiles
+        self.count = 0
+        self.tables = {}
+
+    def add(self, tables):
+        """Adds the tables of a member (see master_output.read_run)."""
+        for name, table in tables.items():
+            if name not in self.tables:
+                self.tables[name] = TableStatistics(self.percentiles)
+            self.tables[name].add(table)
+        self.count += 1
+
+    def mean(self):
+        return dict((name, item.mean()) for name, item in self.tables.items())
+
+    def std(self):
+        return dict((name, item.std()) for name, item in self.tables.items())
+
+    def percentile(self, p):
+        return dict((name, item.percentile(p))
+                    for name, item in self.tables.items())
+
+
+def run_ensemble(spec, covariance, n_members, percentiles=PERCENTILES_DEFAULT,
+                 processes=None, seed=None, keep_outputs=False):
+    """Runs an ensemble of simulations with perturbed orbits and reduces the
+    outputs as the members finish.
+
+    Inputs
+    ------
+    - spec (dict):
+        the run specification of the nominal run (see
+        master_batch.complete_spec).
+    - covariance (array):
+        the covariance of the orbital elements (see perturbed_orbits).
+    - n_members (int):
+        the number of members.
+    - percentiles (list):
+        the percentiles to estimate, between 0 and 100.
+    - processes (int):
+        maximum number of members run at the same time.
+    - seed (int):
+        seed of the perturbations.
+    - keep_outputs (bool):
+        if False the folder of each member is removed once its outputs have
+        been added to the statistics.
+
+    Returns
+    -------
+    - statistics (EnsembleStatistics)
+    - results (list):
+        the results of the members (see master_batch.run_simulation).
+    """
+    statistics = EnsembleStatistics(percentiles)
+    results = []
+    for result in run_batch(ensemble_specs(spec, covariance, n_members, seed),
+                            processes):
+        results.append(result)
+        if result['status'] != 'done':
+            continue
+        statistics.add(read_run(result['output_path'],
+                                result['spec']['run_id']))
+        if not keep_outputs:
+            try:
+                remove_run_folder(os.path.dirname(result['output_path']))
+            except OSError as error:
+                print_warning(str(error))
+    return statistics, results
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+import numpy as np
+
+from master_batch import run_batch
+from master_output import OutputTable, read_run
+
+EPOCH_FORMAT = '%Y/%m/%d/%H'
+# words of the header of the output files whose values add up over time,
+# such as numbers of impacts; the other files hold rates (fluxes, spatial
+# densities), which are averaged over time
+ADDITIVE_KEYWORDS = ['fluence', 'number of impacts', 'impact count',
+                     'impacts [-]']
+
+
+def parse_epoch(epoch):
+    """Converts an epoch in the form YEAR/MONTH/DAY/HOUR into a datetime."""
+    return datetime.datetime.strptime(epoch, EPOCH_FORMAT)
+
+
+def decimal_year(epoch):
+    """Converts an epoch in the form YEAR/MONTH/DAY/HOUR, or a datetime, into
+    a decimal year."""
+    if isinstance(epoch, datetime.datetime):
+        date = epoch
+    else:
+        date = parse_epoch(epoch)
+    start = datetime.datetime(date.year, 1, 1)
+    length = datetime.datetime(date.year + 1, 1, 1) - start
+    return date.year + ((date - start).total_seconds() /
+                        length.total_seconds())
+
+
+def format_epoch(date):
+    """Converts a datetime into an epoch in the form YEAR/MONTH/DAY/HOUR."""
+    return date.strftime(EPOCH_FORMAT)
+
+
+def split_epochs(begin_epoch, end_epoch, n_chunks):
+    """Splits an analysis interval into contiguous sub-intervals of about the
+    same duration. The bounds are rounded to the hour, as required by MASTER.
+
+    Inputs
+    ------
+    - begin_epoch, end_epoch (str):
+        the bounds of the interval in the form YEAR/MONTH/DAY/HOUR.
+    - n_chunks (int):
+        the number of sub-intervals. It is reduced if the interval has less
+        hours than n_chunks.
+
+    Returns
+    -------
+    - epochs (list):
+        the (begin_epoch, end_epoch, duration in hours) of each sub-interval.
+    """
+    begin = parse_epoch(begin_epoch)
+    end = parse_epoch(end_epoch)
+    hours = int((end - begin).total_seconds() // 3600)
+    if hours <= 0:
+        raise ValueError("The end epoch {} is not after the begin epoch "
+                         "{}.".format(end_epoch, begin_epoch))
+    n_chunks = max(1, min(n_chunks, hours))
+    bounds = np.linspace(0, hours, n_chunks + 1).round().astype(int)
+    epochs = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        epochs.append((format_epoch(begin + datetime.timedelta(hours=start)),
+                       format_epoch(begin + datetime.timedelta(hours=stop)),
+                       int(stop - start)))
+    return epochs
+
+
+def chunk_specs(spec, n_chunks):
+    """Splits a run specification into runs over contiguous sub-intervals of
+    its analysis interval. Every chunk runs in its own folder ('sim_name'
+    followed by the chunk index) but keeps the run identifier, so that the
+    output files of all chunks have the same names.
+
+    Returns
+    -------
+    - specs (list):
+        the run specifications, with the 'duration' of each chunk in hours.
+    """
+    specs = []
+    for i, (begin_epoch, end_epoch, duration) in enumerate(
+            split_epochs(spec['begin_epoch'], spec['end_epoch'], n_chunks)):
+        chunk_spec = dict(spec)
+        chunk_spec.update({'sim_name': '{}_t{:02d}'.format(spec['sim_name'],
+                                                            i),
+                           'begin_epoch': begin_epoch,
+                           'end_epoch': end_epoch,
+                           'duration': duration})
+        specs.append(chunk_spec)
+    return specs
+
+
+def merge_method(table):
+    """Returns how the same output table of several chunks is merged: 'sum'
+    for the tables of quantities that add up over time (see
+    ADDITIVE_KEYWORDS), 'mean' for the others.
+
+    The cumulative and reverse cumulative spectra of MASTER (see
+    OutputTable.kind) are cumulative in object size, not in time: they are
+    fluxes and are averaged like the differential spectra.
+    """
+    text = ' '.join(table.header).lower()
+    if any(keyword in text for keyword in ADDITIVE_KEYWORDS):
+        return 'sum'
+    return 'mean'
+
+
+def merge_tables(tables, weights, how='mean', n_axes=None):
+    """Merges the same output table of several chunks.
+
+    Inputs
+    ------
+    - tables (list):
+        the OutputTable of each chunk. The tables must have the same shape
+        and the same values of the independent variables.
+    - weights (list):
+        the duration of each chunk.
+    - how (str):
+        'mean' to average the values weighted by the duration of the chunks
+        (fluxes and densities), 'sum' to add them (cumulative quantities such
+        as the number of impacts).
+    - n_axes (int):
+        the number of columns with independent variables. Default value is
+        the number of distributions of the table (2 for 3D distributions).
+
+    Returns
+    -------
+    - table (OutputTable)
+    """
+    first = tables[0]
+    if n_axes is None:
+        n_axes = max(1, len(first.distributions))
+    values = np.array([table.data[:, n_axes:] for table in tables])
+    for table in tables[1:]:
+        if (table.data.shape != first.data.shape or
+                not np.allclose(table.data[:, :n_axes],
+                                first.data[:, :n_axes])):
+            raise ValueError("The tables {} and {} cannot be merged.".format(
+                first.filename, table.filename))
+    if how == 'mean':
+        weights = np.asarray(weights, dtype=float)
+        merged = np.tensordot(weights / weights.sum(), values, axes=1)
+    elif how == 'sum':
+        merged = values.sum(axis=0)
+    else:
+        raise ValueError("Unknown merge method '{}'.".format(how))
+    data = np.column_stack([first.data[:, :n_axes], merged])
+    return OutputTable(first.filename, first.header, data)
+
+
+def merge_runs(results, how=None):
+    """Merges the outputs of the chunks of a run (see chunk_specs).
+
+    Inputs
+    ------
+    - results (list):
+        the results of the chunks (see master_batch.run_simulation).
+    - how (str or dict):
+        merge method of the tables (see merge_tables). A dict gives the
+        method of some file names. The method of the other files is chosen
+        from their content (see merge_method).
+
+    Returns
+    -------
+    - tables (dict):
+        the merged OutputTable of each output file, by file name.
+    """
+    failed = [result['sim_name'] for result in results
+              if result['status'] != 'done']
+    if failed:
+        raise ValueError("The chunks {} did not complete.".format(
+            ', '.join(failed)))
+    chunks = [read_run(result['output_path'], result['spec']['run_id'])
+              for result in results]
+    weights = [result['spec']['duration'] for result in results]
+    tables = {}
+    for name in chunks[0]:
+        if how is None or isinstance(how, dict):
+            method = (how or {}).get(name) or merge_method(chunks[0][name])
+        else:
+            method = how
+        tables[name] = merge_tables([chunk[name] for chunk in chunks],
+                                    weights, method)
+    return tables
+
+
+def run_chunked(spec, n_chunks, processes=None, how=None):
+    """Runs a simulation split into n_chunks sub-intervals in parallel and
+    merges the outputs (see merge_runs).
+
+    Returns
+    -------
+    - tables (dict):
+        the merged OutputTable of each output file, by file name.
+    - results (list):
+        the results of the chunks.
+    """
+    results = list(run_batch(chunk_specs(spec, n_chunks), processes))
+    results.sort(key=lambda result: result['sim_name'])
+    return merge_runs(results, how), results
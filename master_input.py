@@ -1,10 +1,10 @@
-<<<<<<< HEAD
 # -*- coding: utf-8 -*-
-import shutil
-import subprocess
 import os
+import shutil
 
-from utils import create_folder
+from master_staging import InputStage, write_input
+from master_timing import phase
+from utils import create_folder, link_folder, start_process, unlink_folder
 
 DEFAULT_PATH = 'C:/Users/mt19g14/MASTER Simulation Database'
 MASTER_PATH = r'C:\Program Files (x86)\MASTER-2009'
@@ -12,6 +12,19 @@ OUTPUT_PATH_DEFAULT = '/'.join([MASTER_PATH, 'output'])
 INPUT_PATH_DEFAULT = '/'.join([MASTER_PATH, 'input'])
 DATA_PATH_DEFAULT = '/'.join([MASTER_PATH, 'data'])
 DATA_CLOUD_PATH_DEFAULT = '/'.join([MASTER_PATH, 'data', 'clouds'])
+TEMPLATE_PATH_DEFAULT = '/'.join([MASTER_PATH, 'default'])
+MASTER_EXECUTABLE = 'master_windows.exe'
+# template of master.cfg, shipped with the wrapper
+CONFIG_TEMPLATE = '/'.join([os.path.dirname(os.path.abspath(__file__)),
+                            'default_inputs', 'master.cfg'])
+
+# names of the links to the shared data folders inside each run folder
+SANDBOX_DATA = 'data'
+SANDBOX_CLOUDS = 'clouds'
+# maximum length of the paths in master.cfg, see the '-(120 char)-' marker
+CONFIG_PATH_LENGTH = 120
+# maximum length of the run identifier, see the '-(27 char)-' marker
+RUN_ID_LENGTH = 27
 
 DEFAULT_SWITCHES = ['1', '1', '1', '1', '1', '1', '1', '1', '0', '0', '0']
 DEFAULT_SIZE_LIMITS = ['1e-04', '0.1', 'm']
@@ -25,6 +38,10 @@ DIST_3D_DEFAULT = [['1', '1', '11', '10'],
                    ['2', '1', '10', '9'],
                    ['3', '1', '10', '2']]
 
+# kinds of spectra of the 2D distributions, see the "Basic Output Settings"
+# of master.inp. '3d' identifies the 3D distributions in output products.
+SPECTRUM_TYPES = ['differential', 'cumulative', 'reverse_cumulative']
+
 def simulation_setup(case):
     """Select among a set of predefined simulation characteristics for MASTER.
     The predefined parameters to specify in MASTER are the sources of debris,
@@ -59,7 +76,7 @@ def simulation_setup(case):
                            [3, 1, 10, 2]] 
         return debris_sources, size_limits, distribution_2d, distribution_3d
     else:
-        return ValueError("Case number {} does not exist.".format(case))    
+        raise ValueError("Case number {} does not exist.".format(case))
 
 class MasterRun(object):
 #FIXME: do not use so many default values like this. Specify the path of MASTER, is important if someone else wants to use the code.
@@ -70,77 +87,364 @@ class MasterRun(object):
                  switches=DEFAULT_SWITCHES,
                  size_limits=DEFAULT_SIZE_LIMITS,
                  distribution_2D=DIST_2D_DEFAULT,
-                 distribution_3D=DIST_3D_DEFAULT):
-
+                 distribution_3D=DIST_3D_DEFAULT,
+                 master_path=MASTER_PATH,
+                 executable=MASTER_EXECUTABLE,
+                 stage_path=None,
+                 products=None):
+        """master_path is the MASTER installation folder, whose 'default'
+        folder has the templates of the input files. executable is the name
+        of the executable in master_path, or the complete command (list) of
+        an executable standing in for MASTER. If stage_path is given, the
+        default input files are kept once in that folder and linked into the
+        run (see master_staging.InputStage). If products is given, MASTER
+        only generates those output products (see select_products)."""
         self.__sim_name = sim_name
         self.__run_id = run_id
         self.__path = path
-        self.__input_path = '/'.join([self.__path, self.__sim_name, 'input'])
-        self.__output_path = '/'.join([self.__path, self.__sim_name, 'output'])
+        # every run works inside its own sandbox folder, so that several
+        # instances of MASTER can be executed at the same time.
+        self.__run_path = '/'.join([self.__path, self.__sim_name])
+        self.__input_path = '/'.join([self.__run_path, 'input'])
+        self.__output_path = '/'.join([self.__run_path, 'output'])
         self.__data_path = data_path
         self.__data_cloud_path = data_cloud_path
         self.__switches = switches
         self.__size_limits = size_limits
         self.__dist_2D = distribution_2D
         self.__dist_3D = distribution_3D
-        if any(isinstance(x, float) for x in lst):
-            
-        
+        self.__template_path = '/'.join([master_path, 'default'])
+        self.__spectra = None
+        if products is not None:
+            self.__spectra, self.__dist_2D, self.__dist_3D = select_products(
+                products, distribution_2D, distribution_3D,
+                self.__template_path)
+        if isinstance(executable, (list, tuple)):
+            self.__command = list(executable)
+        else:
+            self.__command = ['/'.join([master_path, executable])]
+        self.__stage = None
+        if stage_path is not None:
+            self.__stage = InputStage(stage_path)
+        check_run_id(run_id)
+        check_switches(switches)
+
+    @property
+    def run_path(self):
+        return self.__run_path
+
+    @property
+    def input_path(self):
+        return self.__input_path
+
+    @property
+    def output_path(self):
+        return self.__output_path
+
     def set_master_config(self):
-        master_config_file(self.__input_path, self.__output_path,
-                           self.__data_path, self.__data_cloud_path)  
+        """Writes the private master.cfg of the run inside the sandbox folder.
+        The paths are relative to the sandbox, which is the working directory
+        of the executable. If the shared data folders could not be linked into
+        the sandbox, their original location is used instead.
+        """
+        if os.path.isdir('/'.join([self.__run_path, SANDBOX_DATA])):
+            data_path = SANDBOX_DATA
+        else:
+            data_path = self.__data_path
+        if os.path.isdir('/'.join([self.__run_path, SANDBOX_CLOUDS])):
+            data_cloud_path = SANDBOX_CLOUDS
+        else:
+            data_cloud_path = self.__data_cloud_path
+        with phase('config', self.__sim_name):
+            master_config_file('input', 'output', data_path,
+                               data_cloud_path, config_path=self.__run_path)
         return 0
 
     def set_master_input(self, orbit, begin_epoch, end_epoch,
                          scenario_id=1, switches=DEFAULT_SWITCHES,
                          size_limits=DEFAULT_SIZE_LIMITS, analysis_mode=1):
-
-        master_input_file(self.__run_id, orbit, begin_epoch, end_epoch,
-                          scenario_id, switches, size_limits,
-                          analysis_mode, self.__input_path)
+        check_switches(switches)
+        with phase('input', self.__sim_name):
+            master_input_file(self.__run_id, orbit, begin_epoch, end_epoch,
+                              scenario_id, switches, size_limits,
+                              analysis_mode, self.__input_path,
+                              self.__template_path, self.__spectra)
         return 0
 
     def set_master_default(self):
-        master_default_file(self.__dist_2D, self.__dist_3D, self.__input_path)
-        master_default_constellation(self.__input_path)
-        master_default_sdf(self.__input_path)
-
-    def check_simulation(self):
-        cf = create_folder(self.__sim_name, self.__path,
-                           sub_folders=[self.__input_path,
-                                        self.__output_path])
+        with phase('default_def', self.__sim_name):
+            master_default_file(self.__dist_2D, self.__dist_3D,
+                                self.__input_path, self.__template_path,
+                                self.__stage)
+        with phase('copy_con', self.__sim_name):
+            master_default_constellation(self.__input_path,
+                                         self.__template_path, self.__stage)
+        with phase('copy_sdf', self.__sim_name):
+            master_default_sdf(self.__input_path, self.__template_path,
+                               self.__stage)
+
+    def check_simulation(self, overwrite=None):
+        with phase('create_folder', self.__sim_name):
+            cf = create_folder(self.__sim_name, self.__path,
+                               sub_folders=['input', 'output'],
+                               overwrite=overwrite)
+            if cf:
+                # read-only access to the shared population data
+                link_folder(self.__data_path,
+                            '/'.join([self.__run_path, SANDBOX_DATA]))
+                link_folder(self.__data_cloud_path,
+                            '/'.join([self.__run_path, SANDBOX_CLOUDS]))
         print cf
         return cf
 
-    def call(self):
-        p = subprocess.Popen(['master_windows.exe'],
-                             cwd=MASTER_PATH,
-                             shell=True)
-        p.wait()
-        return 0
+    def start(self):
+        """Starts MASTER without waiting for it to finish. The executable runs
+        in its own process group, so that it can be stopped together with its
+        children (see utils.kill_process_tree).
+
+        Returns
+        -------
+        - process (subprocess.Popen)
+        """
+        with phase('startup', self.__sim_name):
+            return start_process(self.__command, cwd=self.__run_path)
+
+    def call(self, cache=None):
+        """Runs MASTER. If a cache is given (see master_cache.ResultCache),
+        the stored outputs of a run with the same inputs are used instead of
+        running the executable, and new results are added to the cache."""
+        if cache is not None:
+            with phase('cache', self.__sim_name):
+                hit = cache.load(self.__input_path, self.__output_path,
+                                 self.__run_id)
+            if hit:
+                return 0
+        process = self.start()
+        with phase('execution', self.__sim_name):
+            return_code = process.wait()
+        if cache is not None and return_code == 0:
+            with phase('cache', self.__sim_name):
+                cache.store(self.__input_path, self.__output_path,
+                            self.__run_id)
+        return return_code
+
+
+def remove_run_folder(run_path):
+    """Removes the folder of a run. The links to the shared population data
+    (SANDBOX_DATA and SANDBOX_CLOUDS) are removed first, so that the data is
+    never deleted through them.
+
+    Inputs
+    ------
+    - run_path (str):
+        the folder of the run (MasterRun.run_path).
+    """
+    for name in (SANDBOX_DATA, SANDBOX_CLOUDS):
+        link_name = '/'.join([run_path, name])
+        if not unlink_folder(link_name):
+            raise OSError("{} is not a link to the population data, the run "
+                          "folder {} is not removed.".format(link_name,
+                                                             run_path))
+    shutil.rmtree(run_path)
+
+
+def check_run_id(run_id):
+    """Raises ValueError if the run identifier cannot be written in
+    master.inp."""
+    if not isinstance(run_id, basestring) or not run_id:
+        raise ValueError("The run identifier must be a non-empty string.")
+    if len(run_id) > RUN_ID_LENGTH:
+        raise ValueError("Run identifier '{}' is longer than {} "
+                         "characters.".format(run_id, RUN_ID_LENGTH))
+    if len(run_id.split()) != 1:
+        raise ValueError("Run identifier '{}' contains spaces.".format(
+            run_id))
+
+
+def check_switches(switches):
+    """Raises ValueError if the source switches are not eleven 0 or 1,
+    given as integers or strings. Floats are refused since they would be
+    written as '1.0' in master.inp."""
+    if len(switches) != len(DEFAULT_SWITCHES):
+        raise ValueError("{} source switches given instead of {}.".format(
+            len(switches), len(DEFAULT_SWITCHES)))
+    for i, item in enumerate(switches):
+        if isinstance(item, bool) or str(item) not in ('0', '1'):
+            raise ValueError("Source switch {} is {!r} instead of 0 or "
+                             "1.".format(i, item))
+
+
+def check_epoch(epoch):
+    """Raises ValueError if the epoch is not in the form
+    YEAR/MONTH/DAY/HOUR."""
+    fields = str(epoch).split('/')
+    if len(fields) != 4 or not all(item.isdigit() for item in fields):
+        raise ValueError("Epoch '{}' is not in the form "
+                         "YEAR/MONTH/DAY/HOUR.".format(epoch))
 
 
 def master_config_file(input_path=INPUT_PATH_DEFAULT,
                        output_path=OUTPUT_PATH_DEFAULT,
                        data_path=DATA_PATH_DEFAULT,
-                       data_cloud_path=DATA_CLOUD_PATH_DEFAULT):
+                       data_cloud_path=DATA_CLOUD_PATH_DEFAULT,
+                       config_path=MASTER_PATH):
+    """
+    Writes the master.cfg file with the paths used by MASTER-2009.
 
-    with open('/'.join([r'C:\Users\Mirko\Documents\Python Scripts\dev_environment\master_wrapper\default_inputs', 'master.cfg']), 'r') as f_in:
-        data = f_in.readlines()
+    Parameters
+    ----------
+    input_path, output_path, data_path, data_cloud_path [str]:
+        Paths written in the configuration file. Relative paths are resolved
+        by MASTER from its working directory. Each path cannot be longer than
+        120 characters.
+    config_path [str]:
+        Folder where master.cfg is saved. This must be the working directory
+        of the executable (the run folder when running in a sandbox).
+    """
     config_inputs = [output_path, data_path, data_cloud_path, input_path]
+    for item in config_inputs:
+        if len(item) > CONFIG_PATH_LENGTH:
+            raise ValueError("Path {} is longer than {} characters.".format(
+                item, CONFIG_PATH_LENGTH))
+    with open(CONFIG_TEMPLATE, 'r') as f_in:
+        data = f_in.readlines()
     for i in range(4):
         set_data = data[23 + i].split()
         set_data[0] = config_inputs[i]
         data[23 + i] = '  ' + ' '.join(set_data) + '\n'
-    with open('/'.join([MASTER_PATH, 'master.cfg']), 'w') as f_out:
+    with open('/'.join([config_path, 'master.cfg']), 'w') as f_out:
         f_out.writelines(data)
     return 0
 
 
+# Fields of master.inp that can be modified. Each field is identified by the
+# comment line preceding it and has a fixed number of lines (None when the
+# number of lines is variable and ends at the next comment line).
+INPUT_FIELDS = [('run_id', '# Run identifier', 1),
+                ('epoch', '# Begin and end of analysis time interval', 2),
+                ('scenario_id', '# Future scenario switch', 1),
+                ('switches', '# Source switches', 11),
+                ('size_limits', '# Analysis size/mass thresholds', 2),
+                ('analysis_mode', '# Analysis mode', 1),
+                ('target_orbits', '# Target orbit(s)', None),
+                ('differential', '# Differential spectra', 1),
+                ('cumulative', '# Cumulative spectra', 1),
+                ('reverse_cumulative', '# Reverse cumulative spectra', 1)]
+
+_input_templates = {}
+
+
+class MasterInputTemplate(object):
+    """In-memory model of the master.inp template.
+
+    The template is parsed once into static text and named fields (see
+    INPUT_FIELDS). A new input file is then obtained by replacing the leading
+    values of the field lines, while the rest of each line (the descriptions)
+    is kept. The parsing fails if a field cannot be found, so that a template
+    with a different layout is never silently corrupted.
+    """
+    def __init__(self, filename, fields=INPUT_FIELDS):
+        with open(filename, 'r') as f_in:
+            lines = f_in.readlines()
+        headers = dict((header, (name, n_lines))
+                       for name, header, n_lines in fields)
+        # the template is stored as a list of static strings and field names
+        self.__parts = []
+        self.__fields = {}
+        self.__variable = [name for name, _, n_lines in fields
+                           if n_lines is None]
+        static = []
+        i = 0
+        while i < len(lines):
+            line = lines[i]
+            static.append(line)
+            i += 1
+            header = [key for key in headers if line.startswith(key)]
+            if not header:
+                continue
+            name, n_lines = headers[header[0]]
+            while i < len(lines) and lines[i].startswith('#'):
+                static.append(lines[i])
+                i += 1
+            values = []
+            while i < len(lines) and not lines[i].startswith('#'):
+                values.append(lines[i].split())
+                i += 1
+            if not values or (n_lines is not None and
+                              len(values) != n_lines):
+                raise ValueError("Field '{}' of {} has {} lines instead "
+                                 "of {}.".format(name, filename, len(values),
+                                                 n_lines))
+            self.__parts.append(''.join(static))
+            self.__parts.append(name)
+            self.__fields[name] = values
+            static = []
+        self.__parts.append(''.join(static))
+        missing = [name for name, _, _ in fields if name not in self.__fields]
+        if missing:
+            raise ValueError("Fields {} not found in {}.".format(
+                ', '.join(missing), filename))
+
+    def fields(self):
+        """Returns the names of the fields of the template."""
+        return self.__parts[1::2]
+
+    def values(self, name):
+        """Returns the lines of a field as lists of strings."""
+        return [list(line) for line in self.__fields[name]]
+
+    def render(self, **fields):
+        """Returns the content of the input file as a string.
+
+        Each keyword is the name of a field and its value is a list with the
+        leading values of each line of the field. Fields not given keep the
+        template values. For fields with a variable number of lines the
+        first line of the template is used as format for all the lines.
+        """
+        out = []
+        parts = self.__parts
+        for i in range(0, len(parts) - 1, 2):
+            out.append(parts[i])
+            name = parts[i + 1]
+            template_lines = self.__fields[name]
+            new_lines = fields.get(name)
+            if new_lines is None:
+                new_lines = template_lines
+            elif len(new_lines) != len(template_lines):
+                if name not in self.__variable:
+                    raise ValueError("Field '{}' needs {} lines.".format(
+                        name, len(template_lines)))
+            for j, values in enumerate(new_lines):
+                line = list(template_lines[min(j, len(template_lines) - 1)])
+                line[:len(values)] = [str(item) for item in values]
+                out.append(' '.join(line) + ' \n')
+        out.append(parts[-1])
+        return ''.join(out)
+
+    def write(self, filename, **fields):
+        """Writes the input file, see render for the meaning of fields."""
+        content = self.render(**fields)
+        with open(filename, 'w') as f_out:
+            f_out.write(content)
+
+
+def load_input_template(filename):
+    """Returns the parsed master.inp template. The template is read from disk
+    only the first time or when the file has been modified."""
+    mtime = os.path.getmtime(filename)
+    cached = _input_templates.get(filename)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, MasterInputTemplate(filename))
+        _input_templates[filename] = cached
+    return cached[1]
+
+
 def master_input_file(run_id, orbit, begin_epoch, end_epoch,
                       scenario_id=1, switches=DEFAULT_SWITCHES,
                       size_limits=DEFAULT_SIZE_LIMITS, analysis_mode=1,
-                      input_path=INPUT_PATH_DEFAULT):
+                      input_path=INPUT_PATH_DEFAULT,
+                      template_path=TEMPLATE_PATH_DEFAULT,
+                      spectra=None):
     """
     Modifies MASTER-2009 input files master.inp with user defined values
 
@@ -191,6 +495,9 @@ def master_input_file(run_id, orbit, begin_epoch, end_epoch,
         1 - target orbit
         2-inertial volume
         3-spatial density
+    spectra [list]:
+        The kinds of spectra generated for the 2D distributions (see
+        SPECTRUM_TYPES). If None, the switches of the template are kept.
 
     Returns
     -------
@@ -203,566 +510,185 @@ def master_input_file(run_id, orbit, begin_epoch, end_epoch,
         Mirko Trisolini
     Change Log:
     """
-    begin_yr, begin_mt, begin_dy, begin_hr = begin_epoch.split('/')
-    end_yr, end_mt, end_dy, end_hr = end_epoch.split('/')
-    orbit = [str(item) for item in orbit]  # conversion of orbital parameters into strings for writing
-    
-    with open('/'.join([MASTER_PATH, 'default', 'master.inp']), 'r') as f_in:
-        lines = [line for line in f_in]
-        with open('/'.join([input_path, 'master.inp']), 'w') as f_out:
-            i = 0
-            for line in lines:
-                if line.startswith('#'):
-                    f_out.write(line)
-                    i += 1
-                    continue
-                sl = line.split()
-                if i == 22:
-                    # run identifiier
-                    sl[0] = run_id
-                elif i == 33:
-                    # begin date
-                    sl[0] = begin_yr
-                    sl[1] = begin_mt
-                    sl[2] = begin_dy
-                    sl[3] = begin_hr
-                elif i == 34:
-                    # end date
-                    sl[0] = end_yr
-                    sl[1] = end_mt
-                    sl[2] = end_dy
-                    sl[3] = end_hr
-                elif i == 40:
-                    # scenario id:
-                    # 1-business as usual
-                    # 2-intermediate mitigation
-                    # 3-full mitigation
-                    sl[0] = str(scenario_id)
-                if i == 49:
-                    # explosion fragments
-                    sl[0] = switches[0]
-                if i == 50:
-                    # collision fragments
-                    sl[0] = switches[1]
-                if i == 51:
-                    # launch/mission related objects
-                    sl[0] = switches[2]
-                if i == 52:
-                    # NaK droplets
-                    sl[0] = switches[3]
-                if i == 53:
-                    # SRM slag
-                    sl[0] = switches[4]
-                if i == 54:
-                    # SRM Al2O3 dust
-                    sl[0] = switches[5]
-                if i == 55:
-                    # paint flakes
-                    sl[0] = switches[6]
-                if i == 56:
-                    # ejecta
-                    sl[0] = switches[7]
-                if i == 57:
-                    # MLI
-                    sl[0] = switches[8]
-                if i == 58:
-                    # meteoroids
-                    sl[0] = switches[9]
-                if i == 59:
-                    # clouds
-                    sl[0] = switches[10]
-                if i == 81:
-                    # debris lower threshold size - m or kg
-                    sl[0] = size_limits[0]
-                    sl[1] = size_limits[2]
-                if i == 82:
-                    # debris upper threshold size - m or kg
-                    sl[0] = size_limits[1]
-                    sl[1] = size_limits[2]
-                if i == 88:
-                    # analysis mode:
-                    # 1-target orbit
-                    # 2-inertial volume
-                    # 3-spatial density
-                    sl[0] = str(analysis_mode)
-                    sl.append('\n')
-                elif i == 100:
-                    # Target orbit characteristics
-                    # begin date
-                    sl[0] = begin_yr
-                    sl[1] = begin_mt
-                    sl[2] = begin_dy
-                    sl[3] = begin_hr
-                    # end date
-                    sl[4] = end_yr
-                    sl[5] = end_mt
-                    sl[6] = end_dy
-                    sl[7] = end_hr
-                    # semi-major axis
-                    sl[8] = orbit[0]
-                    # eccentricity
-                    sl[9] = orbit[1]
-                    # inclination
-                    sl[10] = orbit[2]
-                    # right asension of the ascending node
-                    sl[11] = orbit[3]
-                    # argument of perigee
-                    sl[12] = orbit[4]
-                    sl.append('\n')
-                else:
-                    sl.append('\n')
-                sl = ' '.join(sl)
-                f_out.write(sl)
-                i += 1
-    return 0
-
-
-def master_default_file(distribution_2D=DIST_2D_DEFAULT,
-                        distribution_3D=DIST_3D_DEFAULT,
-                        input_path=INPUT_PATH_DEFAULT):
-
-    with open('/'.join([MASTER_PATH, 'default', 'default.def']), 'r') as f_in:
-        lines = [line for line in f_in]
-        with open('/'.join([input_path, 'default.def']), 'w') as f_out:
-            i = 0
-            for line in lines:
-                sl = line.split()
-                if line.startswith('#'):
-                    f_out.write(line)
-                    i += 1
-                    continue
-                else:
-                    sl.append('\n')
-                for item in distribution_2D:
-                    if i < 80:
-                        if sl[0] == item[0]:
-                            sl[1] = item[1]
-                            sl[2] = item[2]
-                            sl[3] = item[3]
-                            sl[4] = item[4]
-                            sl[5] = item[5]
-                            sl[6] = item[6]
-                            break
-                        elif sl[0] != item[0]:
-                            sl[1] = '0'
-                            continue
-                    else:
-                        break
-                for item in distribution_3D:
-                    if i > 80:
-                        if sl[0] == item[0]:
-                            sl[1] = item[1]
-                            sl[2] = item[2]
-                            sl[3] = item[3]
-                            break
-                        elif sl[0] != item[0]:
-                            sl[1] = '0'
-                            continue
-                    else:
-                        break
-                sl = ' '.join(sl)
-                f_out.write(sl)
-                i += 1
-
-
-def master_default_constellation(input_path=INPUT_PATH_DEFAULT):
-    shutil.copy('/'.join([MASTER_PATH, 'default', 'default.con']),
-                '/'.join([input_path, 'default.con']))
-    return 0
-
-
-def master_default_sdf(input_path=INPUT_PATH_DEFAULT):
-    shutil.copy('/'.join([MASTER_PATH, 'default', 'default.sdf']),
-                '/'.join([input_path, 'default.sdf']))
-    return 0
-
-
-if __name__ == '__main__':
-    master_run_test = MasterRun(sim_name='test_folder_5', path=r'C:\Users\Mirko\Documents\Python Scripts\dev_environment\master_wrapper\test_results')
-    check = master_run_test.check_simulation()
-    if check:
-        print 'set master config'
-        master_run_test.set_master_config()
-        master_run_test.set_master_input(orbit=['7178.0', '0.001', '60.0', '316.0', '0.0'],
-                                         begin_epoch='2016/04/01/00',
-                                         end_epoch='2016/06/07/00')
-        master_run_test.set_master_default()
-=======
-# -*- coding: utf-8 -*-
-import shutil
-import subprocess
-import os
-
-from utils import create_folder
-
-DEFAULT_PATH = 'C:/Users/mt19g14/MASTER Simulation Database'
-MASTER_PATH = r'C:\Program Files (x86)\MASTER-2009'
-OUTPUT_PATH_DEFAULT = '/'.join([MASTER_PATH, 'output'])
-INPUT_PATH_DEFAULT = '/'.join([MASTER_PATH, 'input'])
-DATA_PATH_DEFAULT = '/'.join([MASTER_PATH, 'data'])
-DATA_CLOUD_PATH_DEFAULT = '/'.join([MASTER_PATH, 'data', 'clouds'])
-
-DEFAULT_SWITCHES = ['1', '1', '1', '1', '1', '1', '1', '1', '0', '0', '0']
-DEFAULT_SIZE_LIMITS = ['1e-04', '0.1', 'm']
-
-DIST_2D_DEFAULT = [['2', '1', '1', '1', '1e-04', '0.1', '-50'],
-                   ['9', '1', '0', '0', '0', '40', '0.5'],
-                   ['10', '1', '0', '0', '-180', '180', '2.5'],
-                   ['11', '1', '0', '0', '-90', '90', '2.5']]
-
-DIST_3D_DEFAULT = [['1', '1', '11', '10'],
-                   ['2', '1', '10', '9'],
-                   ['3', '1', '10', '2']]
-
-def simulation_setup(case):
-    """Select among a set of predefined simulation characteristics for MASTER.
-    The predefined parameters to specify in MASTER are the sources of debris,
-    the size limits, the 2D and 3D distribution fluxes to produce as output.
-    """
-    #TODO: if time add the possibility to load with input file.
-    #TODO: write the list with the strings. is easier to read them
-    if case == 0:
-        debris_sources = [1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0]
-        size_limits = [1e-04, 0.1, 'm']
-
-        distribution_2d = [[2, 1, 1, 1, 1e-04, 0.1, -50],
-                           [9, 1, 0, 0, 0, 40, 0.5],
-                           [10, 1, 0, 0, -180, 180, 2.5],
-                           [11, 1, 0, 0, -90, 90, 2.5]]
-
-        distribution_3d = [[1, 1, 11, 10],
-                           [2, 1, 10, 9],
-                           [3, 1, 10, 2]]
-        return debris_sources, size_limits, distribution_2d, distribution_3d
-    elif case == 1:  # TODO: update to different values
-        debris_sources = [1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0]
-        size_limits = [1e-04, 0.1, 'm']
-
-        distribution_2d = [[2, 1, 1, 1, 1e-04, 0.1, -50],
-                           [9, 1, 0, 0, 0, 40, 0.5],
-                           [10, 1, 0, 0, -180, 180, 2.5],
-                           [11, 1, 0, 0, -90, 90, 2.5]]
-
-        distribution_3d = [[1, 1, 11, 10],
-                           [2, 1, 10, 9],
-                           [3, 1, 10, 2]] 
-        return debris_sources, size_limits, distribution_2d, distribution_3d
-    else:
-        return ValueError("Case number {} does not exist.".format(case))    
-
-class MasterRun(object):
-#FIXME: do not use so many default values like this. Specify the path of MASTER, is important if someone else wants to use the code.
-    def __init__(self, sim_name='', run_id='master', 
-                 path=MASTER_PATH,  #FIXME: this is not correct, should be the path where I am saving the results.
-                 data_path=DATA_PATH_DEFAULT,
-                 data_cloud_path=DATA_CLOUD_PATH_DEFAULT,
-                 switches=DEFAULT_SWITCHES,
-                 size_limits=DEFAULT_SIZE_LIMITS,
-                 distribution_2D=DIST_2D_DEFAULT,
-                 distribution_3D=DIST_3D_DEFAULT):
-
-        self.__sim_name = sim_name
-        self.__run_id = run_id
-        self.__path = path
-        self.__input_path = '/'.join([self.__path, self.__sim_name, 'input'])
-        self.__output_path = '/'.join([self.__path, self.__sim_name, 'output'])
-        self.__data_path = data_path
-        self.__data_cloud_path = data_cloud_path
-        self.__switches = switches
-        self.__size_limits = size_limits
-        self.__dist_2D = distribution_2D
-        self.__dist_3D = distribution_3D
-        if any(isinstance(x, float) for x in lst):
-            
-        
-    def set_master_config(self):
-        master_config_file(self.__input_path, self.__output_path,
-                           self.__data_path, self.__data_cloud_path)  
-        return 0
-
-    def set_master_input(self, orbit, begin_epoch, end_epoch,
-                         scenario_id=1, switches=DEFAULT_SWITCHES,
-                         size_limits=DEFAULT_SIZE_LIMITS, analysis_mode=1):
-
-        master_input_file(self.__run_id, orbit, begin_epoch, end_epoch,
-                          scenario_id, switches, size_limits,
-                          analysis_mode, self.__input_path)
-        return 0
-
-    def set_master_default(self):
-        master_default_file(self.__dist_2D, self.__dist_3D, self.__input_path)
-        master_default_constellation(self.__input_path)
-        master_default_sdf(self.__input_path)
-
-    def check_simulation(self):
-        cf = create_folder(self.__sim_name, self.__path,
-                           sub_folders=[self.__input_path,
-                                        self.__output_path])
-        print cf
-        return cf
-
-    def call(self):
-        p = subprocess.Popen(['master_windows.exe'],
-                             cwd=MASTER_PATH,
-                             shell=True)
-        p.wait()
-        return 0
-
-
-def master_config_file(input_path=INPUT_PATH_DEFAULT,
-                       output_path=OUTPUT_PATH_DEFAULT,
-                       data_path=DATA_PATH_DEFAULT,
-                       data_cloud_path=DATA_CLOUD_PATH_DEFAULT):
-
-    with open('/'.join([r'C:\Users\Mirko\Documents\Python Scripts\dev_environment\master_wrapper\default_inputs', 'master.cfg']), 'r') as f_in:
-        data = f_in.readlines()
-    config_inputs = [output_path, data_path, data_cloud_path, input_path]
-    for i in range(4):
-        set_data = data[23 + i].split()
-        set_data[0] = config_inputs[i]
-        data[23 + i] = '  ' + ' '.join(set_data) + '\n'
-    with open('/'.join([MASTER_PATH, 'master.cfg']), 'w') as f_out:
-        f_out.writelines(data)
+    check_epoch(begin_epoch)
+    check_epoch(end_epoch)
+    begin_date = begin_epoch.split('/')
+    end_date = end_epoch.split('/')
+    fields = {}
+    if spectra is not None:
+        unknown = set(spectra) - set(SPECTRUM_TYPES)
+        if unknown:
+            raise ValueError("Unknown kinds of spectra: {}.".format(
+                ', '.join(sorted(unknown))))
+        for kind in SPECTRUM_TYPES:
+            fields[kind] = [[int(kind in spectra)]]
+    template = load_input_template('/'.join([template_path, 'master.inp']))
+    template.write('/'.join([input_path, 'master.inp']),
+                   run_id=[[run_id]],
+                   epoch=[begin_date, end_date],
+                   scenario_id=[[scenario_id]],
+                   switches=[[item] for item in switches],
+                   size_limits=[[size_limits[0], size_limits[2]],
+                                [size_limits[1], size_limits[2]]],
+                   analysis_mode=[[analysis_mode]],
+                   target_orbits=[begin_date + end_date + list(orbit)],
+                   **fields)
     return 0
 
 
-def master_input_file(run_id, orbit, begin_epoch, end_epoch,
-                      scenario_id=1, switches=DEFAULT_SWITCHES,
-                      size_limits=DEFAULT_SIZE_LIMITS, analysis_mode=1,
-                      input_path=INPUT_PATH_DEFAULT):
-    """
-    Modifies MASTER-2009 input files master.inp with user defined values
+def template_distributions(template_path=TEMPLATE_PATH_DEFAULT):
+    """Returns the rows of the 2D and 3D distributions of the default.def
+    template, by distribution number, in the form of DIST_2D_DEFAULT and
+    DIST_3D_DEFAULT."""
+    dist_2d = {}
+    dist_3d = {}
+    with open('/'.join([template_path, 'default.def']), 'r') as f_in:
+        for line in f_in:
+            sl = line.split()
+            if line.startswith('#') or len(sl) < 4:
+                continue
+            if len(sl) >= 7:
+                dist_2d[int(sl[0])] = sl[:7]
+            else:
+                dist_3d[int(sl[0])] = sl[:4]
+    return dist_2d, dist_3d
+
+
+def select_products(products, distribution_2D=DIST_2D_DEFAULT,
+                    distribution_3D=DIST_3D_DEFAULT,
+                    template_path=TEMPLATE_PATH_DEFAULT):
+    """Returns the settings that make MASTER generate only the requested
+    output products.
 
     Parameters
     ----------
-    run_id [str]:
-        Identifier of the simulation. Must be unique.
-    orbit [list]:
-        Target orbit of the simulation.
-        orbit = [sma(km), ecc, inc(deg), RAAN(deg), AoP(deg)]
-    begin_epoch:
-        Starting date of the MASTER simulation in the form:
-        YEAR/MONTH/DAY/HOUR
-    bend_epoch:
-        Ending date of the MASTER simulation in the form:
-        YEAR/MONTH/DAY/HOUR
-    scenario_id [int]:
-        1 - business as usual
-        2 - intermediate mititgation
-        3 - full mitigation
-    switches [list]:
-        Defines which debris sources are considered. 0 is 'off' and 1 is 'on'.
-        The list has eleven contribution. The different contributions are
-        described int the following.
-        The number represent the index in the list.
-        0 - explosion fragments
-        1 - collision fragments
-        2 - launch/mission related objects
-        3 - NaK droplets
-        4 - SRM slag
-        5 - SRM Al2O3 dust
-        6 - paint flakes
-        7 - ejecta
-        8 - MLI
-        9 - meteoroids
-        10 - clouds
-    size_limits [list]:
-        The lower and upper threshold of the diameter/mass of the debris.
-        The units needs to be specified. If meters (m) are specified the
-        diameter is considered. If kilograms (kg) are specified, the mass
-        is considered.
-        The input has the following aspect:
-        size_limits = [LOWER_LIMIT, UPPER_LIMIT, UNIT]
-        For example:
-        size_limits = [1e-4, 1, m]
-    analysis_mode [int]:
-        Defines the type of analysis carried out. Three options are available:
-        1 - target orbit
-        2-inertial volume
-        3-spatial density
+    products [list]:
+        The output products as (kind, distribution) pairs. kind is one of
+        SPECTRUM_TYPES and distribution the number of a 2D distribution, or
+        kind is '3d' and distribution the pair of 2D distributions of a 3D
+        distribution. For example:
+        products = [('cumulative', 2), ('3d', (11, 10))]
+        The bins of a distribution are taken from distribution_2D and
+        distribution_3D or, for the distributions not listed there, from the
+        default.def template.
+        The kinds of spectra are switched on for all the 2D distributions,
+        and the 2D distributions of a 3D distribution are always generated,
+        since MASTER builds the 3D distributions on their bins.
 
     Returns
     -------
-    Write to the output the modified master.inp file. The file is saved in the
-    specified input folder.
-
-    Info
-    -----
-    Author:
-        Mirko Trisolini
-    Change Log:
+    spectra [list]:
+        The kinds of spectra to generate (see master_input_file).
+    distribution_2D, distribution_3D [list]:
+        The distributions to generate (see master_default_file).
     """
-    begin_yr, begin_mt, begin_dy, begin_hr = begin_epoch.split('/')
-    end_yr, end_mt, end_dy, end_hr = end_epoch.split('/')
-    orbit = [str(item) for item in orbit]  # conversion of orbital parameters into strings for writing
-    
-    with open('/'.join([MASTER_PATH, 'default', 'master.inp']), 'r') as f_in:
-        lines = [line for line in f_in]
-        with open('/'.join([input_path, 'master.inp']), 'w') as f_out:
-            i = 0
-            for line in lines:
-                if line.startswith('#'):
-                    f_out.write(line)
-                    i += 1
-                    continue
-                sl = line.split()
-                if i == 22:
-                    # run identifiier
-                    sl[0] = run_id
-                elif i == 33:
-                    # begin date
-                    sl[0] = begin_yr
-                    sl[1] = begin_mt
-                    sl[2] = begin_dy
-                    sl[3] = begin_hr
-                elif i == 34:
-                    # end date
-                    sl[0] = end_yr
-                    sl[1] = end_mt
-                    sl[2] = end_dy
-                    sl[3] = end_hr
-                elif i == 40:
-                    # scenario id:
-                    # 1-business as usual
-                    # 2-intermediate mitigation
-                    # 3-full mitigation
-                    sl[0] = str(scenario_id)
-                if i == 49:
-                    # explosion fragments
-                    sl[0] = switches[0]
-                if i == 50:
-                    # collision fragments
-                    sl[0] = switches[1]
-                if i == 51:
-                    # launch/mission related objects
-                    sl[0] = switches[2]
-                if i == 52:
-                    # NaK droplets
-                    sl[0] = switches[3]
-                if i == 53:
-                    # SRM slag
-                    sl[0] = switches[4]
-                if i == 54:
-                    # SRM Al2O3 dust
-                    sl[0] = switches[5]
-                if i == 55:
-                    # paint flakes
-                    sl[0] = switches[6]
-                if i == 56:
-                    # ejecta
-                    sl[0] = switches[7]
-                if i == 57:
-                    # MLI
-                    sl[0] = switches[8]
-                if i == 58:
-                    # meteoroids
-                    sl[0] = switches[9]
-                if i == 59:
-                    # clouds
-                    sl[0] = switches[10]
-                if i == 81:
-                    # debris lower threshold size - m or kg
-                    sl[0] = size_limits[0]
-                    sl[1] = size_limits[2]
-                if i == 82:
-                    # debris upper threshold size - m or kg
-                    sl[0] = size_limits[1]
-                    sl[1] = size_limits[2]
-                if i == 88:
-                    # analysis mode:
-                    # 1-target orbit
-                    # 2-inertial volume
-                    # 3-spatial density
-                    sl[0] = str(analysis_mode)
-                    sl.append('\n')
-                elif i == 100:
-                    # Target orbit characteristics
-                    # begin date
-                    sl[0] = begin_yr
-                    sl[1] = begin_mt
-                    sl[2] = begin_dy
-                    sl[3] = begin_hr
-                    # end date
-                    sl[4] = end_yr
-                    sl[5] = end_mt
-                    sl[6] = end_dy
-                    sl[7] = end_hr
-                    # semi-major axis
-                    sl[8] = orbit[0]
-                    # eccentricity
-                    sl[9] = orbit[1]
-                    # inclination
-                    sl[10] = orbit[2]
-                    # right asension of the ascending node
-                    sl[11] = orbit[3]
-                    # argument of perigee
-                    sl[12] = orbit[4]
-                    sl.append('\n')
-                else:
-                    sl.append('\n')
-                sl = ' '.join(sl)
-                f_out.write(sl)
-                i += 1
-    return 0
+    dist_2d, dist_3d = template_distributions(template_path)
+    dist_2d.update((int(item[0]), list(item)) for item in distribution_2D)
+    dist_3d.update((int(item[0]), list(item)) for item in distribution_3D)
+    spectra = []
+    numbers_2d = []
+    selected_3d = []
+    for kind, distribution in products:
+        if kind in SPECTRUM_TYPES:
+            if kind not in spectra:
+                spectra.append(kind)
+            numbers_2d.append(int(distribution))
+        elif kind == '3d':
+            pair = tuple(int(item) for item in distribution)
+            rows = [row for number, row in sorted(dist_3d.items())
+                    if (int(row[2]), int(row[3])) == pair]
+            if not rows:
+                raise ValueError("No 3D distribution of {} and {} is defined "
+                                 "in default.def.".format(*pair))
+            if rows[0] not in selected_3d:
+                selected_3d.append(rows[0])
+            numbers_2d.extend(pair)
+        else:
+            raise ValueError("Unknown output product '{}'.".format(kind))
+    selected_2d = []
+    for number in sorted(set(numbers_2d)):
+        if number not in dist_2d:
+            raise ValueError("Distribution {} is not defined in "
+                             "default.def.".format(number))
+        selected_2d.append([str(number), '1'] + list(dist_2d[number][2:]))
+    selected_3d = [[str(row[0]), '1'] + list(row[2:]) for row in selected_3d]
+    return spectra, selected_2d, selected_3d
 
 
 def master_default_file(distribution_2D=DIST_2D_DEFAULT,
                         distribution_3D=DIST_3D_DEFAULT,
-                        input_path=INPUT_PATH_DEFAULT):
-
-    with open('/'.join([MASTER_PATH, 'default', 'default.def']), 'r') as f_in:
+                        input_path=INPUT_PATH_DEFAULT,
+                        template_path=TEMPLATE_PATH_DEFAULT,
+                        stage=None):
+    """Writes default.def with the given 2D and 3D distributions. The file is
+    written only if its content changes, or linked from the stage if given
+    (see master_staging.InputStage)."""
+    out = []
+    with open('/'.join([template_path, 'default.def']), 'r') as f_in:
         lines = [line for line in f_in]
-        with open('/'.join([input_path, 'default.def']), 'w') as f_out:
-            i = 0
-            for line in lines:
-                sl = line.split()
-                if line.startswith('#'):
-                    f_out.write(line)
-                    i += 1
-                    continue
-                else:
-                    sl.append('\n')
-                for item in distribution_2D:
-                    if i < 80:
-                        if sl[0] == item[0]:
-                            sl[1] = item[1]
-                            sl[2] = item[2]
-                            sl[3] = item[3]
-                            sl[4] = item[4]
-                            sl[5] = item[5]
-                            sl[6] = item[6]
-                            break
-                        elif sl[0] != item[0]:
-                            sl[1] = '0'
-                            continue
-                    else:
+        i = 0
+        for line in lines:
+            sl = line.split()
+            if line.startswith('#'):
+                out.append(line)
+                i += 1
+                continue
+            else:
+                sl.append('\n')
+            for item in distribution_2D:
+                if i < 80:
+                    if sl[0] == item[0]:
+                        sl[1] = item[1]
+                        sl[2] = item[2]
+                        sl[3] = item[3]
+                        sl[4] = item[4]
+                        sl[5] = item[5]
+                        sl[6] = item[6]
                         break
-                for item in distribution_3D:
-                    if i > 80:
-                        if sl[0] == item[0]:
-                            sl[1] = item[1]
-                            sl[2] = item[2]
-                            sl[3] = item[3]
-                            break
-                        elif sl[0] != item[0]:
-                            sl[1] = '0'
-                            continue
-                    else:
+                    elif sl[0] != item[0]:
+                        sl[1] = '0'
+                        continue
+                else:
+                    break
+            for item in distribution_3D:
+                if i > 80:
+                    if sl[0] == item[0]:
+                        sl[1] = item[1]
+                        sl[2] = item[2]
+                        sl[3] = item[3]
                         break
-                sl = ' '.join(sl)
-                f_out.write(sl)
-                i += 1
-
-
-def master_default_constellation(input_path=INPUT_PATH_DEFAULT):
-    shutil.copy('/'.join([MASTER_PATH, 'default', 'default.con']),
-                '/'.join([input_path, 'default.con']))
+                    elif sl[0] != item[0]:
+                        sl[1] = '0'
+                        continue
+                else:
+                    break
+            sl = ' '.join(sl)
+            out.append(sl)
+            i += 1
+    write_input('/'.join([input_path, 'default.def']), ''.join(out), stage)
+
+
+def master_default_constellation(input_path=INPUT_PATH_DEFAULT,
+                                 template_path=TEMPLATE_PATH_DEFAULT,
+                                 stage=None):
+    if stage is not None:
+        stage.stage_file('/'.join([template_path, 'default.con']),
+                         '/'.join([input_path, 'default.con']))
+        return 0
+    with open('/'.join([template_path, 'default.con']), 'rb') as f_in:
+        write_input('/'.join([input_path, 'default.con']), f_in.read())
     return 0
 
 
-def master_default_sdf(input_path=INPUT_PATH_DEFAULT):
-    shutil.copy('/'.join([MASTER_PATH, 'default', 'default.sdf']),
-                '/'.join([input_path, 'default.sdf']))
+def master_default_sdf(input_path=INPUT_PATH_DEFAULT,
+                       template_path=TEMPLATE_PATH_DEFAULT,
+                       stage=None):
+    if stage is not None:
+        stage.stage_file('/'.join([template_path, 'default.sdf']),
+                         '/'.join([input_path, 'default.sdf']))
+        return 0
+    with open('/'.join([template_path, 'default.sdf']), 'rb') as f_in:
+        write_input('/'.join([input_path, 'default.sdf']), f_in.read())
     return 0
 
 
@@ -776,5 +702,4 @@ if __name__ == '__main__':
                                          begin_epoch='2016/04/01/00',
                                          end_epoch='2016/06/07/00')
         master_run_test.set_master_default()
->>>>>>> a7a72265d0def9848445cca96d820f7f26b818db
-    master_run_test.call()
\ No newline at end of file
+    master_run_test.call()
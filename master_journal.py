@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""Crash-safe execution of MASTER campaigns.
+
+Every change of state of the runs of a campaign is appended to a journal, so
+that a campaign interrupted by a crash or a reboot can be resumed: completed
+runs are skipped and interrupted runs are executed again, without asking
+anything to the user.
+
+Usage:
+    python master_journal.py resume JOURNAL [--max-running 4] [--timeout T]
+                                            [--retry-failed]
+    python master_journal.py status JOURNAL
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+from master_batch import complete_spec, make_run, validate_batch
+from master_cache import input_key
+from master_launcher import MasterLauncher
+from master_timing import PhaseHook, add_hook, remove_hook
+
+# states of a run, in the order they are reached
+RUN_STATES = ('planned', 'inputs_written', 'running', 'done', 'failed')
+
+
+class CampaignJournal(object):
+    """Append-only journal of the runs of a campaign.
+
+    The journal is a text file with one JSON record per line. Each record is
+    written with a single write and flushed to disk, so that at most the last
+    record is lost in a crash; an incomplete last line is ignored when the
+    journal is read.
+
+    Inputs
+    ------
+    - filename (str):
+        the path of the journal. It is created if it does not exist.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.__lock = threading.Lock()
+
+    def append(self, sim_name, state, **items):
+        """Records a new state of a run. The items are stored in the record
+        (e.g. 'spec', 'input_hash', 'error'). A line left incomplete by a
+        crash is terminated first, so that the new record can be read."""
+        if state not in RUN_STATES:
+            raise ValueError("Unknown run state '{}'.".format(state))
+        record = dict(items)
+        record.update({'sim_name': sim_name, 'state': state,
+                       'time': time.time()})
+        line = json.dumps(record) + '\n'
+        with self.__lock:
+            with open(self.filename, 'a+b') as f_out:
+                f_out.seek(0, os.SEEK_END)
+                if f_out.tell() > 0:
+                    f_out.seek(-1, os.SEEK_END)
+                    if f_out.read(1) != b'\n':
+                        line = '\n' + line
+                f_out.write(line)
+                f_out.flush()
+                os.fsync(f_out.fileno())
+
+    def records(self):
+        """Returns all the records, in the order they were written."""
+        if not os.path.isfile(self.filename):
+            return []
+        records = []
+        with open(self.filename, 'r') as f_in:
+            for line in f_in:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # record interrupted by a crash
+                    continue
+        return records
+
+    def runs(self):
+        """Returns the runs of the campaign, by simulation name, in the order
+        they were planned. Each run is a dict with its 'spec', its last
+        'state', and the last 'input_hash' and 'error' recorded."""
+        runs = {}
+        order = []
+        for record in self.records():
+            name = record['sim_name']
+            if name not in runs:
+                runs[name] = {'spec': None, 'state': None,
+                              'input_hash': None, 'error': None}
+                order.append(name)
+            run = runs[name]
+            run['state'] = record['state']
+            for key in ('spec', 'input_hash', 'error'):
+                if key in record:
+                    run[key] = record[key]
+        return [(name, runs[name]) for name in order]
+
+    def status(self):
+        """Returns the number of runs in each state."""
+        counts = dict((state, 0) for state in RUN_STATES)
+        for _, run in self.runs():
+            counts[run['state']] += 1
+        return counts
+
+
+class JournalHook(PhaseHook):
+    """Records in the journal when the executable of a run starts (see
+    master_timing.PhaseHook) and, through on_prepared, when the inputs of a
+    run have been written."""
+    def __init__(self, journal, input_paths):
+        self.journal = journal
+        # input folder of each run of the campaign, by simulation name
+        self.input_paths = input_paths
+
+    def on_phase_start(self, phase, run, start):
+        if phase == 'execution' and run in self.input_paths:
+            self.journal.append(run, 'running')
+
+    def on_prepared(self, handle, spec):
+        """Called by the launcher once master_batch.prepare_run has written
+        all the inputs of a run."""
+        run = spec['sim_name']
+        if run in self.input_paths:
+            self.journal.append(run, 'inputs_written',
+                                input_hash=input_key(self.input_paths[run]))
+
+
+def plan(journal, specs):
+    """Adds new runs to the campaign. Runs already in the journal are not
+    added again.
+
+    Returns
+    -------
+    - n_planned (int):
+        the number of runs added.
+    """
+    known = set(name for name, _ in journal.runs())
+    n_planned = 0
+    for spec in specs:
+        if spec['sim_name'] in known:
+            continue
+        complete_spec(spec)
+        journal.append(spec['sim_name'], 'planned', spec=spec)
+        known.add(spec['sim_name'])
+        n_planned += 1
+    return n_planned
+
+
+def pending_specs(journal, retry_failed=False):
+    """Returns the specifications of the runs that still have to be executed:
+    the runs never started or interrupted, the failed runs if retry_failed is
+    True, and the completed runs whose inputs or outputs are no longer the
+    ones recorded in the journal. The runs are executed again in their
+    folder, which is overwritten."""
+    specs = []
+    for name, run in journal.runs():
+        if run['spec'] is None:
+            continue
+        if run['state'] == 'failed' and not retry_failed:
+            continue
+        if run['state'] == 'done' and completed(run):
+            continue
+        spec = dict(run['spec'])
+        spec['overwrite'] = True
+        specs.append(spec)
+    return specs
+
+
+def completed(run):
+    """Checks that the folder of a completed run still has the inputs and the
+    outputs of the execution recorded in the journal."""
+    spec = complete_spec(run['spec'])
+    master_run = make_run(spec)
+    if not os.path.isdir(master_run.output_path) or not os.listdir(
+            master_run.output_path):
+        return False
+    if run['input_hash'] is None:
+        # the record of the inputs was lost in a crash
+        return True
+    try:
+        return input_key(master_run.input_path) == run['input_hash']
+    except (IOError, OSError):
+        return False
+
+
+def run_campaign(journal_path, specs=None, max_running=4, timeout=None,
+                 retry_failed=False):
+    """Runs a campaign, or resumes it if the journal already exists.
+
+    Inputs
+    ------
+    - journal_path (str):
+        the path of the journal of the campaign.
+    - specs (list):
+        the run specifications (see master_batch.complete_spec). Every run
+        must have a different 'sim_name'. The runs already in the journal
+        are ignored, so the same list can be given again to resume. None to
+        resume with the runs of the journal only.
+    - max_running, timeout:
+        see master_launcher.MasterLauncher.
+    - retry_failed (bool):
+        if True the failed runs are executed again.
+
+    Returns
+    -------
+    - results (list):
+        the results of the runs executed (see master_batch.run_simulation).
+        Runs killed by a timeout are recorded as failed, cancelled runs are
+        executed again when the campaign is resumed.
+    """
+    journal = CampaignJournal(journal_path)
+    if specs:
+        validate_batch(specs)
+        plan(journal, specs)
+    specs = pending_specs(journal, retry_failed)
+    validate_batch(specs)
+    input_paths = dict((spec['sim_name'],
+                        make_run(complete_spec(spec)).input_path)
+                       for spec in specs)
+    hook = JournalHook(journal, input_paths)
+    add_hook(hook)
+    launcher = MasterLauncher(max_running, timeout,
+                              on_prepared=hook.on_prepared)
+    results = []
+    try:
+        handles = [launcher.submit(spec) for spec in specs]
+        for handle in launcher.as_completed(handles):
+            result = handle.result()
+            results.append(result)
+            if result['status'] == 'done':
+                journal.append(result['sim_name'], 'done')
+            elif result['status'] != 'cancelled':
+                journal.append(result['sim_name'], 'failed',
+                               error=result['error'] or result['status'])
+    finally:
+        launcher.shutdown(cancel=True)
+        remove_hook(hook)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Crash-safe campaigns.')
+    parser.add_argument('command', choices=['resume', 'status'])
+    parser.add_argument('journal')
+    parser.add_argument('--max-running', type=int, default=4)
+    parser.add_argument('--timeout', type=float, default=None)
+    parser.add_argument('--retry-failed', action='store_true')
+    args = parser.parse_args(argv)
+
+    journal = CampaignJournal(args.journal)
+    if args.command == 'resume':
+        results = run_campaign(args.journal, max_running=args.max_running,
+                               timeout=args.timeout,
+                               retry_failed=args.retry_failed)
+        print 'executed %d runs' % len(results)
+    status = journal.status()
+    for state in RUN_STATES:
+        print '%15s %6d' % (state, status[state])
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
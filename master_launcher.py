@@ -0,0 +1,314 @@
+# -*- coding: utf-8 -*-
+import collections
+import threading
+import time
+import traceback
+
+from master_batch import (complete_spec, make_run, prepare_run, new_result,
+                          make_cache)
+from master_timing import (PhaseRecorder, add_hook, remove_hook,
+                           phase_start, phase_end)
+from utils import kill_process_tree
+
+# final states of a run
+FINAL_STATUS = ('done', 'failed', 'skipped', 'timeout', 'cancelled')
+
+
+class RunHandle(object):
+    """Handle of a run submitted to a MasterLauncher.
+
+    The handle can be waited on from any thread and the run can be cancelled
+    at any time. The result has the same form of the result of
+    master_batch.run_simulation, with the additional 'timeout' and
+    'cancelled' status.
+    """
+    def __init__(self, spec, timeout=None):
+        self.spec = spec
+        self.timeout = timeout
+        self.status = 'queued'
+        self.__result = new_result(spec)
+        self.__finished = threading.Event()
+        self.__cancel = False
+        self.recorder = PhaseRecorder(spec.get('sim_name'))
+
+    def cancel(self):
+        """Asks to cancel the run. A queued run is never started, a running
+        run is killed together with its child processes."""
+        self.__cancel = True
+
+    def cancelled(self):
+        return self.__cancel
+
+    def done(self):
+        return self.__finished.is_set()
+
+    def wait(self, timeout=None):
+        """Waits for the run to finish. Returns True if it has finished."""
+        self.__finished.wait(timeout)
+        return self.__finished.is_set()
+
+    def result(self, timeout=None):
+        """Waits for the run to finish and returns its result. Returns None
+        if the run has not finished within timeout seconds."""
+        if not self.wait(timeout):
+            return None
+        return self.__result
+
+    def _finish(self, status, **items):
+        remove_hook(self.recorder)
+        self.__result['timings'] = self.recorder.events
+        self.__result.update(items)
+        self.__result['status'] = status
+        self.status = status
+        self.__finished.set()
+
+
+class FifoAdmission(object):
+    """Admission policy of a MasterLauncher: the runs are started in the
+    order they were submitted, up to max_running at the same time.
+
+    An admission policy has two methods. select(queued, running) receives
+    the handles of the queued and of the running runs and returns the queued
+    handle to start now, or None to wait for a run to finish. When no run is
+    running the launcher starts the first queued run anyway, since there is
+    nothing to wait for. on_finished(handle) is called when a run finishes.
+    """
+    def __init__(self, max_running=4):
+        self.max_running = max_running
+
+    def select(self, queued, running):
+        if len(running) >= self.max_running or not queued:
+            return None
+        return queued[0]
+
+    def on_finished(self, handle):
+        pass
+
+
+def poll_process(process):
+    """Default wait_usage of a MasterLauncher: returns None while the process
+    is running and an empty usage once it has finished."""
+    if process.poll() is None:
+        return None
+    return {}
+
+
+class MasterLauncher(object):
+    """Executes MASTER runs in the background with a limited number of runs
+    at the same time.
+
+    A single thread writes the inputs, starts the executables and polls them,
+    so that many runs can be in flight without one blocking the others. Runs
+    exceeding their wall-clock timeout are killed.
+
+    Inputs
+    ------
+    - max_running (int):
+        maximum number of executables running at the same time.
+    - timeout (float):
+        default wall-clock timeout of each run in seconds. None for no limit.
+    - poll_interval (float):
+        time in seconds between two checks of the running processes.
+    - on_prepared (function):
+        called with the handle and the complete specification of a run once
+        all its inputs have been written, before the executable starts.
+    - admission (object):
+        chooses which queued run starts next (see FifoAdmission). Default
+        value is FifoAdmission(max_running).
+    - wait_usage (function):
+        called with the process of a running run at every poll; returns None
+        while the process is running, otherwise a dict with the resources
+        used by the run, stored in the 'usage' of its result together with
+        its 'wall_time'. It must leave the process to subprocess.Popen (see
+        poll_process).
+
+    Example
+    -------
+        launcher = MasterLauncher(max_running=8, timeout=3600)
+        handles = [launcher.submit(spec) for spec in specs]
+        for handle in launcher.as_completed(handles):
+            print handle.result()['status']
+        launcher.shutdown()
+    """
+    def __init__(self, max_running=4, timeout=None, poll_interval=0.5,
+                 on_prepared=None, admission=None, wait_usage=poll_process):
+        if admission is None:
+            admission = FifoAdmission(max_running)
+        self.__admission = admission
+        self.__wait_usage = wait_usage
+        self.__on_prepared = on_prepared
+        self.__timeout = timeout
+        self.__poll_interval = poll_interval
+        self.__queue = collections.deque()
+        self.__running = []
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__stop = False
+        self.__thread = threading.Thread(target=self.__loop)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def submit(self, spec, timeout=None):
+        """Adds a run to the queue.
+
+        Inputs
+        ------
+        - spec (dict):
+            the run specification (see master_batch.complete_spec).
+        - timeout (float):
+            wall-clock timeout of the run in seconds. Default value is the
+            timeout of the launcher.
+
+        Returns
+        -------
+        - handle (RunHandle)
+        """
+        if self.__stop:
+            raise RuntimeError("The launcher has been shut down.")
+        if timeout is None:
+            timeout = self.__timeout
+        handle = RunHandle(spec, timeout)
+        with self.__lock:
+            self.__queue.append(handle)
+        self.__wake.set()
+        return handle
+
+    def submit_batch(self, specs, timeout=None):
+        """Adds several runs to the queue at once, so that the admission
+        policy chooses among all of them (see submit).
+
+        Returns
+        -------
+        - handles (list)
+        """
+        if self.__stop:
+            raise RuntimeError("The launcher has been shut down.")
+        if timeout is None:
+            timeout = self.__timeout
+        handles = [RunHandle(spec, timeout) for spec in specs]
+        with self.__lock:
+            self.__queue.extend(handles)
+        self.__wake.set()
+        return handles
+
+    def as_completed(self, handles):
+        """Returns the handles as their runs finish."""
+        pending = list(handles)
+        while pending:
+            finished = [handle for handle in pending if handle.done()]
+            if not finished:
+                pending[0].wait(self.__poll_interval)
+                continue
+            for handle in finished:
+                pending.remove(handle)
+                yield handle
+
+    def shutdown(self, cancel=False, wait=True):
+        """Stops the launcher. If cancel is True the queued and running runs
+        are cancelled, otherwise they are completed first."""
+        if cancel:
+            with self.__lock:
+                handles = list(self.__queue) + [item[0] for item in
+                                                self.__running]
+            for handle in handles:
+                handle.cancel()
+        self.__stop = True
+        self.__wake.set()
+        if wait:
+            self.__thread.join()
+
+    def __loop(self):
+        while True:
+            self.__start_runs()
+            self.__poll_runs()
+            with self.__lock:
+                idle = not self.__queue and not self.__running
+            if idle and self.__stop:
+                return
+            self.__wake.wait(self.__poll_interval)
+            self.__wake.clear()
+
+    def __start_runs(self):
+        with self.__lock:
+            cancelled = [handle for handle in self.__queue
+                         if handle.cancelled()]
+            for handle in cancelled:
+                self.__queue.remove(handle)
+        for handle in cancelled:
+            self.__finish(handle, 'cancelled')
+        while True:
+            with self.__lock:
+                handle = self.__admission.select(
+                    list(self.__queue), [item[0] for item in self.__running])
+                if handle is None:
+                    if self.__running or not self.__queue:
+                        return
+                    handle = self.__queue[0]
+                self.__queue.remove(handle)
+            add_hook(handle.recorder)
+            try:
+                spec = complete_spec(handle.spec)
+                run = make_run(spec)
+                output_path = run.output_path
+                if not prepare_run(run, spec):
+                    self.__finish(handle, 'skipped', spec=spec,
+                                   output_path=output_path)
+                    continue
+                if self.__on_prepared is not None:
+                    self.__on_prepared(handle, spec)
+                cache = make_cache(spec)
+                if cache is not None and cache.load(run.input_path,
+                                                    output_path,
+                                                    spec['run_id']):
+                    self.__finish(handle, 'done', spec=spec, cached=True,
+                                   output_path=output_path)
+                    continue
+                process = run.start()
+            except Exception:
+                self.__finish(handle, 'failed', error=traceback.format_exc())
+                continue
+            handle.status = 'running'
+            start_time = phase_start('execution', spec['sim_name'])
+            with self.__lock:
+                self.__running.append((handle, process, run, spec, cache,
+                                       start_time))
+
+    def __poll_runs(self):
+        for item in list(self.__running):
+            handle, process, run, spec, cache, start_time = item
+            usage = self.__wait_usage(process)
+            return_code = None if usage is None else process.returncode
+            status = None
+            error = None
+            if return_code is not None:
+                if return_code == 0:
+                    status = 'done'
+                    if cache is not None:
+                        try:
+                            cache.store(run.input_path, run.output_path,
+                                        spec['run_id'])
+                        except (IOError, OSError):
+                            pass
+                else:
+                    status = 'failed'
+                    error = 'MASTER exited with code {}'.format(return_code)
+            elif handle.cancelled():
+                kill_process_tree(process)
+                status = 'cancelled'
+            elif (handle.timeout is not None and
+                  time.time() - start_time > handle.timeout):
+                kill_process_tree(process)
+                status = 'timeout'
+                error = 'Run stopped after {} s'.format(handle.timeout)
+            if status is not None:
+                phase_end('execution', spec['sim_name'], start_time)
+                with self.__lock:
+                    self.__running.remove(item)
+                usage = dict(usage or {})
+                usage['wall_time'] = time.time() - start_time
+                self.__finish(handle, status, spec=spec, error=error,
+                              output_path=run.output_path, usage=usage)
+
+    def __finish(self, handle, status, **items):
+        handle._finish(status, **items)
+        self.__admission.on_finished(handle)
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+import numpy as np
+
+from master_batch import run_batch
+from master_epochs import decimal_year, format_epoch, parse_epoch
+from master_output import OutputTable, read_run
+
+# default length of the analysis windows of the runs, in years
+PERIOD_DEFAULT = 1
+
+
+def window(date, period):
+    """Returns the bounds of the analysis window of period years containing
+    a date. The windows start on the 1st of January of the years multiple of
+    period."""
+    year = date.year - date.year % period
+    return (datetime.datetime(year, 1, 1),
+            datetime.datetime(year + period, 1, 1))
+
+
+def mission_pieces(segments, period=PERIOD_DEFAULT):
+    """Splits the segments of a mission profile on the bounds of the analysis
+    windows.
+
+    Inputs
+    ------
+    - segments (list):
+        the segments of the mission, as dicts with the 'orbit' (sma, ecc,
+        inc, raan, aop) and the 'begin_epoch' and 'end_epoch' of the segment
+        in the form YEAR/MONTH/DAY/HOUR. The segments cannot overlap.
+    - period (int):
+        the length of the analysis windows in years. The flux of an orbit is
+        taken as its mean flux over the window, so that the same orbit flown
+        in several phases of a window is run once. If None every piece is
+        run over its own interval, and only the segments with the same orbit
+        and the same interval are run once.
+
+    Returns
+    -------
+    - pieces (list):
+        the 'segment' index, 'orbit', analysis 'window' (begin_epoch,
+        end_epoch) and 'duration' in years of every piece.
+    """
+    intervals = sorted((parse_epoch(segment['begin_epoch']),
+                        parse_epoch(segment['end_epoch']), i)
+                       for i, segment in enumerate(segments))
+    for (begin, end, i), (next_begin, _, j) in zip(intervals[:-1],
+                                                     intervals[1:]):
+        if next_begin < end:
+            raise ValueError("The segments {} and {} overlap.".format(i, j))
+    pieces = []
+    for begin, end, i in intervals:
+        if end <= begin:
+            raise ValueError("The segment {} does not end after its "
+                             "beginning.".format(i))
+        orbit = [float(item) for item in segments[i]['orbit']]
+        start = begin
+        while start < end:
+            if period is None:
+                bounds = (begin, end)
+                stop = end
+            else:
+                bounds = window(start, period)
+                stop = min(end, bounds[1])
+            pieces.append({
+                'segment': i,
+                'orbit': orbit,
+                'window': tuple(format_epoch(item) for item in bounds),
+                'duration': (decimal_year(format_epoch(stop)) -
+                             decimal_year(format_epoch(start)))})
+            start = stop
+    return pieces
+
+
+def mission_specs(spec, pieces):
+    """Returns the run specifications of the distinct runs of a mission: one
+    per orbit and analysis window. Every run has its own folder ('sim_name'
+    followed by the run index) and keeps the run identifier, so that the
+    output files of all runs have the same names.
+
+    Returns
+    -------
+    - specs (list):
+        the run specifications. 'pieces' lists the indices of the pieces
+        each run is used for.
+    """
+    specs = []
+    runs = {}
+    for k, piece in enumerate(pieces):
+        key = (tuple(piece['orbit']), piece['window'])
+        if key not in runs:
+            run_spec = dict(spec)
+            run_spec.update({'sim_name': '{}_p{:03d}'.format(
+                                 spec['sim_name'], len(specs)),
+                             'orbit': piece['orbit'],
+                             'begin_epoch': piece['window'][0],
+                             'end_epoch': piece['window'][1],
+                             'pieces': []})
+            runs[key] = run_spec
+            specs.append(run_spec)
+        runs[key]['pieces'].append(k)
+    return specs
+
+
+def fluence_table(tables, durations, area=1.0):
+    """Integrates the same flux table of several runs over time.
+
+    Inputs
+    ------
+    - tables (list):
+        the OutputTable of each run, with fluxes in 1/m^2/yr.
+    - durations (list):
+        the time spent on the orbit of each run, in years.
+    - area (float):
+        the cross-section of the spacecraft in m^2, which turns the fluence
+        into a number of impacts.
+
+    Returns
+    -------
+    - table (OutputTable):
+        the number of impacts per m^2, times area.
+    """
+    first = tables[0]
+    n_axes = max(1, len(first.distributions))
+    for table in tables[1:]:
+        if (table.data.shape != first.data.shape or
+                not np.allclose(table.data[:, :n_axes],
+                                first.data[:, :n_axes])):
+            raise ValueError("The tables {} and {} cannot be integrated "
+                             "together.".format(first.filename,
+                                                table.filename))
+    values = np.array([table.data[:, n_axes:] for table in tables])
+    fluence = np.tensordot(np.asarray(durations, dtype=float) * area, values,
+                           axes=1)
+    return OutputTable(first.filename, first.header,
+                       np.column_stack([first.data[:, :n_axes], fluence]))
+
+
+def integrate_mission(pieces, specs, results, area=1.0):
+    """Integrates the outputs of the runs of a mission (see mission_specs)
+    over the mission.
+
+    Returns
+    -------
+    - tables (dict):
+        the number of impacts over the whole mission of each output file, by
+        file name (see fluence_table).
+    - segments (dict):
+        the same tables for each segment, by segment index. They are the
+        increments of the cumulative number of impacts along the mission.
+    """
+    by_name = dict((result['sim_name'], result) for result in results)
+    failed = [spec['sim_name'] for spec in specs
+              if by_name.get(spec['sim_name'], {}).get('status') != 'done']
+    if failed:
+        raise RuntimeError("The runs {} failed.".format(', '.join(failed)))
+    piece_tables = [None] * len(pieces)
+    for spec in specs:
+        result = by_name[spec['sim_name']]
+        tables = read_run(result['output_path'], result['spec']['run_id'])
+        for k in spec['pieces']:
+            piece_tables[k] = tables
+    names = sorted(piece_tables[0])
+    durations = [piece['duration'] for piece in pieces]
+    tables = dict((name, fluence_table([item[name] for item in piece_tables],
+                                       durations, area))
+                  for name in names)
+    segments = {}
+    for i in sorted(set(piece['segment'] for piece in pieces)):
+        ks = [k for k, piece in enumerate(pieces) if piece['segment'] == i]
+        segments[i] = dict((name, fluence_table(
+            [piece_tables[k][name] for k in ks],
+            [durations[k] for k in ks], area)) for name in names)
+    return tables, segments
+
+
+def run_mission(spec, segments, period=PERIOD_DEFAULT, area=1.0,
+                processes=None):
+    """Computes the number of impacts over a mission made of several orbit
+    segments (e.g. parking orbit, orbit raising, operational orbit, disposal).
+
+    Each distinct orbit is run once per analysis window (see mission_pieces)
+    and the runs are executed in parallel. With a 'cache_path' in spec the
+    runs already made by earlier missions are reused (see
+    master_cache.ResultCache).
+
+    Inputs
+    ------
+    - spec (dict):
+        the entries common to all the runs (see master_batch.complete_spec),
+        with the 'sim_name' of the mission. 'orbit' and the epochs are taken
+        from the segments.
+    - segments (list):
+        the segments of the mission (see mission_pieces).
+    - period (int):
+        the length of the analysis windows in years.
+    - area (float):
+        the cross-section of the spacecraft in m^2.
+    - processes (int):
+        maximum number of runs executed at the same time.
+
+    Returns
+    -------
+    - tables (dict), segments (dict):
+        the impacts over the mission and over each segment (see
+        integrate_mission).
+    - results (list):
+        the results of the runs (see master_batch.run_simulation).
+
+    Example
+    -------
+        tables, by_segment, results = run_mission(
+            {'sim_name': 'mission', 'path': 'C:/results'},
+            [{'orbit': [6778., 0., 51.6, 0., 0.],
+              'begin_epoch': '2020/01/01/00', 'end_epoch': '2020/03/01/00'},
+             {'orbit': [7078., 0., 51.6, 0., 0.],
+              'begin_epoch': '2020/03/01/00', 'end_epoch': '2024/01/01/00'}],
+            area=12.5)
+    """
+    pieces = mission_pieces(segments, period)
+    specs = mission_specs(spec, pieces)
+    results = list(run_batch(specs, processes))
+    tables, by_segment = integrate_mission(pieces, specs, results, area)
+    return tables, by_segment, results
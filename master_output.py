@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+import array
+import os
+import re
+
+import numpy as np
+
+from master_timing import phase
+
+# names of the 2D distributions, as numbered in default.def
+DISTRIBUTION_NAMES = {1: 'object mass',
+                      2: 'object diameter',
+                      3: 'object semi major axis',
+                      4: 'object perihel radius',
+                      5: 'object eccentricity',
+                      6: 'object inclination',
+                      7: 'object raan',
+                      8: 'impact arg. of true lat.',
+                      9: 'impact velocity',
+                      10: 'impact azimuth angle',
+                      11: 'impact elevation angle',
+                      12: 'impact altitude',
+                      13: 'impact right ascension',
+                      14: 'impact eclipt. longitude',
+                      15: 'impact declination',
+                      16: 'impact eclipt. latitude',
+                      17: 'time',
+                      18: 'ballistic limit',
+                      19: 'conchoidal diameter',
+                      20: 's.d. mass',
+                      21: 's.d. diameter',
+                      22: 's.d. altitude',
+                      23: 's.d. declination',
+                      24: 's.d. right ascension',
+                      25: 's.d. time',
+                      26: 'surface normal velocity',
+                      27: 'surface impact angle'}
+
+# spectrum types, searched in this order in the header of the files
+SPECTRUM_KINDS = [('reverse cumulative', 'reverse_cumulative'),
+                  ('cumulative', 'cumulative'),
+                  ('differential', 'differential')]
+
+# extension of the binary copy of the parsed data
+CACHE_EXTENSION = '.npy'
+
+_FORTRAN_EXPONENT = re.compile(r'(?<=[0-9.])[dD](?=[-+0-9])')
+
+
+class OutputTable(object):
+    """Numeric table read from a MASTER output file.
+
+    Attributes
+    ----------
+    filename [str]:
+        the file the table was read from.
+    header [list]:
+        the comment lines at the top of the file.
+    columns [list]:
+        the label of each column.
+    data [numpy.ndarray]:
+        the values, one row per line of the file.
+    kind [str]:
+        'differential', 'cumulative', 'reverse_cumulative' or None.
+    distributions [list]:
+        the numbers of the distributions in default.def the table refers to
+        (one for 2D distributions, two for 3D distributions).
+    """
+    def __init__(self, filename, header, data):
+        self.filename = filename
+        self.header = header
+        self.data = data
+        self.columns = column_labels(header, data.shape[1])
+        self.kind = spectrum_kind(header)
+        self.distributions = distribution_numbers(header)
+
+    def __getitem__(self, label):
+        """Returns a column selected by label or by index."""
+        if not isinstance(label, int):
+            label = self.columns.index(label)
+        return self.data[:, label]
+
+    @property
+    def axis(self):
+        """The values of the independent variable (first column)."""
+        return self.data[:, 0]
+
+    def grid(self, column=-1):
+        """Returns a 3D distribution as a grid.
+
+        Returns
+        -------
+        - x, y [numpy.ndarray]:
+            the values of the two independent variables (first two columns).
+        - values [numpy.ndarray]:
+            the values of the selected column, with shape (len(x), len(y)).
+        """
+        x, i = np.unique(self.data[:, 0], return_inverse=True)
+        y, j = np.unique(self.data[:, 1], return_inverse=True)
+        values = np.zeros((len(x), len(y)))
+        values[i, j] = self.data[:, column]
+        return x, y, values
+
+
+def read_header(filename):
+    """Returns the comment lines at the top of an output file."""
+    header = []
+    with open(filename, 'r') as f_in:
+        for line in f_in:
+            stripped = line.strip()
+            if stripped and not stripped.startswith('#'):
+                break
+            if stripped:
+                header.append(stripped)
+    return header
+
+
+def read_data(filename):
+    """Parses the numeric lines of an output file into a 2D array.
+
+    The file is read line by line and the values are collected in a compact
+    buffer, so that the text of large files is never kept in memory.
+    """
+    values = array.array('d')
+    n_columns = None
+    n_rows = 0
+    with open(filename, 'r') as f_in:
+        for line in f_in:
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            row = _FORTRAN_EXPONENT.sub('e', stripped).split()
+            if n_columns is None:
+                n_columns = len(row)
+            elif len(row) != n_columns:
+                raise ValueError("Line {} of {} has {} values instead of "
+                                 "{}.".format(n_rows + 1, filename, len(row),
+                                              n_columns))
+            values.extend(float(item) for item in row)
+            n_rows += 1
+    if n_columns is None:
+        return np.zeros((0, 0))
+    return np.frombuffer(values, dtype=float).reshape(n_rows, n_columns)
+
+
+def read_output(filename, cache=False):
+    """Reads a MASTER output file.
+
+    Inputs
+    ------
+    - filename (str):
+        the path to the output file.
+    - cache (bool):
+        if True, the parsed data is saved in a binary file next to the output
+        file (with extension CACHE_EXTENSION) and memory-mapped when the file
+        is read again.
+
+    Returns
+    -------
+    - table (OutputTable)
+    """
+    header = read_header(filename)
+    if not cache:
+        return OutputTable(filename, header, read_data(filename))
+    cache_file = filename + CACHE_EXTENSION
+    if (os.path.isfile(cache_file) and
+            os.path.getmtime(cache_file) >= os.path.getmtime(filename)):
+        data = np.load(cache_file, mmap_mode='r')
+    else:
+        data = read_data(filename)
+        np.save(cache_file, data)
+    return OutputTable(filename, header, data)
+
+
+def find_outputs(output_path, run_id=None):
+    """Returns the output files of a run, sorted by name. If run_id is given
+    only the files starting with the run identifier are returned."""
+    names = []
+    for name in sorted(os.listdir(output_path)):
+        if name.endswith(CACHE_EXTENSION):
+            continue
+        if run_id is not None and not name.startswith(run_id):
+            continue
+        if os.path.isfile('/'.join([output_path, name])):
+            names.append('/'.join([output_path, name]))
+    return names
+
+
+def read_run(output_path, run_id=None, cache=False):
+    """Reads all the numeric output files of a run.
+
+    Returns
+    -------
+    - tables (dict):
+        the OutputTable of each file, by file name. Files without numeric
+        data are skipped.
+    """
+    tables = {}
+    # the run is identified by the name of its folder
+    with phase('parse', os.path.basename(os.path.dirname(output_path))):
+        for filename in find_outputs(output_path, run_id):
+            try:
+                table = read_output(filename, cache)
+            except ValueError:
+                continue
+            if table.data.size:
+                tables[os.path.basename(filename)] = table
+    return tables
+
+
+def column_labels(header, n_columns):
+    """Returns the column labels, taken from the last header line with one
+    label per column. The labels are separated by at least two spaces or by
+    single spaces. Generic labels are used if no line matches."""
+    for line in reversed(header):
+        text = line.lstrip('#').strip()
+        for labels in (re.split(r'\s{2,}', text), text.split()):
+            if len(labels) == n_columns:
+                return labels
+    return ['col{}'.format(i) for i in range(n_columns)]
+
+
+def spectrum_kind(header):
+    """Returns the type of spectrum written in the header, if any."""
+    text = ' '.join(header).lower()
+    for key, kind in SPECTRUM_KINDS:
+        if key in text:
+            return kind
+    return None
+
+
+def distribution_numbers(header):
+    """Returns the numbers of the distributions named in the header, in the
+    order they appear."""
+    text = ' '.join(header).lower()
+    found = []
+    # longer names first, so that e.g. 's.d. time' is not taken as 'time'
+    for number, name in sorted(DISTRIBUTION_NAMES.items(),
+                               key=lambda item: -len(item[1])):
+        match = re.search(r'\b{}(?![\w.])'.format(re.escape(name)), text)
+        if match is not None:
+            found.append((match.start(), number))
+            text = text[:match.start()] + ' ' * len(name) + text[match.end():]
+    return [number for _, number in sorted(found)]
+
+
+def requested_distributions(input_path):
+    """Returns the numbers of the 2D and 3D distributions switched on in the
+    default.def file of a run.
+
+    Returns
+    -------
+    - dist_2d (list):
+        the numbers of the 2D distributions.
+    - dist_3d (list):
+        the (number, first 2D distribution, second 2D distribution) of each
+        3D distribution.
+    """
+    dist_2d = []
+    dist_3d = []
+    with open('/'.join([input_path, 'default.def']), 'r') as f_in:
+        for line in f_in:
+            if line.startswith('#'):
+                continue
+            sl = line.split()
+            if len(sl) >= 7 and sl[1] == '1':
+                dist_2d.append(int(sl[0]))
+            elif len(sl) == 4 and sl[1] == '1':
+                dist_3d.append((int(sl[0]), int(sl[2]), int(sl[3])))
+    return dist_2d, dist_3d
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from master_batch import SPEC_DEFAULT
+from master_output import OutputTable, read_run
+from master_sources import fixed_bins
+
+
+def fine_distributions(distribution_2D, factor):
+    """Returns the 2D distributions with factor times more classes and the
+    automatic Min/Max determination switched off, for runs made once at a
+    fine resolution and rebinned afterwards (see rebin)."""
+    rows = []
+    for row in fixed_bins(distribution_2D):
+        width = float(row[6])
+        if width < 0:
+            width = '{:d}'.format(-int(round(-width * factor)))
+        else:
+            # all the digits, so that the classes of the run are the ones
+            # computed from the row (see class_edges)
+            width = repr(width / factor)
+        rows.append(list(row[:6]) + [width])
+    return rows
+
+
+def fine_spec(spec, factor):
+    """Returns the run specification of a run made at a fine resolution,
+    whose histograms can be rebinned to any coarser classes."""
+    fine = dict(spec)
+    fine['distribution_2D'] = fine_distributions(
+        spec.get('distribution_2D', SPEC_DEFAULT['distribution_2D']), factor)
+    return fine
+
+
+def class_edges(log, lower, upper, width):
+    """Returns the edges of the classes of a distribution defined as in
+    default.def: width is the width of the classes (in decades on a log
+    scale) if positive, minus the number of classes if negative."""
+    log = int(log)
+    lower = float(lower)
+    upper = float(upper)
+    width = float(width)
+    if log:
+        lower, upper = np.log10(lower), np.log10(upper)
+    if width < 0:
+        n_classes = int(round(-width))
+    else:
+        n_classes = int(np.ceil((upper - lower) / width - 1e-9))
+    edges = np.linspace(lower, upper, max(1, n_classes) + 1)
+    return 10 ** edges if log else edges
+
+
+def centre_edges(centres, log):
+    """Returns the edges of the classes with the given centres (arithmetic
+    centres, or geometric centres on a log scale)."""
+    centres = np.asarray(centres, dtype=float)
+    if len(centres) < 2:
+        raise ValueError("The edges of a single class are not known.")
+    x = np.log10(centres) if log else centres
+    middle = 0.5 * (x[1:] + x[:-1])
+    edges = np.concatenate([[2 * x[0] - middle[0]], middle,
+                            [2 * x[-1] - middle[-1]]])
+    return 10 ** edges if log else edges
+
+
+def class_index(edges, log, centres):
+    """Returns the index of the class of each centre. The centres must lie
+    inside the classes."""
+    x = np.log10(edges) if log else np.asarray(edges, dtype=float)
+    c = np.log10(centres) if log else np.asarray(centres, dtype=float)
+    index = np.searchsorted(x, c, side='right') - 1
+    if np.any((index < 0) | (index >= len(x) - 1)):
+        raise ValueError("Some classes of the table are outside the "
+                         "distribution.")
+    return index
+
+
+def overlap_matrix(old_edges, new_edges, log):
+    """Returns the matrix that moves the content of the old classes into the
+    new classes, assuming a uniform content inside each old class (uniform
+    in logarithm on a log scale). Element (i, j) is the fraction of old class
+    j inside new class i."""
+    old = np.log10(old_edges) if log else np.asarray(old_edges, dtype=float)
+    new = np.log10(new_edges) if log else np.asarray(new_edges, dtype=float)
+    overlap = (np.minimum(new[1:, None], old[None, 1:]) -
+               np.maximum(new[:-1, None], old[None, :-1]))
+    return np.clip(overlap, 0.0, None) / np.diff(old)[None, :]
+
+
+class SparseHistogram(object):
+    """Histogram of a 2D or 3D distribution stored in coordinate format: only
+    the non-empty classes are kept.
+
+    Attributes
+    ----------
+    edges [list]:
+        the edges of the classes along each axis (one axis for 2D
+        distributions, two for 3D distributions).
+    log [list]:
+        True for the axes on a log scale.
+    indices [numpy.ndarray]:
+        the class indices of the non-empty classes, shape (n, n_axes).
+    values [numpy.ndarray]:
+        the content of the non-empty classes, shape (n, n_columns), one
+        column per value column of the output table.
+    """
+    def __init__(self, edges, log, indices, values, columns=None):
+        self.edges = [np.asarray(item, dtype=float) for item in edges]
+        self.log = list(log)
+        self.indices = np.asarray(indices, dtype=int).reshape(
+            -1, len(self.edges))
+        self.values = np.asarray(values, dtype=float).reshape(
+            len(self.indices), -1)
+        self.columns = columns
+
+    @property
+    def shape(self):
+        return tuple(len(item) - 1 for item in self.edges)
+
+    @classmethod
+    def from_dense(cls, edges, log, dense, columns=None):
+        """Builds the histogram from an array with shape (classes along each
+        axis..., columns)."""
+        dense = np.asarray(dense, dtype=float)
+        nonzero = np.argwhere(np.any(dense != 0, axis=-1))
+        return cls(edges, log, nonzero, dense[tuple(nonzero.T)], columns)
+
+    @classmethod
+    def from_table(cls, table, distribution_2D):
+        """Builds the histogram of a differential spectrum or of a 3D
+        distribution (see master_output.OutputTable).
+
+        Inputs
+        ------
+        - table (OutputTable)
+        - distribution_2D (list):
+            the 2D distributions of the run (rows of default.def), which give
+            the scale and the classes of each axis (see class_edges). The
+            classes of a distribution with the automatic Min/Max
+            determination switched on are not known in advance: they are
+            taken halfway between the centres found in the table (see
+            centre_edges), which is exact for evenly spaced classes only.
+        """
+        if table.kind in ('cumulative', 'reverse_cumulative'):
+            raise ValueError("Cumulative spectra cannot be rebinned, rebin "
+                             "the differential spectrum instead.")
+        rows = dict((int(row[0]), row) for row in distribution_2D)
+        n_axes = max(1, len(table.distributions))
+        if len(table.distributions) != n_axes or any(
+                number not in rows for number in table.distributions):
+            raise ValueError("The distributions of {} are not in "
+                             "distribution_2D.".format(table.filename))
+        edges = []
+        log = []
+        indices = []
+        for k, number in enumerate(table.distributions):
+            row = rows[number]
+            log.append(bool(int(row[2])))
+            if int(row[3]):
+                edges.append(centre_edges(np.unique(table.data[:, k]),
+                                          log[k]))
+            else:
+                edges.append(class_edges(row[2], row[4], row[5], row[6]))
+            indices.append(class_index(edges[k], log[k], table.data[:, k]))
+        return cls(edges, log, np.column_stack(indices),
+                   table.data[:, n_axes:], table.columns[n_axes:]).compress()
+
+    def compress(self):
+        """Removes the empty classes and merges duplicated classes."""
+        if not len(self.indices):
+            return self
+        flat = np.ravel_multi_index(self.indices.T, self.shape)
+        unique, inverse = np.unique(flat, return_inverse=True)
+        values = np.zeros((len(unique), self.values.shape[1]))
+        np.add.at(values, inverse, self.values)
+        keep = np.any(values != 0, axis=1)
+        indices = np.column_stack(np.unravel_index(unique[keep], self.shape))
+        return SparseHistogram(self.edges, self.log, indices, values[keep],
+                               self.columns)
+
+    def dense(self):
+        """Returns the histogram as an array with shape (classes along each
+        axis..., columns)."""
+        dense = np.zeros(self.shape + (self.values.shape[1],))
+        dense[tuple(self.indices.T)] = self.values
+        return dense
+
+    def centres(self, axis=0):
+        edges = self.edges[axis]
+        if self.log[axis]:
+            return np.sqrt(edges[1:] * edges[:-1])
+        return 0.5 * (edges[1:] + edges[:-1])
+
+    def rebin(self, edges):
+        """Returns the histogram with new classes.
+
+        Inputs
+        ------
+        - edges (list):
+            the new edges along each axis (see class_edges), None to keep an
+            axis. The content of an old class is split among the new classes
+            in proportion to their overlap, so the rebinning is exact when
+            the new edges are a subset of the old ones.
+        """
+        new_edges = [old if new is None else np.asarray(new, dtype=float)
+                     for old, new in zip(self.edges, edges)]
+        matrices = [overlap_matrix(old, new, item) for old, new, item in
+                    zip(self.edges, new_edges, self.log)]
+        # each non-empty class is spread on the new classes of every axis
+        rows = matrices[0][:, self.indices[:, 0]]
+        if len(matrices) == 1:
+            dense = rows.dot(self.values)
+        else:
+            columns = matrices[1][:, self.indices[:, 1]].T
+            dense = np.dstack([(rows * values).dot(columns)
+                               for values in self.values.T])
+        return SparseHistogram.from_dense(new_edges, self.log, dense,
+                                          self.columns)
+
+    def to_table(self, template):
+        """Returns the histogram as an OutputTable with the header of the
+        table it was built from, one line per class (including the empty
+        ones), in the order of the MASTER output files."""
+        dense = self.dense()
+        if len(self.edges) == 1:
+            data = np.column_stack([self.centres(0), dense])
+        else:
+            x, y = np.meshgrid(self.centres(0), self.centres(1),
+                               indexing='ij')
+            data = np.column_stack([x.ravel(), y.ravel(),
+                                    dense.reshape(-1, dense.shape[-1])])
+        return OutputTable(template.filename, template.header, data)
+
+
+def histograms(tables, distribution_2D):
+    """Returns the histograms of the differential spectra and of the 3D
+    distributions of a run (see master_output.read_run), by file name.
+
+    Inputs
+    ------
+    - tables (dict):
+        the tables of the run.
+    - distribution_2D (list):
+        the 2D distributions of the run, which give the classes of each axis
+        (see SparseHistogram.from_table).
+    """
+    numbers = set(int(row[0]) for row in distribution_2D)
+    result = {}
+    for name, table in tables.items():
+        if table.kind in ('cumulative', 'reverse_cumulative'):
+            continue
+        if not table.distributions or any(number not in numbers for number
+                                          in table.distributions):
+            continue
+        result[name] = SparseHistogram.from_table(table, distribution_2D)
+    return result
+
+
+def run_histograms(output_path, run_id, distribution_2D, filename=None):
+    """Returns the histograms of a run (see histograms) and saves them in
+    filename if given, so that the output files are no longer needed."""
+    result = histograms(read_run(output_path, run_id), distribution_2D)
+    if filename is not None:
+        save_histograms(filename, result)
+    return result
+
+
+def save_histograms(filename, histograms):
+    """Saves histograms, by name, in a .npz file."""
+    arrays = {}
+    for name, histogram in histograms.items():
+        for k, edges in enumerate(histogram.edges):
+            arrays['{}/edges{}'.format(name, k)] = edges
+        arrays[name + '/log'] = np.array(histogram.log, dtype=bool)
+        arrays[name + '/indices'] = histogram.indices
+        arrays[name + '/values'] = histogram.values
+        arrays[name + '/columns'] = np.array(histogram.columns or [])
+    np.savez(filename, **arrays)
+
+
+def load_histograms(filename):
+    """Returns the histograms saved with save_histograms, by name."""
+    result = {}
+    arrays = np.load(filename)
+    try:
+        names = set(key.rsplit('/', 1)[0] for key in arrays.files)
+        for name in names:
+            log = list(arrays[name + '/log'])
+            edges = [arrays['{}/edges{}'.format(name, k)]
+                     for k in range(len(log))]
+            columns = [str(item) for item in arrays[name + '/columns']]
+            result[name] = SparseHistogram(edges, log,
+                                           arrays[name + '/indices'],
+                                           arrays[name + '/values'],
+                                           columns or None)
+    finally:
+        arrays.close()
+    return result
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+import json
+import math
+import multiprocessing
+import os
+import threading
+
+import numpy as np
+
+from master_batch import complete_spec, validate_batch
+from master_epochs import parse_epoch
+from master_launcher import MasterLauncher
+from utils import print_warning
+
+# default prior of the cost model (see CostModel): CPU time in seconds of a
+# one-year run and peak resident memory in bytes, when nothing has been
+# measured yet
+DEFAULT_CPU_TIME = 600.0
+DEFAULT_PEAK_RSS = 512 * 2 ** 20
+# the memory reserved for a run is its predicted peak times this margin
+MEMORY_MARGIN = 1.25
+# default weight of the prior in the fit of the cost model, in number of runs
+PRIOR_WEIGHT = 1.0
+FEATURES = ['intercept', 'log_days', 'n_sources', 'n_outputs', 'mode_2',
+            'mode_3']
+
+
+def run_features(spec):
+    """Returns the parameters of a complete run specification that drive its
+    cost, as a vector (see FEATURES): the length of the analysis interval,
+    the number of enabled sources and of output products, and the analysis
+    mode."""
+    days = (parse_epoch(spec['end_epoch']) -
+            parse_epoch(spec['begin_epoch'])).total_seconds() / 86400.0
+    if spec['products'] is not None:
+        n_outputs = len(spec['products'])
+    else:
+        n_outputs = sum(int(row[1]) for row in spec['distribution_2D'] +
+                        spec['distribution_3D'])
+    mode = int(spec['analysis_mode'])
+    return np.array([1.0, math.log1p(max(days, 0.0)),
+                     sum(int(item) for item in spec['switches']),
+                     n_outputs, mode == 2, mode == 3], dtype=float)
+
+
+class UsageMonitor(object):
+    """wait_usage of a MasterLauncher (see master_launcher.MasterLauncher)
+    that measures the resources of the runs.
+
+    The process is sampled from /proc at every poll, before Popen.poll reaps
+    it, so that its exit status stays with subprocess.Popen. The usage has
+    the 'cpu_time' (user and system, in seconds, including the children the
+    process waited for) and the 'peak_rss' (bytes) of the process. The
+    measurements are None where /proc is not available (Windows, macOS).
+    """
+    def __init__(self):
+        self.__samples = {}
+
+    def __call__(self, process):
+        sample = self.__samples.setdefault(process.pid, {'cpu_time': None,
+                                                         'peak_rss': None})
+        self.__sample(process.pid, sample)
+        if process.poll() is None:
+            return None
+        return self.__samples.pop(process.pid)
+
+    @staticmethod
+    def __sample(pid, sample):
+        try:
+            with open('/proc/{}/stat'.format(pid), 'r') as f_in:
+                # the fields after the command, which may contain spaces
+                fields = f_in.read().rsplit(')', 1)[1].split()
+            with open('/proc/{}/status'.format(pid), 'r') as f_in:
+                status = f_in.readlines()
+        except (IOError, OSError, IndexError):
+            return
+        # utime, stime, cutime and cstime, in clock ticks
+        ticks = sum(int(item) for item in fields[11:15])
+        sample['cpu_time'] = ticks / float(os.sysconf('SC_CLK_TCK'))
+        for line in status:
+            # VmHWM is missing once the process has exited
+            if line.startswith('VmHWM:'):
+                sample['peak_rss'] = int(line.split()[1]) * 1024
+
+
+class BudgetAdmission(object):
+    """Admission policy of a MasterLauncher (see
+    master_launcher.FifoAdmission) that packs the runs against a memory and
+    core budget.
+
+    The most expensive queued run, by predicted CPU time, is started as long
+    as a core is free and the memory reserved for the running runs
+    (predicted peak times MEMORY_MARGIN) stays within the budget; when it
+    does not fit, the most expensive run that fits is started instead. A run
+    larger than the whole budget is started alone. The measured cost of
+    every finished run updates the model and the predictions of the runs
+    still queued.
+
+    Inputs
+    ------
+    - memory (float):
+        the memory available to the runs, in bytes. None for no limit.
+    - cores (int):
+        the maximum number of runs at the same time.
+    - model (CostModel):
+        the cost model.
+    """
+    def __init__(self, memory, cores, model):
+        self.memory = memory
+        self.cores = cores
+        self.model = model
+        self.predicted = {}
+        self.__specs = {}
+        self.__n_runs = None
+
+    def select(self, queued, running):
+        if not queued or len(running) >= self.cores:
+            return None
+        self.__predict(queued)
+        reserved = sum(self.__memory(handle) for handle in running)
+        order = sorted(queued, key=lambda handle:
+                       -self.predicted[handle]['cpu_time'])
+        for handle in order:
+            if (self.memory is None or
+                    reserved + self.__memory(handle) <= self.memory):
+                return handle
+        if running:
+            return None
+        print_warning("The run {} needs about {:.0f} MB, more than the "
+                      "budget.".format(order[0].spec.get('sim_name'),
+                                       self.__memory(order[0]) / 2 ** 20))
+        return order[0]
+
+    def on_finished(self, handle):
+        spec = self.__specs.pop(handle, None)
+        result = handle.result()
+        if (spec is None or result['status'] != 'done' or
+                result.get('cached') or 'usage' not in result):
+            return
+        cpu_time = result['usage'].get('cpu_time')
+        if cpu_time is None:
+            cpu_time = result['usage']['wall_time']
+        peak_rss = result['usage'].get('peak_rss')
+        if peak_rss is None:
+            peak_rss = self.predicted[handle]['peak_rss']
+        self.model.record(result['spec'], cpu_time, peak_rss)
+
+    def __predict(self, queued):
+        new = [handle for handle in queued if handle not in self.__specs]
+        for handle in new:
+            self.__specs[handle] = complete_spec(handle.spec)
+        if not new and self.__n_runs == self.model.n_runs:
+            return
+        # the predictions of all the queued runs follow the model
+        self.__n_runs = self.model.n_runs
+        cpu_time, peak_rss = self.model.predict(
+            [self.__specs[handle] for handle in queued])
+        for k, handle in enumerate(queued):
+            self.predicted[handle] = {'cpu_time': float(cpu_time[k]),
+                                      'peak_rss': float(peak_rss[k])}
+
+    def __memory(self, handle):
+        return self.predicted[handle]['peak_rss'] * MEMORY_MARGIN
+
+
+class CostModel(object):
+    """Prediction of the CPU time and the peak memory of runs from their
+    parameters (see run_features), fitted on the measured runs.
+
+    The logarithm of each cost is a linear function of the features. The fit
+    is a ridge regression around a prior (cpu_time for a one-year run,
+    proportional to the length of the interval, and peak_rss), so that the
+    predictions follow the measurements as they accumulate. Until a few runs
+    have been measured the predictions are close to the prior, which should
+    therefore be set to the typical cost of a run on the machine (e.g.
+    measured with master_benchmark): the default values are a guess for a
+    MASTER-2009 run and can be off by orders of magnitude.
+
+    Inputs
+    ------
+    - filename (str):
+        the file where the measurements are kept, one JSON record per line,
+        so that the model improves from a campaign to the next. None keeps
+        them in memory only.
+    - cpu_time (float):
+        the prior CPU time of a one-year run, in seconds.
+    - peak_rss (float):
+        the prior peak memory of a run, in bytes.
+    - prior_weight (float):
+        the weight of the prior in the fit, in number of runs. A smaller
+        weight follows the first measurements more closely.
+    """
+    def __init__(self, filename=None, cpu_time=DEFAULT_CPU_TIME,
+                 peak_rss=DEFAULT_PEAK_RSS, prior_weight=PRIOR_WEIGHT):
+        self.filename = filename
+        self.cpu_time = cpu_time
+        self.peak_rss = peak_rss
+        self.prior_weight = prior_weight
+        self.__features = []
+        self.__costs = []
+        self.__lock = threading.Lock()
+        self.__weights = None
+        if filename is not None and os.path.isfile(filename):
+            with open(filename, 'r') as f_in:
+                for line in f_in:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.__add(record['features'], record['cpu_time'],
+                               record['peak_rss'])
+
+    @property
+    def n_runs(self):
+        return len(self.__costs)
+
+    def record(self, spec, cpu_time, peak_rss):
+        """Adds the measured cost of a run of a complete specification."""
+        features = [float(item) for item in run_features(spec)]
+        with self.__lock:
+            self.__add(features, cpu_time, peak_rss)
+            if self.filename is not None:
+                with open(self.filename, 'a') as f_out:
+                    f_out.write(json.dumps({'sim_name': spec['sim_name'],
+                                            'features': features,
+                                            'cpu_time': cpu_time,
+                                            'peak_rss': peak_rss}) + '\n')
+
+    def predict(self, specs):
+        """Returns the predicted CPU time (seconds) and peak memory (bytes) of
+        complete run specifications, as two arrays."""
+        features = np.array([run_features(spec) for spec in specs])
+        with self.__lock:
+            if self.__weights is None:
+                self.__weights = self.__fit()
+            weights = self.__weights
+        costs = np.exp(features.dot(weights))
+        return costs[:, 0], costs[:, 1]
+
+    def __add(self, features, cpu_time, peak_rss):
+        self.__features.append(features)
+        self.__costs.append([max(cpu_time, 1e-3), max(peak_rss, 1.0)])
+        self.__weights = None
+
+    def __fit(self):
+        prior = np.zeros((len(FEATURES), 2))
+        prior[0] = [math.log(self.cpu_time) - math.log1p(365.0),
+                    math.log(self.peak_rss)]
+        prior[1, 0] = 1.0
+        if not self.__costs:
+            return prior
+        x = np.array(self.__features)
+        residual = np.log(np.array(self.__costs)) - x.dot(prior)
+        normal = x.T.dot(x) + self.prior_weight * np.eye(len(FEATURES))
+        return prior + np.linalg.solve(normal, x.T.dot(residual))
+
+
+class ResourceScheduler(object):
+    """Executes MASTER runs packed against a memory and core budget.
+
+    The cost of every queued run is predicted with a CostModel and the runs
+    are started most expensive first, which shortens the tail of the
+    campaign (see BudgetAdmission). The runs are executed by a
+    master_launcher.MasterLauncher.
+
+    Inputs
+    ------
+    - memory (float):
+        the memory available to the runs, in bytes. Default value is the
+        physical memory of the machine, when it is known.
+    - cores (int):
+        the maximum number of runs at the same time. Default value is the
+        number of cores.
+    - model (CostModel):
+        the cost model. Default value is a new model kept in memory.
+    - timeout (float):
+        wall-clock timeout of each run in seconds. None for no limit.
+    - poll_interval (float):
+        time in seconds between two checks of the running processes.
+
+    Example
+    -------
+        scheduler = ResourceScheduler(memory=48 * 2 ** 30, cores=16,
+                                      model=CostModel('C:/results/cost.jsonl'))
+        for result in scheduler.run(specs):
+            print result['sim_name'], result['status'], result['usage']
+    """
+    def __init__(self, memory=None, cores=None, model=None, timeout=None,
+                 poll_interval=0.5):
+        if memory is None:
+            memory = physical_memory()
+        self.memory = memory
+        self.cores = cores or multiprocessing.cpu_count()
+        self.model = model if model is not None else CostModel()
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    def run(self, specs, validate=True):
+        """Runs the specifications and returns the results as the runs
+        finish (see master_batch.run_simulation). The results also have the
+        measured 'usage' ('cpu_time', 'peak_rss', 'wall_time') and the
+        'predicted' cost of the run.
+
+        Returns
+        -------
+        - generator of the results.
+        """
+        specs = list(specs)
+        if validate:
+            validate_batch(specs)
+        admission = BudgetAdmission(self.memory, self.cores, self.model)
+        launcher = MasterLauncher(timeout=self.timeout,
+                                  poll_interval=self.poll_interval,
+                                  admission=admission,
+                                  wait_usage=UsageMonitor())
+        try:
+            handles = launcher.submit_batch(specs)
+            for handle in launcher.as_completed(handles):
+                result = handle.result()
+                result['predicted'] = admission.predicted.get(handle)
+                yield result
+        finally:
+            launcher.shutdown(cancel=True)
+
+
+def physical_memory():
+    """Returns the physical memory of the machine in bytes, or None if it is
+    not known."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
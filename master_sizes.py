@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from master_batch import SPEC_DEFAULT, run_batch
+from master_output import OutputTable, read_run
+from master_sources import (DECOMPOSITION_KEYS, add_tables, fixed_bins,
+                            load_tables, save_tables)
+
+# format of the size thresholds written in master.inp
+THRESHOLD_FORMAT = '{:.5e}'
+
+
+def size_bands(lower, upper, n_bands):
+    """Returns the edges of n_bands contiguous size bands, equally spaced in
+    logarithm between lower and upper. The edges are rounded as they are
+    written in master.inp."""
+    edges = np.logspace(np.log10(lower), np.log10(upper), n_bands + 1)
+    return [float(THRESHOLD_FORMAT.format(item)) for item in edges]
+
+
+def band_specs(spec, edges, unit='m', bands=None):
+    """Returns the run specifications of the runs of single size bands.
+
+    Every run analyses the objects between two consecutive edges, runs in
+    its own folder ('sim_name' followed by the band index) and keeps the run
+    identifier, so that the output files of all bands have the same names.
+
+    Inputs
+    ------
+    - spec (dict):
+        the run specification (see master_batch.complete_spec).
+    - edges (list):
+        the edges of the bands (see size_bands).
+    - unit (str):
+        'm' for diameters, 'kg' for masses.
+    - bands (list):
+        the indices of the bands. Default value is all the bands.
+    """
+    if bands is None:
+        bands = range(len(edges) - 1)
+    distribution_2D = spec.get('distribution_2D',
+                               SPEC_DEFAULT['distribution_2D'])
+    specs = []
+    for band in bands:
+        band_spec = dict(spec)
+        band_spec.update({
+            'sim_name': '{}_b{:02d}'.format(spec['sim_name'], band),
+            'size_limits': [THRESHOLD_FORMAT.format(edges[band]),
+                            THRESHOLD_FORMAT.format(edges[band + 1]), unit],
+            'distribution_2D': fixed_bins(distribution_2D),
+            'band': band})
+        specs.append(band_spec)
+    return specs
+
+
+def band_positions(edges, lower, upper):
+    """Returns the positions of the thresholds inside each band, from 0 (lower
+    edge) to 1 (upper edge), measured in logarithm of the size."""
+    log_edges = np.log(edges)
+    width = np.diff(log_edges)
+    start = np.clip((np.log(lower) - log_edges[:-1]) / width, 0.0, 1.0)
+    stop = np.clip((np.log(upper) - log_edges[:-1]) / width, 0.0, 1.0)
+    # thresholds equal to the edges, up to the rounding of the edges
+    for positions in (start, stop):
+        positions[positions < 1e-9] = 0.0
+        positions[positions > 1.0 - 1e-9] = 1.0
+    return start, stop
+
+
+def partial_band(values, neighbour, above, start, stop):
+    """Estimates the part of a band between two positions (see
+    band_positions).
+
+    The values are assumed to follow a power law of the size inside the
+    band, whose exponent is given by the ratio between the band and the next
+    band (above is True) or the previous band. The estimate is linear in
+    logarithm of the size where the ratio is not defined.
+    """
+    values = np.asarray(values, dtype=float)
+    fraction = np.empty(values.shape)
+    fraction.fill(stop - start)
+    if neighbour is not None:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = np.log(neighbour / values)
+            if above:
+                rate = -rate
+            curved = ((np.exp(-rate * start) - np.exp(-rate * stop)) /
+                      (1.0 - np.exp(-rate)))
+            valid = np.isfinite(curved) & (np.abs(rate) > 1e-6)
+        fraction[valid] = np.clip(curved[valid], 0.0, 1.0)
+    return fraction * values
+
+
+class SizeDecomposition(object):
+    """Store of the outputs of contiguous size bands, from which the outputs
+    of any size thresholds inside the bands are obtained by addition.
+
+    All the bands are run once. The bands fully inside the requested
+    thresholds are added exactly. The part of a band crossed by a threshold
+    is interpolated with a power law of the size, fitted on the band and its
+    neighbour (see partial_band). Since the fluxes are not negative, the true
+    contribution of such a band is between zero and the whole band, which
+    gives the error bound returned with the outputs.
+
+    Inputs
+    ------
+    - cache_path (str):
+        the folder of the store. It is created if it does not exist.
+    - edges (list):
+        the edges of the bands (see size_bands).
+    - unit (str):
+        'm' for diameters, 'kg' for masses.
+
+    Example
+    -------
+        sizes = SizeDecomposition('C:/results/sizes',
+                                  size_bands(1e-4, 1e-1, 12))
+        tables, errors = sizes.tables(spec, [2e-4, 1e-2, 'm'])
+    """
+    def __init__(self, cache_path, edges, unit='m'):
+        self.__cache_path = cache_path
+        self.edges = [float(item) for item in edges]
+        self.unit = unit
+        if any(b <= a for a, b in zip(self.edges[:-1], self.edges[1:])):
+            raise ValueError("The edges of the size bands must increase.")
+
+    def key(self, spec):
+        """Returns the hash of the parameters of a run other than the size
+        thresholds, and of the bands."""
+        full_spec = dict(SPEC_DEFAULT)
+        full_spec.update(spec)
+        full_spec['distribution_2D'] = fixed_bins(
+            full_spec['distribution_2D'])
+        values = [full_spec[name] for name in DECOMPOSITION_KEYS
+                  if name != 'size_limits']
+        values += [full_spec['switches'], self.edges, self.unit]
+        return hashlib.sha1(json.dumps(values, sort_keys=True)).hexdigest()
+
+    def missing(self, spec):
+        """Returns the indices of the bands that are not stored."""
+        return [band for band in range(len(self.edges) - 1)
+                if not os.path.isfile(self.__band_file(spec, band))]
+
+    def run(self, spec, processes=None):
+        """Runs in parallel the bands that are not stored yet and stores their
+        outputs.
+
+        Returns
+        -------
+        - results (list):
+            the results of the runs (see master_batch.run_simulation).
+        """
+        results = []
+        specs = band_specs(spec, self.edges, self.unit, self.missing(spec))
+        for result in run_batch(specs, processes):
+            results.append(result)
+            if result['status'] == 'done':
+                save_tables(self.__band_file(spec, result['spec']['band']),
+                            read_run(result['output_path'],
+                                     result['spec']['run_id']))
+        return results
+
+    def tables(self, spec, size_limits, processes=None):
+        """Returns the outputs of a run with the given size thresholds,
+        running first the bands not stored yet (see run).
+
+        Inputs
+        ------
+        - spec (dict):
+            the run specification (see master_batch.complete_spec).
+        - size_limits (list):
+            [lower, upper, unit], inside the edges of the bands and in their
+            unit.
+
+        Returns
+        -------
+        - tables (dict):
+            the OutputTable of each output file, by file name.
+        - errors (dict):
+            the bound of the absolute error of the values of each table, as
+            tables of the same shape. The bound is zero when the thresholds
+            are edges of the bands.
+        """
+        start, stop = self.__positions(size_limits)
+        failed = [result['sim_name'] for result in
+                  self.run(spec, processes)
+                  if result['status'] != 'done']
+        if failed:
+            raise RuntimeError("The runs {} failed.".format(
+                ', '.join(failed)))
+        n_bands = len(self.edges) - 1
+        loaded = [load_tables(self.__band_file(spec, band))
+                  for band in range(n_bands)]
+        bands = np.flatnonzero(stop > start)
+        tables = {}
+        errors = {}
+        for name in loaded[0]:
+            first = loaded[0][name]
+            n_axes = max(1, len(first.distributions))
+            parts = []
+            error = np.zeros(first.data.shape)
+            for band in bands:
+                table = loaded[band][name]
+                data = np.array(table.data, dtype=float)
+                values = data[:, n_axes:]
+                if stop[band] - start[band] < 1.0:
+                    # band crossed by a threshold
+                    above = band + 1 < n_bands
+                    other = band + 1 if above else band - 1
+                    neighbour = None
+                    if other >= 0:
+                        neighbour = loaded[other][name].data[:, n_axes:]
+                    estimate = partial_band(values, neighbour, above,
+                                            start[band], stop[band])
+                    error[:, n_axes:] += np.maximum(
+                        np.abs(estimate), np.abs(values - estimate))
+                    data[:, n_axes:] = estimate
+                parts.append(OutputTable(table.filename, table.header, data))
+            tables[name] = add_tables(parts)
+            error[:, :n_axes] = first.data[:, :n_axes]
+            errors[name] = OutputTable(first.filename, first.header, error)
+        return tables, errors
+
+    def __positions(self, size_limits):
+        lower, upper, unit = size_limits
+        lower = float(lower)
+        upper = float(upper)
+        if unit != self.unit:
+            raise ValueError("The size bands are in '{}', not '{}'.".format(
+                self.unit, unit))
+        if not self.edges[0] <= lower < upper <= self.edges[-1]:
+            raise ValueError("The thresholds {} and {} are not inside the "
+                             "bands ({} to {}).".format(
+                                 lower, upper, self.edges[0], self.edges[-1]))
+        return band_positions(self.edges, lower, upper)
+
+    def __band_file(self, spec, band):
+        return '/'.join([self.__cache_path, self.key(spec),
+                         'band_{:02d}.npz'.format(band)])
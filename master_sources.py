@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from master_batch import SPEC_DEFAULT, run_batch
+from master_output import OutputTable, read_run
+
+# debris sources, in the order of the switches of master.inp
+SOURCES = ['explosion fragments', 'collision fragments',
+           'launch/mission related objects', 'NaK droplets', 'SRM slag',
+           'SRM Al2O3 dust', 'paint flakes', 'ejecta', 'MLI', 'meteoroids',
+           'clouds']
+# entries of a run specification that change the outputs of a source
+DECOMPOSITION_KEYS = ['orbit', 'begin_epoch', 'end_epoch', 'scenario_id',
+                      'size_limits', 'analysis_mode', 'distribution_2D',
+                      'distribution_3D', 'products', 'data_version']
+
+
+def fixed_bins(distribution_2D):
+    """Returns the 2D distributions with the automatic Min/Max determination
+    switched off, so that the bins do not depend on the enabled sources."""
+    return [list(row[:3]) + ['0'] + list(row[4:]) for row in distribution_2D]
+
+
+def source_specs(spec, sources=None):
+    """Returns the run specifications of the runs of single debris sources.
+
+    Every run has one source switched on, runs in its own folder ('sim_name'
+    followed by the source index) and keeps the run identifier, so that the
+    output files of all sources have the same names.
+
+    Inputs
+    ------
+    - spec (dict):
+        the run specification (see master_batch.complete_spec).
+    - sources (list):
+        the indices of the sources (see SOURCES). Default value is all the
+        sources.
+    """
+    if sources is None:
+        sources = range(len(SOURCES))
+    distribution_2D = spec.get('distribution_2D',
+                               SPEC_DEFAULT['distribution_2D'])
+    specs = []
+    for source in sources:
+        source_spec = dict(spec)
+        source_spec.update({
+            'sim_name': '{}_s{:02d}'.format(spec['sim_name'], source),
+            'switches': ['1' if i == source else '0'
+                         for i in range(len(SOURCES))],
+            'distribution_2D': fixed_bins(distribution_2D),
+            'source': source})
+        specs.append(source_spec)
+    return specs
+
+
+def add_tables(tables):
+    """Adds up the same table of runs of disjoint parts of the debris
+    population (e.g. single sources). The independent variables of the tables
+    must be the same."""
+    first = tables[0]
+    n_axes = max(1, len(first.distributions))
+    total = np.array(first.data, dtype=float)
+    for table in tables[1:]:
+        if (table.data.shape != first.data.shape or
+                not np.allclose(table.data[:, :n_axes],
+                                first.data[:, :n_axes])):
+            raise ValueError("The tables {} and {} cannot be added.".format(
+                first.filename, table.filename))
+        total[:, n_axes:] += table.data[:, n_axes:]
+    return OutputTable(first.filename, first.header, total)
+
+
+def save_tables(filename, tables):
+    """Saves output tables (see master_output.read_run) in a .npz file. The
+    file is replaced atomically, so that it can be read by other processes
+    at any time."""
+    folder = os.path.dirname(filename)
+    if not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            if not os.path.isdir(folder):
+                raise
+    arrays = {}
+    for name, table in tables.items():
+        arrays['data/' + name] = np.asarray(table.data)
+        arrays['header/' + name] = np.array(table.header)
+    tmp_filename = '{}.tmp{}.npz'.format(os.path.splitext(filename)[0],
+                                         os.getpid())
+    np.savez(tmp_filename, **arrays)
+    if os.path.isfile(filename):
+        os.remove(filename)
+    os.rename(tmp_filename, filename)
+
+
+def load_tables(filename):
+    """Returns the output tables saved with save_tables, by file name."""
+    tables = {}
+    arrays = np.load(filename)
+    try:
+        for key in arrays.files:
+            if key.startswith('data/'):
+                name = key[len('data/'):]
+                tables[name] = OutputTable(
+                    name, [str(line) for line in arrays['header/' + name]],
+                    arrays[key])
+    finally:
+        arrays.close()
+    return tables
+
+
+class SourceDecomposition(object):
+    """Store of the outputs of the single debris sources, from which the
+    outputs of any combination of source switches are obtained by addition.
+
+    The outputs of each source are stored in a folder named after the hash of
+    the other parameters of the run (see DECOMPOSITION_KEYS), one file per
+    source (source_NN.npz).
+
+    Inputs
+    ------
+    - cache_path (str):
+        the folder of the store. It is created if it does not exist.
+
+    Example
+    -------
+        sources = SourceDecomposition('C:/results/sources')
+        tables = sources.tables(spec, switches=[1, 1, 0, 0, 0, 0, 0, 0, 0,
+                                                1, 0])
+    """
+    def __init__(self, cache_path):
+        self.__cache_path = cache_path
+        if not os.path.isdir(cache_path):
+            try:
+                os.makedirs(cache_path)
+            except OSError:
+                if not os.path.isdir(cache_path):
+                    raise
+
+    def key(self, spec):
+        """Returns the hash of the parameters of a run other than the source
+        switches."""
+        full_spec = dict(SPEC_DEFAULT)
+        full_spec.update(spec)
+        full_spec['distribution_2D'] = fixed_bins(
+            full_spec['distribution_2D'])
+        values = [full_spec[name] for name in DECOMPOSITION_KEYS]
+        return hashlib.sha1(json.dumps(values, sort_keys=True)).hexdigest()
+
+    def missing(self, spec, switches=None):
+        """Returns the indices of the enabled sources that are not stored."""
+        return [source for source in self.__enabled(spec, switches)
+                if not os.path.isfile(self.__source_file(spec, source))]
+
+    def store(self, spec, source, tables):
+        """Stores the tables of a source (see master_output.read_run)."""
+        save_tables(self.__source_file(spec, source), tables)
+
+    def load(self, spec, source):
+        """Returns the stored tables of a source."""
+        return load_tables(self.__source_file(spec, source))
+
+    def run(self, spec, switches=None, processes=None):
+        """Runs in parallel the enabled sources that are not stored yet and
+        stores their outputs.
+
+        Returns
+        -------
+        - results (list):
+            the results of the runs (see master_batch.run_simulation).
+        """
+        results = []
+        for result in run_batch(source_specs(spec, self.missing(spec,
+                                                                switches)),
+                                processes):
+            results.append(result)
+            if result['status'] == 'done':
+                self.store(spec, result['spec']['source'],
+                           read_run(result['output_path'],
+                                    result['spec']['run_id']))
+        return results
+
+    def tables(self, spec, switches=None, processes=None):
+        """Returns the outputs of a run with the given source switches
+        (default value is the switches of spec), running first the sources
+        not stored yet.
+
+        Returns
+        -------
+        - tables (dict):
+            the OutputTable of each output file, by file name.
+        """
+        failed = [result['sim_name'] for result in
+                  self.run(spec, switches, processes)
+                  if result['status'] != 'done']
+        if failed:
+            raise RuntimeError("The runs {} failed.".format(
+                ', '.join(failed)))
+        sources = [self.load(spec, source)
+                   for source in self.__enabled(spec, switches)]
+        if not sources:
+            raise ValueError("No debris source is switched on.")
+        return dict((name, add_tables([tables[name] for tables in sources]))
+                    for name in sources[0])
+
+    def __enabled(self, spec, switches):
+        if switches is None:
+            switches = spec.get('switches', SPEC_DEFAULT['switches'])
+        return [i for i, item in enumerate(switches) if int(item)]
+
+    def __source_file(self, spec, source):
+        return '/'.join([self.__cache_path, self.key(spec),
+                         'source_{:02d}.npz'.format(source)])
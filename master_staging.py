@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+import filecmp
+import hashlib
+import os
+import shutil
+
+
+def update_file(filename, content):
+    """Writes content to a file only if the file does not already have that
+    content. A file shared through a link is replaced instead of being
+    modified, so that the other runs using it are not affected.
+
+    Returns
+    -------
+    - True:
+        if the file has been written.
+    - False:
+        if the file was already up to date.
+    """
+    if os.path.islink(filename) or (os.path.isfile(filename) and
+                                    os.stat(filename).st_nlink > 1):
+        os.remove(filename)
+    elif os.path.isfile(filename) and os.path.getsize(filename) == len(
+            content):
+        with open(filename, 'rb') as f_in:
+            if f_in.read() == content:
+                return False
+    with open(filename, 'wb') as f_out:
+        f_out.write(content)
+    return True
+
+
+def link_file(source, destination):
+    """Links destination to source with a hard link or, if not possible, a
+    symbolic link. The file is copied when links are not supported.
+
+    Returns
+    -------
+    - method (str):
+        'hardlink', 'symlink' or 'copy'.
+    """
+    if os.path.lexists(destination):
+        os.remove(destination)
+    if hasattr(os, 'link'):
+        try:
+            os.link(source, destination)
+            return 'hardlink'
+        except OSError:
+            pass
+    if hasattr(os, 'symlink'):
+        try:
+            os.symlink(os.path.abspath(source), destination)
+            return 'symlink'
+        except OSError:
+            pass
+    shutil.copy(source, destination)
+    return 'copy'
+
+
+class InputStage(object):
+    """Store of the input files shared by many runs.
+
+    Every distinct input file is kept once in the stage folder, named after
+    the hash of its content, and linked into the input folder of the runs.
+    A run folder is only touched when its file differs from the staged one.
+
+    Inputs
+    ------
+    - stage_path (str):
+        the folder of the staged files. It should be on the same file system
+        of the run folders, so that hard links can be used.
+    """
+    def __init__(self, stage_path):
+        self.__stage_path = stage_path
+        # hash of the source files, by (path, size, modification time)
+        self.__hashes = {}
+        if not os.path.isdir(stage_path):
+            try:
+                os.makedirs(stage_path)
+            except OSError:
+                if not os.path.isdir(stage_path):
+                    raise
+
+    @property
+    def stage_path(self):
+        return self.__stage_path
+
+    def stage_file(self, source, destination):
+        """Links destination to the staged copy of the source file."""
+        stat = os.stat(source)
+        key = (os.path.abspath(source), stat.st_size, stat.st_mtime)
+        digest = self.__hashes.get(key)
+        if digest is None:
+            with open(source, 'rb') as f_in:
+                digest = hashlib.sha1(f_in.read()).hexdigest()
+            self.__hashes[key] = digest
+        staged = self.__staged(digest, os.path.basename(destination))
+        if not os.path.isfile(staged):
+            self.__store(staged, source=source)
+        return self.__link(staged, destination)
+
+    def stage_content(self, content, destination):
+        """Links destination to the staged file with the given content."""
+        digest = hashlib.sha1(content).hexdigest()
+        staged = self.__staged(digest, os.path.basename(destination))
+        if not os.path.isfile(staged):
+            self.__store(staged, content=content)
+        return self.__link(staged, destination)
+
+    def __staged(self, digest, name):
+        # the extension is kept for readability of the stage folder
+        return '/'.join([self.__stage_path,
+                         digest + os.path.splitext(name)[1]])
+
+    def __store(self, staged, source=None, content=None):
+        tmp_staged = '{}.tmp{}'.format(staged, os.getpid())
+        if source is not None:
+            shutil.copy(source, tmp_staged)
+        else:
+            with open(tmp_staged, 'wb') as f_out:
+                f_out.write(content)
+        try:
+            os.rename(tmp_staged, staged)
+        except OSError:
+            # staged in the meantime by another process (Windows)
+            os.remove(tmp_staged)
+
+    def __link(self, staged, destination):
+        """Returns True if destination has been (re)linked."""
+        if os.path.lexists(destination):
+            if not hasattr(os.path, 'samefile'):
+                # files are copied where links are not available
+                if filecmp.cmp(staged, destination, shallow=False):
+                    return False
+            else:
+                try:
+                    if os.path.samefile(staged, destination):
+                        return False
+                except OSError:
+                    pass
+        link_file(staged, destination)
+        return True
+
+
+def write_input(filename, content, stage=None):
+    """Writes a generated input file, through the stage if given (see
+    InputStage.stage_content), otherwise with update_file."""
+    if stage is not None:
+        return stage.stage_content(content, filename)
+    return update_file(filename, content)
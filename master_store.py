@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+import bisect
+import json
+import os
+
+import numpy as np
+
+from master_epochs import decimal_year
+from master_output import read_run
+
+# numeric parameter columns, all indexed
+NUMERIC_COLUMNS = ['sma', 'ecc', 'inc', 'raan', 'aop', 'begin', 'end',
+                   'scenario_id', 'analysis_mode', 'switches', 'size_lower',
+                   'size_upper', 'size_unit']
+# text columns; the distributions are stored as JSON
+TEXT_COLUMNS = ['sim_name', 'run_id', 'output_path', 'distribution_2D',
+                'distribution_3D']
+SIZE_UNITS = ['m', 'kg']
+# number of runs per chunk
+CHUNK_ROWS = 1000
+STORE_INFO = 'store.json'
+
+
+def switches_mask(switches):
+    """Encodes the eleven source switches as an integer (bit i is switch i).
+    """
+    return sum(int(item) << i for i, item in enumerate(switches))
+
+
+def spec_row(spec):
+    """Returns the parameter columns of a complete run specification."""
+    orbit = spec['orbit']
+    size_limits = spec['size_limits']
+    row = dict(zip(['sma', 'ecc', 'inc', 'raan', 'aop'],
+                   [float(item) for item in orbit]))
+    row.update({'begin': decimal_year(spec['begin_epoch']),
+                'end': decimal_year(spec['end_epoch']),
+                'scenario_id': int(spec['scenario_id']),
+                'analysis_mode': int(spec['analysis_mode']),
+                'switches': switches_mask(spec['switches']),
+                'size_lower': float(size_limits[0]),
+                'size_upper': float(size_limits[1]),
+                'size_unit': SIZE_UNITS.index(size_limits[2]),
+                'sim_name': spec['sim_name'],
+                'run_id': spec['run_id'],
+                'distribution_2D': json.dumps(spec['distribution_2D']),
+                'distribution_3D': json.dumps(spec['distribution_3D'])})
+    return row
+
+
+class ResultStore(object):
+    """Persistent columnar store of the parameters and outputs of completed
+    runs.
+
+    The parameters are kept column by column in chunks of CHUNK_ROWS runs
+    (params_NNNNN.npz) next to the parsed output arrays of the same runs
+    (arrays_NNNNN.npz) and the sorted order of the chunk along every numeric
+    column (index_NNNNN.npz). The first row of every chunk is kept in
+    store.json. Range queries are answered with binary searches in the index
+    of each chunk, without reading the output arrays or the run folders.
+
+    The runs added since the last chunk are kept in memory and are part of
+    every answer. They are written when CHUNK_ROWS runs are pending and by
+    flush or close, which must be called before the store is dropped.
+
+    Inputs
+    ------
+    - store_path (str):
+        the folder of the store. It is created if it does not exist.
+
+    Example
+    -------
+        store = ResultStore('C:/results/store')
+        for result in run_batch(specs):
+            if result['status'] == 'done':
+                store.add_result(result)
+        rows = store.query(inc=(50, 60), scenario_id=1)
+        store.close()
+    """
+    def __init__(self, store_path):
+        self.__store_path = store_path
+        self.__pending = []
+        self.__pending_arrays = []
+        if not os.path.isdir(store_path):
+            os.makedirs(store_path)
+        info = '/'.join([store_path, STORE_INFO])
+        if os.path.isfile(info):
+            with open(info, 'r') as f_in:
+                self.__info = json.load(f_in)
+        else:
+            self.__info = {'chunks': 0, 'rows': 0}
+        self.__load_chunks()
+        if 'offsets' not in self.__info:
+            lengths = [len(chunk[NUMERIC_COLUMNS[0]])
+                       for chunk in self.__chunks]
+            self.__info['offsets'] = [int(item) for item in
+                                      np.cumsum([0] + lengths)[:-1]]
+
+    def __len__(self):
+        return self.__info['rows'] + len(self.__pending)
+
+    def add(self, spec, tables, output_path=None):
+        """Adds a run. The runs are written to disk by chunks of CHUNK_ROWS
+        (see flush).
+
+        Inputs
+        ------
+        - spec (dict):
+            the complete run specification (see master_batch.complete_spec).
+        - tables (dict):
+            the OutputTable of each output file (see master_output.read_run).
+        - output_path (str):
+            the output folder of the run.
+        """
+        row = spec_row(spec)
+        row['output_path'] = output_path or ''
+        self.__pending.append(row)
+        self.__pending_arrays.append(dict((name, np.asarray(table.data))
+                                          for name, table in tables.items()))
+        if len(self.__pending) >= CHUNK_ROWS:
+            self.flush()
+
+    def add_result(self, result):
+        """Adds a completed run from its result (see
+        master_batch.run_simulation)."""
+        spec = result['spec']
+        self.add(spec, read_run(result['output_path'], spec['run_id']),
+                 result['output_path'])
+
+    def flush(self):
+        """Writes the pending runs as a new chunk with its index."""
+        if not self.__pending:
+            return
+        chunk = self.__info['chunks']
+        columns = self.__pending_columns()
+        np.savez(self.__chunk_file('params', chunk), **columns)
+        arrays = {}
+        for i, tables in enumerate(self.__pending_arrays):
+            for name, data in tables.items():
+                arrays['{}/{}'.format(i, name)] = data
+        np.savez(self.__chunk_file('arrays', chunk), **arrays)
+        self.__add_chunk(columns, self.__save_index(chunk, columns),
+                         self.__info['rows'])
+        # store.json is written last: a chunk is part of the store only once
+        # it is listed there
+        self.__info['offsets'].append(self.__info['rows'])
+        self.__info['chunks'] += 1
+        self.__info['rows'] += len(self.__pending)
+        info = '/'.join([self.__store_path, STORE_INFO])
+        tmp_info = '{}.tmp{}'.format(info, os.getpid())
+        with open(tmp_info, 'w') as f_out:
+            json.dump(self.__info, f_out)
+        if os.path.isfile(info):
+            os.remove(info)
+        os.rename(tmp_info, info)
+        self.__pending = []
+        self.__pending_arrays = []
+
+    def close(self):
+        """Writes the pending runs (see flush)."""
+        self.flush()
+
+    def query(self, **conditions):
+        """Returns the rows of the runs matching all the conditions.
+
+        Each keyword is a numeric column and its value is either a
+        (lower, upper) range, with bounds included, or a single value. The
+        switches can be given as a list of eleven switches. The epochs
+        ('begin' and 'end') are decimal years.
+
+        Example
+        -------
+            rows = store.query(inc=(50, 60), scenario_id=1)
+
+        Returns
+        -------
+        - rows (numpy.ndarray)
+        """
+        pending = self.__pending_columns()
+        rows = None
+        for name, value in conditions.items():
+            if name not in NUMERIC_COLUMNS:
+                raise KeyError("Column '{}' is not indexed.".format(name))
+            if name == 'switches' and isinstance(value, (list, tuple)):
+                value = switches_mask(value)
+            if isinstance(value, (list, tuple)):
+                lower, upper = value
+            else:
+                lower = upper = value
+            found = []
+            for order, values in self.__indexes[name]:
+                first = np.searchsorted(values, lower, side='left')
+                last = np.searchsorted(values, upper, side='right')
+                found.append(order[first:last])
+            # the pending runs are few and are scanned
+            found.append(self.__info['rows'] + np.flatnonzero(
+                (pending[name] >= lower) & (pending[name] <= upper)))
+            found = np.concatenate(found).astype(int)
+            rows = found if rows is None else np.intersect1d(rows, found)
+        if rows is None:
+            return np.arange(len(self))
+        return np.sort(rows)
+
+    def params(self, rows=None):
+        """Returns the parameter columns of the given rows (all if None)."""
+        if self.__columns is None:
+            self.__columns = dict(
+                (name, np.concatenate([chunk[name] for chunk in self.__chunks]
+                                      or [empty_column(name)]))
+                for name in NUMERIC_COLUMNS + TEXT_COLUMNS)
+        columns = self.__columns
+        if self.__pending:
+            pending = self.__pending_columns()
+            columns = dict((name, np.concatenate([column, pending[name]]))
+                           for name, column in columns.items())
+        if rows is None:
+            return dict(columns)
+        return dict((name, column[rows]) for name, column in columns.items())
+
+    def tables(self, row):
+        """Returns the output arrays of a run, by file name."""
+        row = int(row)
+        if not 0 <= row < len(self):
+            raise IndexError("Row {} is not in the store ({} rows).".format(
+                row, len(self)))
+        if row >= self.__info['rows']:
+            return dict(self.__pending_arrays[row - self.__info['rows']])
+        chunk = bisect.bisect_right(self.__info['offsets'], row) - 1
+        prefix = '{}/'.format(row - self.__info['offsets'][chunk])
+        arrays = np.load(self.__chunk_file('arrays', chunk))
+        try:
+            return dict((key[len(prefix):], arrays[key])
+                        for key in arrays.files if key.startswith(prefix))
+        finally:
+            arrays.close()
+
+    def __pending_columns(self):
+        columns = {}
+        for name in NUMERIC_COLUMNS:
+            columns[name] = np.array([row[name] for row in self.__pending],
+                                     dtype=float)
+        for name in TEXT_COLUMNS:
+            columns[name] = np.array([row[name] for row in self.__pending],
+                                     dtype=np.unicode_)
+        return columns
+
+    def __chunk_file(self, kind, chunk):
+        return '/'.join([self.__store_path,
+                         '{}_{:05d}.npz'.format(kind, chunk)])
+
+    def __load_chunks(self):
+        self.__chunks = []
+        self.__indexes = dict((name, []) for name in NUMERIC_COLUMNS)
+        self.__columns = None
+        first_row = 0
+        for chunk in range(self.__info['chunks']):
+            params = np.load(self.__chunk_file('params', chunk))
+            try:
+                columns = dict((name, params[name])
+                               for name in NUMERIC_COLUMNS + TEXT_COLUMNS)
+            finally:
+                params.close()
+            self.__add_chunk(columns, self.__load_index(chunk, columns),
+                             first_row)
+            first_row += len(columns[NUMERIC_COLUMNS[0]])
+
+    def __add_chunk(self, columns, index, first_row):
+        self.__chunks.append(columns)
+        self.__columns = None
+        for name in NUMERIC_COLUMNS:
+            order = index[name]
+            self.__indexes[name].append((order + first_row,
+                                         columns[name][order]))
+
+    def __load_index(self, chunk, columns):
+        """Reads the index of a chunk, or builds it if it is missing (e.g.
+        after an interrupted flush)."""
+        filename = self.__chunk_file('index', chunk)
+        if os.path.isfile(filename):
+            saved = np.load(filename)
+            try:
+                return dict((name, saved[name]) for name in NUMERIC_COLUMNS)
+            finally:
+                saved.close()
+        return self.__save_index(chunk, columns)
+
+    def __save_index(self, chunk, columns):
+        index = dict((name, np.argsort(columns[name], kind='mergesort'))
+                     for name in NUMERIC_COLUMNS)
+        np.savez(self.__chunk_file('index', chunk), **index)
+        return index
+
+
+def empty_column(name):
+    """Returns a column of a store without rows."""
+    if name in NUMERIC_COLUMNS:
+        return np.zeros(0)
+    return np.zeros(0, dtype=np.unicode_)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""Stand-in for the MASTER executable, used to benchmark the wrapper on
+machines without a MASTER installation.
+
+The stub is started in the run folder like MASTER: it reads master.cfg, the
+master.inp and default.def files of the run, waits (or keeps the CPU busy)
+for a time drawn from the chosen distribution and writes synthetic spectra
+and distributions in the output folder. The fluxes depend smoothly on the
+target orbit and are the sum of one term per enabled debris source.
+
+Usage:
+    python master_stub.py [--distribution fixed] [--mean 1.0]
+                          [--spread 0.5] [--cpu] [--seed 0]
+"""
+import argparse
+import hashlib
+import math
+import sys
+import time
+
+import numpy as np
+
+from master_input import MasterInputTemplate, SPECTRUM_TYPES
+from master_output import DISTRIBUTION_NAMES
+
+SOURCE_NAMES = ['Expl.', 'Coll.', 'Launch', 'NaK', 'Slag', 'Dust', 'Paint',
+                'Ejecta', 'MLI', 'Meteor.', 'Clouds']
+# relative weight of each debris source in the synthetic fluxes
+SOURCE_WEIGHTS = [1.0, 0.8, 0.2, 0.3, 0.4, 1.5, 2.0, 1.2, 0.1, 2.5, 0.05]
+SPECTRUM_FILES = [('d', 'Differential'), ('c', 'Cumulative'),
+                  ('r', 'Reverse cumulative')]
+MAX_BINS = 200
+# smallest object of the synthetic population (same unit as the thresholds)
+SIZE_REFERENCE = 1e-4
+
+
+def read_config(filename='master.cfg'):
+    """Returns the output, data, cloud data and input paths of master.cfg."""
+    paths = []
+    with open(filename, 'r') as f_in:
+        for line in f_in:
+            if not line.startswith('#') and line.split():
+                paths.append(line.split()[0])
+    return paths[:4]
+
+
+def read_distributions(filename):
+    """Returns the rows of default.def that are switched on, as
+    (number, log, min, max, width) for 2D and (number, spc1, spc2) for 3D
+    distributions."""
+    dist_2d = []
+    dist_3d = []
+    with open(filename, 'r') as f_in:
+        for line in f_in:
+            sl = line.split()
+            if line.startswith('#') or len(sl) < 4 or sl[1] != '1':
+                continue
+            if len(sl) >= 7:
+                dist_2d.append((int(sl[0]), int(sl[2]), float(sl[4]),
+                                float(sl[5]), float(sl[6])))
+            else:
+                dist_3d.append((int(sl[0]), int(sl[2]), int(sl[3])))
+    return dist_2d, dist_3d
+
+
+def bins(log, lower, upper, width):
+    """Returns the centres of the bins of a distribution."""
+    if width < 0:
+        n_bins = int(-width)
+    elif log:
+        n_bins = int(math.ceil(math.log10(upper / lower) / width))
+    else:
+        n_bins = int(math.ceil((upper - lower) / width))
+    n_bins = max(1, min(n_bins, MAX_BINS))
+    if log:
+        edges = np.logspace(math.log10(lower), math.log10(upper), n_bins + 1)
+        return np.sqrt(edges[:-1] * edges[1:])
+    edges = np.linspace(lower, upper, n_bins + 1)
+    return 0.5 * (edges[:-1] + edges[1:])
+
+
+def orbit_flux(orbit):
+    """Total flux level of an orbit, a smooth function of the elements."""
+    sma, ecc, inc = [float(item) for item in orbit[:3]]
+    return (1e-3 * math.exp(-(sma - 6778.0) / 700.0) *
+            (1.0 + 0.5 * math.sin(math.radians(inc))) * (1.0 + ecc))
+
+
+def population_fraction(size_limits):
+    """Fraction of the synthetic population between the size thresholds,
+    for a cumulative size distribution proportional to size ** -1.5."""
+    lower = max(float(size_limits[0]), SIZE_REFERENCE)
+    upper = max(float(size_limits[1]), lower)
+    return (lower ** -1.5 - upper ** -1.5) / SIZE_REFERENCE ** -1.5
+
+
+def write_table(filename, title, labels, rows):
+    with open(filename, 'w') as f_out:
+        f_out.write('# ESA MASTER-2009 Model (stub)\n')
+        f_out.write('# {}\n'.format(title))
+        f_out.write('#  ' + '  '.join(labels) + '\n')
+        for row in rows:
+            f_out.write(' '.join('{: .5e}'.format(item) for item in row))
+            f_out.write('\n')
+
+
+def write_outputs(output_path, run_id, orbit, switches, size_limits,
+                  dist_2d, dist_3d, spectra=SPECTRUM_TYPES):
+    """Writes the synthetic spectra and distributions of a run. Only the
+    kinds of spectra listed in spectra are written."""
+    enabled = [item for item, kind in zip(SPECTRUM_FILES, SPECTRUM_TYPES)
+               if kind in spectra]
+    weights = np.array([float(sw) * w for sw, w in zip(switches,
+                                                       SOURCE_WEIGHTS)])
+    level = orbit_flux(orbit)
+    labels = SOURCE_NAMES + ['Total']
+    for number, log, lower, upper, width in dist_2d:
+        x = bins(log, lower, upper, width)
+        name = DISTRIBUTION_NAMES.get(number, 'distribution {}'.format(number))
+        if number in (1, 2):
+            # size spectra, limited by the size thresholds
+            profile = x ** -2.5 / (x ** -2.5).sum()
+            profile[(x < float(size_limits[0])) |
+                    (x > float(size_limits[1]))] = 0.0
+            kinds = enabled
+        else:
+            profile = 1.0 + np.cos(np.linspace(0.0, math.pi, len(x))) ** 2
+            profile *= population_fraction(size_limits) / profile.sum()
+            kinds = [item for item in enabled if item[0] == 'd']
+        for suffix, kind in kinds:
+            values = level * np.outer(profile, weights)
+            if suffix == 'c':
+                values = np.cumsum(values[::-1], axis=0)[::-1]
+            elif suffix == 'r':
+                values = np.cumsum(values, axis=0)
+            rows = np.column_stack([x, values, values.sum(axis=1)])
+            write_table('/'.join([output_path, '{}_{}{:02d}.txt'.format(
+                run_id, suffix, number)]),
+                '{} flux vs {}'.format(kind, name),
+                [name.replace(' ', '_')] + labels, rows)
+    axes = dict((item[0], bins(*item[1:])) for item in dist_2d)
+    for number, first, second in dist_3d:
+        if first not in axes or second not in axes:
+            continue
+        x, y = np.meshgrid(axes[first], axes[second], indexing='ij')
+        values = (level * weights.sum() * population_fraction(size_limits) *
+                  np.ones(x.shape) / x.size)
+        rows = np.column_stack([x.ravel(), y.ravel(), values.ravel()])
+        write_table('/'.join([output_path, '{}_3d{:02d}.txt'.format(
+            run_id, number)]),
+            'Flux vs {} and {}'.format(DISTRIBUTION_NAMES[first],
+                                       DISTRIBUTION_NAMES[second]),
+            ['x', 'y', 'Total'], rows)
+
+
+def run_time(distribution, mean, spread, seed):
+    """Draws the duration of the run in seconds."""
+    random = np.random.RandomState(seed)
+    if distribution == 'fixed':
+        return mean
+    if distribution == 'uniform':
+        return random.uniform(max(0.0, mean - spread), mean + spread)
+    if distribution == 'exponential':
+        return random.exponential(mean)
+    if distribution == 'lognormal':
+        sigma = math.sqrt(math.log(1.0 + (spread / mean) ** 2))
+        return random.lognormal(math.log(mean) - 0.5 * sigma ** 2, sigma)
+    raise ValueError("Unknown distribution '{}'.".format(distribution))
+
+
+def wait(seconds, cpu=False):
+    """Sleeps, or keeps one core busy when cpu is True."""
+    end = time.time() + seconds
+    if not cpu:
+        time.sleep(max(0.0, seconds))
+        return
+    x = 0.0
+    while time.time() < end:
+        for i in range(10000):
+            x += math.sqrt(i)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Stand-in for MASTER.')
+    parser.add_argument('--distribution', default='fixed',
+                        choices=['fixed', 'uniform', 'exponential',
+                                 'lognormal'])
+    parser.add_argument('--mean', type=float, default=1.0,
+                        help='mean run time in seconds')
+    parser.add_argument('--spread', type=float, default=0.5,
+                        help='spread of the run time in seconds')
+    parser.add_argument('--cpu', action='store_true',
+                        help='burn CPU instead of sleeping')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    output_path, _, _, input_path = read_config()
+    template = MasterInputTemplate('/'.join([input_path, 'master.inp']))
+    run_id = template.values('run_id')[0][0]
+    orbit = template.values('target_orbits')[0][8:13]
+    switches = [line[0] for line in template.values('switches')]
+    size_limits = [line[0] for line in template.values('size_limits')]
+    spectra = [kind for kind in SPECTRUM_TYPES
+               if template.values(kind)[0][0] == '1']
+    dist_2d, dist_3d = read_distributions('/'.join([input_path,
+                                                    'default.def']))
+    seed = (args.seed + int(hashlib.sha1(run_id).hexdigest()[:8], 16)) % 2**32
+    wait(run_time(args.distribution, args.mean, args.spread, seed), args.cpu)
+    write_outputs(output_path, run_id, orbit, switches, size_limits,
+                  dist_2d, dist_3d, spectra)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
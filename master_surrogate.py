@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from master_batch import run_simulation
+from master_epochs import decimal_year, parse_epoch
+from master_output import read_run
+
+# number of closest runs used to estimate the error of a prediction
+ERROR_NEIGHBOURS = 4
+
+
+def epoch_year(begin_epoch, end_epoch):
+    """Returns the middle of an analysis interval as a decimal year."""
+    begin = parse_epoch(begin_epoch)
+    return decimal_year(begin + (parse_epoch(end_epoch) - begin) // 2)
+
+
+def spec_point(spec):
+    """Returns the point (sma, ecc, inc, raan, aop, epoch) of a run
+    specification."""
+    return [float(item) for item in spec['orbit']] + [
+        epoch_year(spec['begin_epoch'], spec['end_epoch'])]
+
+
+def total_flux(tables):
+    """Default quantity of the surrogate: the total cumulative flux vs
+    object diameter (last column of the table)."""
+    for name in sorted(tables):
+        table = tables[name]
+        if table.kind == 'cumulative' and table.distributions == [2]:
+            return np.array(table.data[:, -1])
+    raise ValueError("No cumulative flux vs object diameter in the output.")
+
+
+def features(points, scales):
+    """Maps the points to the space where distances are measured: sma, ecc,
+    inc and epoch divided by their scale, RAAN and AoP as points on a circle
+    (so that 0 and 360 degrees coincide)."""
+    points = np.atleast_2d(np.asarray(points, dtype=float))
+    raan = np.radians(points[:, 3])
+    aop = np.radians(points[:, 4])
+    return np.column_stack([points[:, 0] / scales[0],
+                            points[:, 1] / scales[1],
+                            points[:, 2] / scales[2],
+                            np.cos(raan), np.sin(raan),
+                            np.cos(aop), np.sin(aop),
+                            points[:, 5] / scales[5]])
+
+
+class FluxSurrogate(object):
+    """Interpolation model of a flux quantity over the target orbit and the
+    epoch, fitted on completed runs.
+
+    The model is a multiquadric radial basis function interpolant. Its
+    accuracy is estimated with the leave-one-out errors at the runs, which
+    are cheap to obtain for this kind of model, and extended to a query point
+    from its closest runs.
+
+    Inputs
+    ------
+    - points (array):
+        the (sma, ecc, inc, raan, aop, epoch) of each run, one per row (km,
+        degrees and decimal years).
+    - values (array):
+        the quantity of each run, one row per run (e.g. a spectrum).
+    - scales (list):
+        the distance along sma, ecc, inc and epoch considered equivalent to
+        one radian of RAAN or AoP. Default values are the ranges of the runs.
+    """
+    def __init__(self, points, values, scales=None):
+        self.points = np.atleast_2d(np.asarray(points, dtype=float))
+        self.values = np.asarray(values, dtype=float).reshape(
+            len(self.points), -1)
+        if scales is None:
+            ranges = self.points.max(axis=0) - self.points.min(axis=0)
+            scales = np.where(ranges > 0, ranges, 1.0)
+        self.scales = np.asarray(scales, dtype=float)
+        self.__fit()
+
+    @classmethod
+    def from_results(cls, results, quantity=total_flux, scales=None):
+        """Fits the surrogate on the results of completed runs (see
+        master_batch.run_simulation). quantity extracts the modelled
+        quantity from the tables of a run (see master_output.read_run)."""
+        points = []
+        values = []
+        for result in results:
+            spec = result['spec']
+            if result['status'] != 'done':
+                continue
+            points.append(spec_point(spec))
+            values.append(quantity(read_run(result['output_path'],
+                                            spec['run_id'])))
+        return cls(points, values, scales)
+
+    def __fit(self):
+        x = features(self.points, self.scales)
+        distances = np.sqrt(((x[:, None, :] - x[None, :, :]) ** 2).sum(-1))
+        if len(x) > 1:
+            nearest = np.where(np.eye(len(x), dtype=bool), np.inf, distances)
+            self.__shape = nearest.min(axis=1).mean()
+        else:
+            self.__shape = 1.0
+        kernel = np.sqrt(distances ** 2 + self.__shape ** 2)
+        inverse = np.linalg.pinv(kernel)
+        self.__x = x
+        self.__weights = inverse.dot(self.values)
+        # leave-one-out errors (Rippa), relative to the values at the runs
+        loo = self.__weights / np.diag(inverse)[:, None]
+        norm = np.abs(self.values).max(axis=1)
+        self.loo_errors = np.abs(loo).max(axis=1) / np.where(norm > 0, norm,
+                                                             1.0)
+
+    def add(self, point, value):
+        """Adds a run and fits the model again."""
+        self.points = np.vstack([self.points, point])
+        self.values = np.vstack([self.values, np.ravel(value)])
+        self.__fit()
+
+    def predict(self, point):
+        """Predicts the quantity at a point.
+
+        Returns
+        -------
+        - value (numpy.ndarray):
+            the predicted quantity.
+        - error (float):
+            the estimated relative error, from the leave-one-out errors of
+            the closest runs, weighted by the inverse of their distance and
+            increased with the distance from them. The error is infinite
+            outside the range of sma, ecc, inc and epoch of the runs.
+        """
+        x = features(point, self.scales)[0]
+        distances = np.sqrt(((self.__x - x) ** 2).sum(axis=1))
+        kernel = np.sqrt(distances ** 2 + self.__shape ** 2)
+        value = kernel.dot(self.__weights)
+        k = min(ERROR_NEIGHBOURS, len(distances))
+        closest = np.argpartition(distances, k - 1)[:k]
+        weights = 1.0 / (distances[closest] + 1e-12)
+        error = (weights * self.loo_errors[closest]).sum() / weights.sum()
+        error *= 1.0 + (distances[closest].min() / self.__shape) ** 2
+        # no extrapolation outside the sampled ranges
+        point = np.asarray(point, dtype=float)
+        outside = ((point < self.points.min(axis=0)) |
+                   (point > self.points.max(axis=0)))
+        if outside[[0, 1, 2, 5]].any():
+            error = np.inf
+        return value, error
+
+
+def query(surrogate, spec, tolerance=0.05, quantity=total_flux):
+    """Answers a query with the surrogate, or runs MASTER when the estimated
+    error is larger than the tolerance. In the latter case the run is added
+    to the surrogate.
+
+    Inputs
+    ------
+    - surrogate (FluxSurrogate)
+    - spec (dict):
+        the run specification of the query (see master_batch.complete_spec).
+    - tolerance (float):
+        the maximum accepted relative error.
+
+    Returns
+    -------
+    - value (numpy.ndarray):
+        the quantity.
+    - error (float):
+        the estimated relative error (0 when MASTER has been run).
+    - result (dict):
+        the result of the run, None if the surrogate has been used.
+    """
+    point = spec_point(spec)
+    value, error = surrogate.predict(point)
+    if error <= tolerance:
+        return value, error, None
+    result = run_simulation(spec)
+    if result['status'] != 'done':
+        raise RuntimeError("Run {} failed: {}".format(result['sim_name'],
+                                                      result['error']))
+    value = quantity(read_run(result['output_path'],
+                              result['spec']['run_id']))
+    surrogate.add(point, value)
+    return value, 0.0, result
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import itertools
+
+import numpy as np
+
+from master_input import RUN_ID_LENGTH
+
+# order of the orbital elements in an orbit
+ORBIT_ELEMENTS = ['sma', 'ecc', 'inc', 'raan', 'aop']
+# number of characters of the hash used in the run identifiers
+RUN_HASH_LENGTH = 12
+
+
+def _values(value):
+    return np.atleast_1d(np.asarray(value, dtype=float))
+
+
+def grid_orbits(sma, ecc, inc, raan=0.0, aop=0.0):
+    """Returns all the combinations of the given orbital elements.
+
+    Inputs
+    ------
+    - sma, ecc, inc, raan, aop (float or array):
+        the values of each orbital element (km for the semi-major axis,
+        degrees for the angles). Use e.g. numpy.linspace for ranges.
+
+    Returns
+    -------
+    - orbits (numpy.ndarray):
+        array with shape (N, 5), one orbit per row.
+    """
+    axes = [_values(item) for item in (sma, ecc, inc, raan, aop)]
+    mesh = np.meshgrid(*axes, indexing='ij')
+    return np.column_stack([item.ravel() for item in mesh])
+
+
+def latin_hypercube_orbits(n, sma, ecc, inc, raan=0.0, aop=0.0, seed=None):
+    """Returns n orbits sampled with a Latin hypercube.
+
+    Inputs
+    ------
+    - n (int):
+        the number of orbits.
+    - sma, ecc, inc, raan, aop (float or tuple):
+        the (lower, upper) bounds of each orbital element. A single value
+        keeps the element fixed.
+    - seed (int):
+        seed of the random generator, for reproducible samples.
+
+    Returns
+    -------
+    - orbits (numpy.ndarray):
+        array with shape (n, 5), one orbit per row.
+    """
+    random = np.random.RandomState(seed)
+    orbits = np.empty((n, len(ORBIT_ELEMENTS)))
+    for k, bounds in enumerate((sma, ecc, inc, raan, aop)):
+        bounds = _values(bounds)
+        if len(bounds) == 1:
+            orbits[:, k] = bounds[0]
+            continue
+        # one sample in each of the n strata, in random order
+        samples = (random.permutation(n) + random.uniform(size=n)) / n
+        orbits[:, k] = bounds[0] + samples * (bounds[1] - bounds[0])
+    return orbits
+
+
+def array_orbits(orbits):
+    """Checks and returns user defined orbits as an array with shape (N, 5).
+    """
+    orbits = np.atleast_2d(np.asarray(orbits, dtype=float))
+    if orbits.shape[1] != len(ORBIT_ELEMENTS):
+        raise ValueError("The orbits must have {} elements ({}).".format(
+            len(ORBIT_ELEMENTS), ', '.join(ORBIT_ELEMENTS)))
+    return orbits
+
+
+def run_id(prefix, orbit, begin_epoch, end_epoch, spec=None):
+    """Returns a deterministic run identifier, made of the prefix and of a
+    hash of the orbit, of the epochs and of the other parameters of the run.
+    The identifier is not longer than RUN_ID_LENGTH characters."""
+    digest = hashlib.sha1(repr(([float(item) for item in orbit],
+                                begin_epoch, end_epoch,
+                                sorted((spec or {}).items()))))
+    prefix = prefix[:RUN_ID_LENGTH - RUN_HASH_LENGTH - 1]
+    return '{}_{}'.format(prefix, digest.hexdigest()[:RUN_HASH_LENGTH])
+
+
+def sweep_specs(orbits, epochs, prefix='sweep', **spec):
+    """Expands orbits and epoch windows into run specifications (see
+    master_batch.complete_spec). Every orbit is run for every epoch window.
+
+    Inputs
+    ------
+    - orbits (numpy.ndarray):
+        the orbits, one per row (see grid_orbits, latin_hypercube_orbits and
+        array_orbits).
+    - epochs (list):
+        the epoch windows as (begin_epoch, end_epoch) pairs, in the format
+        YEAR/MONTH/DAY/HOUR.
+    - prefix (str):
+        the beginning of the run identifiers.
+    - spec:
+        the other entries of the run specifications, the same for all runs
+        (e.g. path, scenario_id, switches).
+
+    Returns
+    -------
+    - specs (list):
+        the run specifications. 'run_id' and 'sim_name' are both set to the
+        run identifier (see run_id); runs with identical parameters are
+        listed once.
+
+    Example
+    -------
+        orbits = grid_orbits(numpy.linspace(6778., 7378., 7), 0.001,
+                             [50., 60., 70.])
+        specs = sweep_specs(orbits, [('2016/01/01/00', '2017/01/01/00')],
+                            prefix='leo', path='C:/results')
+    """
+    orbits = array_orbits(orbits)
+    specs = []
+    seen = set()
+    for orbit, (begin_epoch, end_epoch) in itertools.product(orbits, epochs):
+        orbit = [float(item) for item in orbit]
+        identifier = run_id(prefix, orbit, begin_epoch, end_epoch, spec)
+        if identifier in seen:
+            continue
+        seen.add(identifier)
+        run_spec = dict(spec)
+        run_spec.update({'run_id': identifier,
+                         'sim_name': identifier,
+                         'orbit': orbit,
+                         'begin_epoch': begin_epoch,
+                         'end_epoch': end_epoch})
+        specs.append(run_spec)
+    return specs
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import json
+import os
+import threading
+import time
+
+# objects notified at the beginning and at the end of each phase of a run
+_hooks = []
+
+
+class PhaseHook(object):
+    """Base class of the objects notified of the phases of the runs.
+
+    The phases are: 'create_folder', 'config', 'input', 'default_def',
+    'copy_con', 'copy_sdf', 'cache', 'startup', 'execution' and 'parse'.
+    Subclasses override on_phase_start and on_phase_end. The runs are
+    identified by their simulation name (the name of the run folder).
+    """
+    def on_phase_start(self, phase, run, start):
+        pass
+
+    def on_phase_end(self, phase, run, start, end):
+        pass
+
+
+class PhaseRecorder(PhaseHook):
+    """Records the phases as events, which can be exported with
+    write_chrome_trace. If run is given only the phases of that run are
+    recorded."""
+    def __init__(self, run=None):
+        self.run = run
+        self.events = []
+
+    def on_phase_end(self, phase, run, start, end):
+        if self.run is not None and run != self.run:
+            return
+        self.events.append({'name': phase, 'run': run, 'start': start,
+                            'end': end, 'pid': os.getpid(),
+                            'tid': threading.current_thread().ident})
+
+
+def add_hook(hook):
+    """Registers a hook (see PhaseHook) in the current process."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+def phase_start(phase, run):
+    """Notifies the beginning of a phase. Returns the start time."""
+    start = time.time()
+    for hook in list(_hooks):
+        hook.on_phase_start(phase, run, start)
+    return start
+
+
+def phase_end(phase, run, start):
+    """Notifies the end of a phase started at start."""
+    end = time.time()
+    for hook in list(_hooks):
+        hook.on_phase_end(phase, run, start, end)
+    return end
+
+
+@contextlib.contextmanager
+def phase(name, run):
+    """Context manager timing a phase of a run.
+
+    Example
+    -------
+        with phase('input', sim_name):
+            master_input_file(...)
+    """
+    start = phase_start(name, run)
+    try:
+        yield
+    finally:
+        phase_end(name, run, start)
+
+
+def summarize(events):
+    """Returns the total time in seconds spent in each phase.
+
+    The time spent by the executable ('execution') can be compared with the
+    sum of the other phases, which is the overhead of the wrapper.
+    """
+    totals = {}
+    for event in events:
+        totals[event['name']] = (totals.get(event['name'], 0.0) +
+                                 event['end'] - event['start'])
+    return totals
+
+
+def write_chrome_trace(events, filename):
+    """Writes the events in the Chrome trace format (JSON), which can be
+    opened with chrome://tracing or Perfetto.
+
+    Inputs
+    ------
+    - events (list):
+        the events of a PhaseRecorder, or the 'timings' of the results of a
+        campaign (see master_batch.run_simulation).
+    - filename (str):
+        the path of the trace file.
+    """
+    trace = []
+    for event in events:
+        trace.append({'name': event['name'],
+                      'cat': 'master',
+                      'ph': 'X',
+                      'ts': event['start'] * 1e6,
+                      'dur': (event['end'] - event['start']) * 1e6,
+                      'pid': event['pid'],
+                      'tid': event['tid'],
+                      'args': {'run': event['run']}})
+    with open(filename, 'w') as f_out:
+        json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f_out)
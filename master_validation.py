@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+
+from master_input import (CONFIG_PATH_LENGTH, SPECTRUM_TYPES, check_epoch,
+                          check_run_id, check_switches)
+
+# equatorial radius of the Earth in km
+EARTH_RADIUS = 6378.137
+# files that must be in the 'default' folder of the MASTER installation
+TEMPLATE_FILES = ['master.inp', 'default.def', 'default.con', 'default.sdf']
+SIZE_UNITS = ('m', 'kg')
+
+
+def check_specs(specs):
+    """Checks a batch of complete run specifications without starting
+    anything.
+
+    The orbits and the epochs of all the runs are checked together as
+    arrays, the other entries run by run. The MASTER installations used by
+    the batch are checked once each.
+
+    Inputs
+    ------
+    - specs (list):
+        the complete run specifications (see master_batch.complete_spec).
+        None entries are skipped.
+
+    Returns
+    -------
+    - problems (list):
+        the (index of the run, sim_name, message) of every problem found,
+        empty if the batch is valid.
+    """
+    specs = [(i, spec) for i, spec in enumerate(specs) if spec is not None]
+    problems = []
+    problems.extend(check_names(specs))
+    problems.extend(check_orbits(specs))
+    problems.extend(check_epochs(specs))
+    for i, spec in specs:
+        for message in check_entries(spec):
+            problems.append((i, spec['sim_name'], message))
+    problems.extend(check_installations(specs))
+    problems.sort(key=lambda item: item[0])
+    return problems
+
+
+def format_problems(problems):
+    """Returns the problems found by check_specs as a message."""
+    return "{} problems in the run specifications:\n{}".format(
+        len(problems), '\n'.join("  run {} ({}): {}".format(i, name, message)
+                                 for i, name, message in problems))
+
+
+def check_names(specs):
+    """Every run needs its own folder."""
+    problems = []
+    seen = {}
+    for i, spec in specs:
+        name = spec['sim_name']
+        if not isinstance(name, basestring) or not name:
+            problems.append((i, name, "sim_name must be a non-empty string"))
+        elif name in seen:
+            problems.append((i, name, "sim_name already used by run "
+                             "{}".format(seen[name])))
+        else:
+            seen[name] = i
+    return problems
+
+
+def check_orbits(specs):
+    """Checks the orbits of all the runs at once."""
+    problems = []
+    rows = []
+    owners = []
+    for i, spec in specs:
+        orbit = spec['orbit']
+        try:
+            values = [float(value) for value in orbit]
+        except (TypeError, ValueError):
+            values = []
+        if len(values) != 5:
+            problems.append((i, spec['sim_name'], "orbit {!r} is not "
+                             "[sma, ecc, inc, raan, aop]".format(orbit)))
+            continue
+        rows.append(values)
+        owners.append(i)
+    if not rows:
+        return problems
+    orbits = np.array(rows)
+    owners = np.array(owners)
+    names = dict((i, spec['sim_name']) for i, spec in specs)
+    sma, ecc, inc, raan, aop = orbits.T
+    with np.errstate(invalid='ignore'):
+        checks = [(~np.isfinite(orbits).all(axis=1), "orbit has non-finite "
+                   "elements"),
+                  ((ecc < 0) | (ecc >= 1), "eccentricity not in [0, 1)"),
+                  (sma * (1 - ecc) <= EARTH_RADIUS, "perigee below the "
+                   "Earth surface"),
+                  ((inc < 0) | (inc > 180), "inclination not in [0, 180] "
+                   "deg"),
+                  ((np.abs(raan) > 360) | (np.abs(aop) > 360),
+                   "RAAN or AoP not in [-360, 360] deg")]
+    for mask, message in checks:
+        for k in np.flatnonzero(mask):
+            problems.append((owners[k], names[owners[k]], "{} ({})".format(
+                message, list(orbits[k]))))
+    return problems
+
+
+def epoch_array(epochs):
+    """Converts epochs in the form YEAR/MONTH/DAY/HOUR into an array of
+    numpy.datetime64 (hours). Invalid epochs are NaT.
+
+    Returns
+    -------
+    - dates (numpy.ndarray)
+    - valid (numpy.ndarray):
+        True for the epochs in the right form and with valid fields.
+    """
+    fields = np.zeros((len(epochs), 4), dtype=int)
+    valid = np.ones(len(epochs), dtype=bool)
+    for k, epoch in enumerate(epochs):
+        try:
+            check_epoch(epoch)
+            fields[k] = [int(item) for item in epoch.split('/')]
+        except ValueError:
+            valid[k] = False
+    year, month, day, hour = fields.T
+    valid &= (month >= 1) & (month <= 12) & (hour >= 0) & (hour <= 23)
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype(
+        'datetime64[M]')
+    first_day = months.astype('datetime64[D]')
+    month_length = ((months + 1).astype('datetime64[D]') -
+                    first_day).astype(int)
+    valid &= (day >= 1) & (day <= month_length)
+    dates = (first_day + (day - 1)).astype('datetime64[h]') + hour
+    dates[~valid] = np.datetime64('NaT')
+    return dates, valid
+
+
+def check_epochs(specs):
+    """Checks the epochs of all the runs at once. The analysis interval of
+    an orbiting target (analysis mode 1) must not be empty; the other modes
+    can be evaluated at a single epoch (begin_epoch equal to end_epoch)."""
+    problems = []
+    if not specs:
+        return problems
+    begin, begin_valid = epoch_array([spec['begin_epoch']
+                                      for _, spec in specs])
+    end, end_valid = epoch_array([spec['end_epoch'] for _, spec in specs])
+    valid = begin_valid & end_valid
+    target = np.array([str(spec['analysis_mode']) == '1'
+                       for _, spec in specs])
+    order = np.zeros(len(specs), dtype=bool)
+    order[valid] = np.where(target[valid], end[valid] <= begin[valid],
+                            end[valid] < begin[valid])
+    for k, (i, spec) in enumerate(specs):
+        if not begin_valid[k]:
+            problems.append((i, spec['sim_name'], "begin_epoch {!r} is not a "
+                             "valid YEAR/MONTH/DAY/HOUR".format(
+                                 spec['begin_epoch'])))
+        if not end_valid[k]:
+            problems.append((i, spec['sim_name'], "end_epoch {!r} is not a "
+                             "valid YEAR/MONTH/DAY/HOUR".format(
+                                 spec['end_epoch'])))
+        if order[k] and target[k]:
+            problems.append((i, spec['sim_name'], "end_epoch is not after "
+                             "begin_epoch"))
+        elif order[k]:
+            problems.append((i, spec['sim_name'], "end_epoch is before "
+                             "begin_epoch"))
+    return problems
+
+
+def check_entries(spec):
+    """Returns the problems of the entries of a run specification other than
+    the orbits and the epochs."""
+    messages = []
+    for check, value in [(check_run_id, spec['run_id']),
+                         (check_switches, spec['switches'])]:
+        try:
+            check(value)
+        except (ValueError, TypeError) as error:
+            messages.append(str(error))
+    for key in ('scenario_id', 'analysis_mode'):
+        value = spec[key]
+        if isinstance(value, bool) or str(value) not in ('1', '2', '3'):
+            messages.append("{} {!r} is not 1, 2 or 3".format(key, value))
+    for key in ('cache_max_entries', 'cache_max_size'):
+        value = spec[key]
+        if value is not None and (isinstance(value, bool) or
+                                  not isinstance(value, (int, long)) or
+                                  value < 1):
+            messages.append("{} {!r} is not a positive integer".format(
+                key, value))
+    messages.extend(check_size_limits(spec['size_limits']))
+    messages.extend(check_distributions(spec['distribution_2D'],
+                                        spec['distribution_3D']))
+    for product in spec['products'] or []:
+        if len(product) != 2 or (product[0] not in SPECTRUM_TYPES and
+                                 product[0] != '3d'):
+            messages.append("unknown output product {!r}".format(product))
+    for key in ('data_path', 'data_cloud_path'):
+        if len(spec[key]) > CONFIG_PATH_LENGTH:
+            messages.append("{} is longer than {} characters".format(
+                key, CONFIG_PATH_LENGTH))
+    return messages
+
+
+def check_size_limits(size_limits):
+    """Returns the problems of the size thresholds [lower, upper, unit]."""
+    if len(size_limits) != 3:
+        return ["size_limits must be [lower, upper, unit]"]
+    try:
+        lower, upper = float(size_limits[0]), float(size_limits[1])
+    except (TypeError, ValueError):
+        return ["size thresholds {!r} are not numbers".format(
+            list(size_limits[:2]))]
+    messages = []
+    if not 0 < lower < upper:
+        messages.append("size thresholds must satisfy 0 < lower < upper")
+    if size_limits[2] not in SIZE_UNITS:
+        messages.append("size unit {!r} is not 'm' or 'kg'".format(
+            size_limits[2]))
+    return messages
+
+
+def check_distributions(distribution_2D, distribution_3D):
+    """Returns the problems of the rows of default.def to write."""
+    messages = []
+    for row in distribution_2D:
+        if len(row) != 7 or not str(row[0]).isdigit() or \
+                not 1 <= int(row[0]) <= 27:
+            messages.append("2D distribution {!r} is not [number (1:27), "
+                            "switch, log, auto, min, max, width]".format(row))
+    for row in distribution_3D:
+        if len(row) != 4 or not all(str(item).isdigit() for item in row) \
+                or not 1 <= int(row[0]) <= 10:
+            messages.append("3D distribution {!r} is not [number (1:10), "
+                            "switch, spectrum 1, spectrum 2]".format(row))
+    return messages
+
+
+def check_installations(specs):
+    """Checks once each MASTER installation used by the runs."""
+    problems = []
+    checked = set()
+    for i, spec in specs:
+        key = (spec['master_path'], repr(spec['executable']))
+        if key in checked:
+            continue
+        checked.add(key)
+        template_path = '/'.join([spec['master_path'], 'default'])
+        missing = [name for name in TEMPLATE_FILES
+                   if not os.path.isfile('/'.join([template_path, name]))]
+        if missing:
+            problems.append((i, spec['sim_name'], "{} not found in "
+                             "{}".format(', '.join(missing), template_path)))
+        if not isinstance(spec['executable'], (list, tuple)):
+            executable = '/'.join([spec['master_path'], spec['executable']])
+            if not os.path.isfile(executable):
+                problems.append((i, spec['sim_name'], "executable {} not "
+                                 "found".format(executable)))
+    return problems
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""Shared fixtures of the tests: a temporary MASTER installation whose
+executable is the stand-in of master_stub.py (see master_benchmark)."""
+import shutil
+import tempfile
+import unittest
+
+from master_benchmark import make_stub_installation, stub_command
+
+
+class StubTestCase(unittest.TestCase):
+    """Test case with a stub MASTER installation in a temporary folder,
+    removed after each test."""
+    # run time of the stub executable in seconds
+    stub_time = 0.01
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.master_path = make_stub_installation(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def spec(self, i=0, **entries):
+        """Returns the run specification of a one-year stub run."""
+        spec = {'sim_name': 'run{:03d}'.format(i),
+                'run_id': 'run',
+                'path': '/'.join([self.path, 'runs']),
+                'orbit': [7000.0 + 10 * i, 0.001, 98.0, 0.0, 0.0],
+                'begin_epoch': '2016/01/01/00',
+                'end_epoch': '2017/01/01/00',
+                'master_path': self.master_path,
+                'data_path': '/'.join([self.master_path, 'data']),
+                'data_cloud_path': '/'.join([self.master_path, 'data',
+                                             'clouds']),
+                'executable': stub_command(mean=self.stub_time)}
+        spec.update(entries)
+        return spec
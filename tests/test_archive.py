@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+
+from master_archive import RunArchive, run_files
+from master_batch import run_simulation
+from master_output import read_run
+from tests.support import StubTestCase
+
+
+class RunArchiveTest(StubTestCase):
+    def setUp(self):
+        StubTestCase.setUp(self)
+        # a file of the population data, reached through the run folders
+        self.sentinel = '/'.join([self.master_path, 'data', 'population'])
+        with open(self.sentinel, 'w') as f_out:
+            f_out.write('data')
+        self.run_paths = []
+        self.contents = {}
+        for i in range(3):
+            result = run_simulation(self.spec(i))
+            self.assertEqual(result['status'], 'done')
+            run_path = os.path.dirname(result['output_path'])
+            self.run_paths.append(run_path)
+            contents = {}
+            for name in run_files(run_path):
+                with open('/'.join([run_path, name]), 'rb') as f_in:
+                    contents[name] = f_in.read()
+            self.contents[os.path.basename(run_path)] = (
+                contents, read_run(result['output_path'], 'run'))
+        self.archive_path = '/'.join([self.path, 'archive'])
+
+    def test_run_files_skip_data(self):
+        self.assertTrue(os.path.islink('/'.join([self.run_paths[0],
+                                                 'data'])))
+        names = run_files(self.run_paths[0])
+        self.assertTrue(names)
+        self.assertFalse([name for name in names if 'population' in name])
+
+    def test_pack_and_read(self):
+        archive = RunArchive(self.archive_path)
+        self.assertEqual(archive.pack(self.run_paths[:2]),
+                         ['run000', 'run001'])
+        self.assertEqual(archive.pack(self.run_paths[2:]), ['run002'])
+        archive.close()
+        for run_path in self.run_paths:
+            self.assertFalse(os.path.lexists(run_path))
+        self.assertTrue(os.path.isfile(self.sentinel))
+        archive = RunArchive(self.archive_path)
+        self.assertEqual(archive.runs(), ['run000', 'run001', 'run002'])
+        for sim_name, (contents, tables) in self.contents.items():
+            self.assertEqual(archive.files(sim_name), sorted(contents))
+            read = archive.read_run(sim_name, 'run')
+            self.assertEqual(sorted(read), sorted(tables))
+            for name, table in tables.items():
+                self.assertTrue(np.array_equal(read[name].data, table.data))
+                self.assertEqual(read[name].header, table.header)
+        archive.close()
+
+    def test_extract(self):
+        archive = RunArchive(self.archive_path)
+        archive.pack(self.run_paths[:1], remove=False)
+        self.assertTrue(os.path.isdir(self.run_paths[0]))
+        run_path = archive.extract('run000', '/'.join([self.path, 'out']))
+        contents = self.contents['run000'][0]
+        self.assertEqual(run_files(run_path), sorted(contents))
+        for name, content in contents.items():
+            with open('/'.join([run_path, name]), 'rb') as f_in:
+                self.assertEqual(f_in.read(), content)
+        with self.assertRaises(ValueError):
+            archive.pack(self.run_paths[:1])
+        with self.assertRaises(KeyError):
+            archive.read_table('run001', 'run_d02.txt')
+        archive.close()
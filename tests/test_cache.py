@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import os
+
+from master_batch import run_simulation, validate_batch
+from master_benchmark import stub_command
+from master_cache import ResultCache
+from tests.support import StubTestCase
+
+
+class ResultCacheTest(StubTestCase):
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.cache_path = '/'.join([self.path, 'cache'])
+
+    def run_cached(self, i, **entries):
+        entries.setdefault('cache_path', self.cache_path)
+        result = run_simulation(self.spec(i, **entries))
+        self.assertEqual(result['status'], 'done')
+        return result
+
+    def test_hit_and_miss(self):
+        first = self.run_cached(0)
+        self.assertFalse(first['cached'])
+        # same inputs in another folder and with another run identifier
+        second = self.run_cached(1, orbit=first['spec']['orbit'],
+                                 run_id='other')
+        self.assertTrue(second['cached'])
+        self.assertEqual(sorted(os.listdir(second['output_path'])),
+                         sorted(name.replace('run', 'other', 1) for name in
+                                os.listdir(first['output_path'])))
+        self.assertFalse(self.run_cached(2)['cached'])
+
+    def test_versions_in_key(self):
+        orbit = self.spec(0)['orbit']
+        self.run_cached(0)
+        self.assertFalse(self.run_cached(
+            1, orbit=orbit, executable=stub_command(mean=0.02))['cached'])
+        # a change of the population data; the fingerprint of a folder is
+        # computed once per process, hence the other spelling of its path
+        with open('/'.join([self.master_path, 'data', 'new']), 'w') as f_out:
+            f_out.write('data')
+        self.assertFalse(self.run_cached(
+            2, orbit=orbit, data_path='/'.join([self.master_path,
+                                                'data']) + '/')['cached'])
+        self.assertFalse(self.run_cached(3, orbit=orbit,
+                                         data_version='v2')['cached'])
+        self.assertTrue(self.run_cached(4, orbit=orbit,
+                                        data_version='v2')['cached'])
+
+    def test_eviction(self):
+        for i in range(3):
+            self.run_cached(i, cache_max_entries=2)
+        self.assertEqual(len(ResultCache(self.cache_path).entries()), 2)
+        # the least recently used entry is gone
+        self.assertFalse(self.run_cached(3, orbit=self.spec(0)['orbit'],
+                                         cache_max_entries=2)['cached'])
+        self.assertTrue(self.run_cached(4, orbit=self.spec(2)['orbit'],
+                                        cache_max_entries=2)['cached'])
+        size = ResultCache(self.cache_path).entries()[0][2]
+        self.run_cached(5, cache_max_size=size)
+        self.assertEqual(len(ResultCache(self.cache_path).entries()), 1)
+
+    def test_limits_validated(self):
+        for entries in ({'cache_max_entries': 0}, {'cache_max_size': -1},
+                        {'cache_max_size': 1.5}):
+            with self.assertRaises(ValueError):
+                validate_batch([self.spec(**entries)])
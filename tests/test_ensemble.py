@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+
+from master_ensemble import run_ensemble
+from master_input import remove_run_folder
+from tests.support import StubTestCase
+
+
+class RunEnsembleTest(StubTestCase):
+    def setUp(self):
+        StubTestCase.setUp(self)
+        # a file of the population data, reached through the member folders
+        self.sentinel = '/'.join([self.master_path, 'data', 'population'])
+        with open(self.sentinel, 'w') as f_out:
+            f_out.write('data')
+
+    def test_members_removed(self):
+        statistics, results = run_ensemble(
+            self.spec(sim_name='ensemble'), [10.0, 1e-8, 0.01, 0.01, 0.01],
+            4, processes=2, seed=0)
+        self.assertEqual([result['status'] for result in results],
+                         ['done'] * 4)
+        for result in results:
+            self.assertFalse(os.path.lexists(os.path.dirname(
+                result['output_path'])))
+        self.assertTrue(os.path.isfile(self.sentinel))
+        mean = statistics.mean()['run_d02.txt']
+        self.assertTrue(np.all(mean.data[:, -1] >= 0))
+
+    def test_real_data_folder_kept(self):
+        # a run folder whose data entry is a real folder is not removed
+        run_path = '/'.join([self.path, 'member'])
+        os.makedirs('/'.join([run_path, 'data']))
+        with open('/'.join([run_path, 'data', 'population']), 'w') as f_out:
+            f_out.write('data')
+        with self.assertRaises(OSError):
+            remove_run_folder(run_path)
+        self.assertTrue(os.path.isfile('/'.join([run_path, 'data',
+                                                 'population'])))
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from master_batch import run_simulation
+from master_epochs import (chunk_specs, merge_method, merge_runs,
+                           merge_tables, run_chunked, split_epochs)
+from master_output import OutputTable, read_run
+from tests.support import StubTestCase
+
+
+def table(title, values):
+    return OutputTable('run_d02.txt', ['# {}'.format(title),
+                                       '#  object_diameter  Total'],
+                       np.column_stack([[1.0, 2.0], values]))
+
+
+class MergeMethodTest(unittest.TestCase):
+    def test_fluxes_are_averaged(self):
+        for title in ['Differential flux vs object diameter',
+                      'Cumulative flux vs object diameter',
+                      'Reverse cumulative flux vs object diameter',
+                      'Flux vs object diameter and impact velocity']:
+            self.assertEqual(merge_method(table(title, [1.0, 2.0])), 'mean')
+
+    def test_impacts_are_summed(self):
+        for title in ['Number of impacts vs object diameter',
+                      'Fluence vs object diameter']:
+            self.assertEqual(merge_method(table(title, [1.0, 2.0])), 'sum')
+
+    def test_merge_tables(self):
+        tables = [table('Flux', [1.0, 2.0]), table('Flux', [4.0, 8.0])]
+        mean = merge_tables(tables, [1, 2], 'mean')
+        self.assertTrue(np.allclose(mean.data[:, 1], [3.0, 6.0]))
+        total = merge_tables(tables, [1, 2], 'sum')
+        self.assertTrue(np.allclose(total.data[:, 1], [5.0, 10.0]))
+        with self.assertRaises(ValueError):
+            merge_tables([tables[0], OutputTable(
+                'run_d02.txt', tables[0].header, np.ones((3, 2)))], [1, 1])
+
+
+class SplitEpochsTest(unittest.TestCase):
+    def test_contiguous_chunks(self):
+        epochs = split_epochs('2016/01/01/00', '2016/01/02/01', 4)
+        self.assertEqual(len(epochs), 4)
+        self.assertEqual(epochs[0][0], '2016/01/01/00')
+        self.assertEqual(epochs[-1][1], '2016/01/02/01')
+        for (_, end, _), (begin, _, _) in zip(epochs[:-1], epochs[1:]):
+            self.assertEqual(end, begin)
+        self.assertEqual(sum(item[2] for item in epochs), 25)
+
+    def test_empty_interval(self):
+        with self.assertRaises(ValueError):
+            split_epochs('2016/01/01/00', '2016/01/01/00', 2)
+
+
+class RunChunkedTest(StubTestCase):
+    def test_chunks_match_single_run(self):
+        # the stub fluxes do not depend on the epoch, so the time average of
+        # the chunks is the flux of the whole interval
+        spec = self.spec()
+        single = run_simulation(dict(spec, sim_name='single'))
+        self.assertEqual(single['status'], 'done')
+        expected = read_run(single['output_path'], 'run')
+        tables, results = run_chunked(spec, 3, processes=2)
+        self.assertEqual([result['status'] for result in results],
+                         ['done'] * 3)
+        self.assertEqual(sorted(tables), sorted(expected))
+        for name in expected:
+            self.assertTrue(np.allclose(tables[name].data,
+                                        expected[name].data), name)
+
+    def test_method_by_file(self):
+        specs = chunk_specs(self.spec(), 2)
+        results = [run_simulation(spec) for spec in specs]
+        single = read_run(results[0]['output_path'], 'run')['run_d02.txt']
+        tables = merge_runs(results, {'run_d02.txt': 'sum'})
+        self.assertTrue(np.allclose(tables['run_d02.txt'].data[:, 1:],
+                                    2 * single.data[:, 1:]))
+        self.assertTrue(np.allclose(tables['run_c02.txt'].data, read_run(
+            results[0]['output_path'], 'run')['run_c02.txt'].data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import os
+
+from master_journal import CampaignJournal, run_campaign
+from tests.support import StubTestCase
+
+
+class CampaignJournalTest(StubTestCase):
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.journal_path = '/'.join([self.path, 'campaign.jsonl'])
+
+    def test_torn_line(self):
+        journal = CampaignJournal(self.journal_path)
+        journal.append('run000', 'planned')
+        with open(self.journal_path, 'ab') as f_out:
+            f_out.write('{"sim_name": "run000", "sta')
+        journal.append('run000', 'done')
+        self.assertEqual([record['state'] for record in journal.records()],
+                         ['planned', 'done'])
+
+    def test_campaign(self):
+        specs = [self.spec(i) for i in range(3)]
+        # a file is in the way of the input folder of run002: its inputs are
+        # never written
+        os.makedirs('/'.join([specs[2]['path'], 'run002']))
+        open('/'.join([specs[2]['path'], 'run002', 'input']), 'w').close()
+        results = run_campaign(self.journal_path, specs, max_running=2)
+        self.assertEqual(sorted(result['status'] for result in results),
+                         ['done', 'done', 'failed'])
+        journal = CampaignJournal(self.journal_path)
+        states = dict((name, [record['state'] for record in
+                              journal.records()
+                              if record['sim_name'] == name])
+                      for name in ('run000', 'run002'))
+        self.assertEqual(states['run000'], ['planned', 'inputs_written',
+                                            'running', 'done'])
+        self.assertEqual(states['run002'], ['planned', 'failed'])
+        hashes = [record['input_hash'] for record in journal.records()
+                  if record['state'] == 'inputs_written']
+        self.assertEqual(len(hashes), 2)
+        # resuming runs the new runs only
+        results = run_campaign(self.journal_path, specs + [self.spec(3)])
+        self.assertEqual([result['sim_name'] for result in results],
+                         ['run003'])
+        self.assertEqual(results[0]['status'], 'done')
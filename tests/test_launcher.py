@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+
+from master_batch import complete_spec
+from master_benchmark import stub_command
+from master_launcher import FifoAdmission, MasterLauncher
+from master_scheduler import CostModel, ResourceScheduler
+from tests.support import StubTestCase
+
+
+class RecordingAdmission(FifoAdmission):
+    """FIFO admission that records the number of running runs."""
+    def __init__(self, max_running):
+        FifoAdmission.__init__(self, max_running)
+        self.running = []
+        self.finished = []
+
+    def select(self, queued, running):
+        self.running.append(len(running))
+        return FifoAdmission.select(self, queued, running)
+
+    def on_finished(self, handle):
+        self.finished.append(handle.spec['sim_name'])
+
+
+class NoAdmission(FifoAdmission):
+    def select(self, queued, running):
+        return None
+
+
+class MasterLauncherTest(StubTestCase):
+    def launcher(self, **options):
+        launcher = MasterLauncher(poll_interval=0.02, **options)
+        self.addCleanup(launcher.shutdown, True)
+        return launcher
+
+    def test_runs(self):
+        admission = RecordingAdmission(2)
+        launcher = self.launcher(admission=admission)
+        handles = launcher.submit_batch([self.spec(i) for i in range(4)])
+        results = [handle.result() for handle in
+                   launcher.as_completed(handles)]
+        self.assertEqual([result['status'] for result in results],
+                         ['done'] * 4)
+        for result in results:
+            self.assertTrue(os.path.isfile('/'.join([result['output_path'],
+                                                     'run_d02.txt'])))
+            self.assertTrue(result['usage']['wall_time'] > 0)
+        self.assertTrue(max(admission.running) <= 2)
+        self.assertEqual(sorted(admission.finished),
+                         ['run{:03d}'.format(i) for i in range(4)])
+
+    def test_timeout(self):
+        launcher = self.launcher(timeout=0.3)
+        handle = launcher.submit(self.spec(executable=self.slow_command()))
+        result = handle.result(10)
+        self.assertEqual(result['status'], 'timeout')
+        self.assertFalse(os.path.isfile('/'.join([result['output_path'],
+                                                  'run_d02.txt'])))
+
+    def test_cancel(self):
+        launcher = self.launcher(max_running=1)
+        running = launcher.submit(self.spec(0,
+                                            executable=self.slow_command()))
+        queued = launcher.submit(self.spec(1))
+        queued.cancel()
+        while running.status != 'running':
+            time.sleep(0.01)
+        start = time.time()
+        running.cancel()
+        self.assertEqual(running.result(10)['status'], 'cancelled')
+        self.assertTrue(time.time() - start < 5)
+        self.assertEqual(queued.result(10)['status'], 'cancelled')
+
+    def test_stalled_admission(self):
+        # a policy that never admits cannot block the launcher
+        launcher = self.launcher(admission=NoAdmission(1))
+        handles = launcher.submit_batch([self.spec(i) for i in range(2)])
+        self.assertEqual([handle.result(10)['status'] for handle in handles],
+                         ['done'] * 2)
+
+    def slow_command(self):
+        return stub_command(mean=30)
+
+
+class ResourceSchedulerTest(StubTestCase):
+    def test_most_expensive_first(self):
+        model = CostModel('/'.join([self.path, 'cost.jsonl']), cpu_time=0.1)
+        scheduler = ResourceScheduler(memory=2 ** 40, cores=1, model=model,
+                                      poll_interval=0.02)
+        specs = [self.spec(i, end_epoch='201{}/01/01/00'.format(7 + i))
+                 for i in range(3)]
+        results = list(scheduler.run(specs))
+        self.assertEqual([result['sim_name'] for result in results],
+                         ['run002', 'run001', 'run000'])
+        for result in results:
+            self.assertEqual(result['status'], 'done')
+            self.assertTrue(result['predicted']['cpu_time'] > 0)
+            if os.path.isdir('/proc'):
+                self.assertTrue(result['usage']['cpu_time'] > 0)
+                self.assertTrue(result['usage']['peak_rss'] > 0)
+        self.assertEqual(CostModel(model.filename).n_runs, 3)
+
+    def test_prior(self):
+        spec = complete_spec(self.spec())
+        cpu_time, peak_rss = CostModel(cpu_time=2.0,
+                                       peak_rss=2 ** 20).predict([spec])
+        self.assertAlmostEqual(cpu_time[0], 2.0, delta=0.1)
+        self.assertAlmostEqual(peak_rss[0], 2 ** 20)
+
+    def test_budget(self):
+        # runs larger than the whole budget are started one at a time
+        model = CostModel(peak_rss=2 ** 30)
+        scheduler = ResourceScheduler(memory=2 ** 20, cores=2, model=model,
+                                      poll_interval=0.02)
+        results = list(scheduler.run([self.spec(i) for i in range(2)]))
+        self.assertEqual([result['status'] for result in results],
+                         ['done'] * 2)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from master_mission import mission_pieces, run_mission
+from master_output import read_run
+from tests.support import StubTestCase
+
+ORBIT = [7000.0, 0.001, 98.0, 0.0, 0.0]
+
+
+class MissionPiecesTest(unittest.TestCase):
+    def test_windows(self):
+        pieces = mission_pieces([{'orbit': ORBIT,
+                                  'begin_epoch': '2016/07/01/00',
+                                  'end_epoch': '2018/01/01/00'}])
+        self.assertEqual([piece['window'][0] for piece in pieces],
+                         ['2016/01/01/00', '2017/01/01/00'])
+        self.assertAlmostEqual(sum(piece['duration'] for piece in pieces),
+                               1.5, places=2)
+
+    def test_overlap(self):
+        with self.assertRaises(ValueError):
+            mission_pieces([{'orbit': ORBIT, 'begin_epoch': '2016/01/01/00',
+                             'end_epoch': '2016/06/01/00'},
+                            {'orbit': ORBIT, 'begin_epoch': '2016/05/01/00',
+                             'end_epoch': '2016/07/01/00'}])
+
+
+class RunMissionTest(StubTestCase):
+    def test_fluence(self):
+        # the default run identifier is used when the spec gives none
+        spec = self.spec(sim_name='mission')
+        del spec['run_id']
+        segments = [{'orbit': ORBIT, 'begin_epoch': '2016/01/01/00',
+                     'end_epoch': '2016/04/01/00'},
+                    {'orbit': ORBIT, 'begin_epoch': '2016/04/01/00',
+                     'end_epoch': '2017/01/01/00'}]
+        tables, by_segment, results = run_mission(spec, segments, area=2.0,
+                                                  processes=1)
+        self.assertEqual(len(results), 1)
+        flux = read_run(results[0]['output_path'], 'master')
+        self.assertEqual(sorted(tables), sorted(flux))
+        table = tables['master_d02.txt']
+        self.assertTrue(np.allclose(table.data[:, 1:],
+                                    2.0 * flux['master_d02.txt'].data[:, 1:]))
+        total = sum(item['master_d02.txt'].data[:, 1:]
+                    for item in by_segment.values())
+        self.assertTrue(np.allclose(total, table.data[:, 1:]))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import numpy as np
+
+from master_batch import run_simulation
+from master_output import OutputTable, read_run
+from master_rebin import (SparseHistogram, class_edges, fine_distributions,
+                          fine_spec, histograms)
+from tests.support import StubTestCase
+
+DISTRIBUTION_2D = [['2', '1', '1', '0', '1e-04', '0.1', '-50'],
+                   ['9', '1', '0', '0', '0', '40', '0.5']]
+
+
+class EdgesTest(unittest.TestCase):
+    def test_fine_width_digits(self):
+        row = fine_distributions([['9', '1', '0', '0', '0', '40', '0.3']],
+                                 7)[0]
+        self.assertEqual(float(row[6]), 0.3 / 7)
+        self.assertEqual(len(class_edges(*row[2:3] + row[4:])) - 1, 934)
+
+    def test_missing_classes(self):
+        # classes 1 and 3 of a log distribution are not in the table
+        edges = class_edges('1', '1e-4', '1e-2', '-4')
+        centres = np.sqrt(edges[1:] * edges[:-1])
+        table = OutputTable('run_d02.txt',
+                            ['# Differential flux vs object diameter',
+                             '#  object_diameter  Total'],
+                            np.column_stack([centres[[0, 2]], [1.0, 2.0]]))
+        histogram = SparseHistogram.from_table(
+            table, [['2', '1', '1', '0', '1e-4', '1e-2', '-4']])
+        self.assertTrue(np.allclose(histogram.edges[0], edges))
+        self.assertTrue(np.allclose(histogram.dense()[:, 0],
+                                    [1.0, 0.0, 2.0, 0.0]))
+        rebinned = histogram.rebin([edges[[0, 2, 4]]])
+        self.assertTrue(np.allclose(rebinned.dense()[:, 0], [1.0, 2.0]))
+
+
+class RebinTest(StubTestCase):
+    def test_fine_run_rebinned_to_coarse_classes(self):
+        spec = self.spec(distribution_2D=DISTRIBUTION_2D, distribution_3D=[])
+        fine = run_simulation(fine_spec(dict(spec, sim_name='fine'), 2))
+        coarse = run_simulation(spec)
+        self.assertEqual([fine['status'], coarse['status']], ['done'] * 2)
+        fine_histograms = histograms(read_run(fine['output_path'], 'run'),
+                                     fine['spec']['distribution_2D'])
+        expected = read_run(coarse['output_path'], 'run')
+        for name, number in [('run_d02.txt', 0), ('run_d09.txt', 1)]:
+            row = DISTRIBUTION_2D[number]
+            edges = class_edges(row[2], row[4], row[5], row[6])
+            table = fine_histograms[name].rebin([edges]).to_table(
+                expected[name])
+            self.assertTrue(np.allclose(table.data[:, 0],
+                                        expected[name].data[:, 0]))
+            # the stub spreads the same total flux on the classes
+            self.assertTrue(np.allclose(table.data[:, 1:].sum(axis=0),
+                                        expected[name].data[:, 1:].sum(
+                                            axis=0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
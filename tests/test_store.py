@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+
+import numpy as np
+
+import master_store
+from master_batch import complete_spec, run_simulation
+from master_output import read_run
+from master_store import ResultStore
+from tests.support import StubTestCase
+
+
+class ResultStoreTest(StubTestCase):
+    def setUp(self):
+        StubTestCase.setUp(self)
+        self.chunk_rows = master_store.CHUNK_ROWS
+        master_store.CHUNK_ROWS = 3
+        self.store_path = '/'.join([self.path, 'store'])
+        result = run_simulation(self.spec())
+        self.assertEqual(result['status'], 'done')
+        self.result = result
+
+    def tearDown(self):
+        master_store.CHUNK_ROWS = self.chunk_rows
+        StubTestCase.tearDown(self)
+
+    def add_runs(self, store, n_runs, first=0):
+        for i in range(first, first + n_runs):
+            spec = complete_spec(self.spec(i, orbit=[7000.0, 0.001, 40.0 + i,
+                                                     0.0, 0.0],
+                                           scenario_id=1 + i % 2))
+            self.result['spec'] = spec
+            store.add_result(self.result)
+
+    def chunk_files(self, kind):
+        return sorted(name for name in os.listdir(self.store_path)
+                      if name.startswith(kind + '_'))
+
+    def test_query(self):
+        store = ResultStore(self.store_path)
+        self.add_runs(store, 7)
+        self.assertEqual(len(store), 7)
+        self.assertEqual(list(store.query(inc=(42, 45))), [2, 3, 4, 5])
+        self.assertEqual(list(store.query(inc=(42, 45), scenario_id=1)),
+                         [2, 4])
+        self.assertEqual(list(store.query(scenario_id=3)), [])
+        self.assertEqual(list(store.query()), list(range(7)))
+        with self.assertRaises(KeyError):
+            store.query(sim_name='run000')
+        params = store.params([1, 6])
+        self.assertEqual(list(params['sim_name']), ['run001', 'run006'])
+        self.assertTrue(np.allclose(params['inc'], [41, 46]))
+
+    def test_reads_do_not_write_chunks(self):
+        store = ResultStore(self.store_path)
+        for i in range(5):
+            self.add_runs(store, 1, i)
+            self.assertEqual(list(store.query(inc=(40, 40 + i))),
+                             list(range(i + 1)))
+            self.assertEqual(len(store.params()['inc']), i + 1)
+            self.assertEqual(sorted(store.tables(i)),
+                             sorted(store.tables(0)))
+        # one full chunk, the other two runs are pending
+        self.assertEqual(self.chunk_files('params'), ['params_00000.npz'])
+        self.assertEqual(self.chunk_files('index'), ['index_00000.npz'])
+
+    def test_reopen(self):
+        store = ResultStore(self.store_path)
+        self.add_runs(store, 4)
+        store.close()
+        self.assertEqual(len(self.chunk_files('params')), 2)
+        store = ResultStore(self.store_path)
+        self.add_runs(store, 3, 4)
+        store.close()
+        store = ResultStore(self.store_path)
+        self.assertEqual(len(store), 7)
+        self.assertEqual(list(store.query(inc=(43, 46))), [3, 4, 5, 6])
+        expected = dict((name, table.data) for name, table in
+                        read_run(self.result['output_path'], 'run').items())
+        for row in (0, 3, 6):
+            tables = store.tables(row)
+            self.assertEqual(sorted(tables), sorted(expected))
+            for name in tables:
+                self.assertTrue(np.array_equal(tables[name], expected[name]))
+        with self.assertRaises(IndexError):
+            store.tables(7)
+
+    def test_missing_index_is_rebuilt(self):
+        store = ResultStore(self.store_path)
+        self.add_runs(store, 3)
+        os.remove('/'.join([self.store_path, 'index_00000.npz']))
+        store = ResultStore(self.store_path)
+        self.assertEqual(list(store.query(inc=(41, 41))), [1])
+        self.assertEqual(self.chunk_files('index'), ['index_00000.npz'])
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from master_surrogate import epoch_year, spec_point
+
+
+class EpochYearTest(unittest.TestCase):
+    def test_middle_of_interval(self):
+        self.assertAlmostEqual(epoch_year('2016/01/01/00', '2017/01/01/00'),
+                               2016.5)
+        # the middle of a leap day
+        self.assertAlmostEqual(epoch_year('2016/02/29/00', '2016/03/01/00'),
+                               2016 + (59.5 / 366))
+        self.assertAlmostEqual(epoch_year('2017/01/01/00', '2017/01/01/00'),
+                               2017.0)
+
+    def test_spec_point(self):
+        point = spec_point({'orbit': ['7000', '0.001', '98', '0', '0'],
+                            'begin_epoch': '2016/01/01/00',
+                            'end_epoch': '2017/01/01/00'})
+        self.assertEqual(point[:5], [7000.0, 0.001, 98.0, 0.0, 0.0])
+        self.assertAlmostEqual(point[5], 2016.5)
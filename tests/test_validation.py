@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from master_batch import complete_spec, make_run, validate_batch
+from master_validation import check_epochs
+from tests.support import StubTestCase
+
+
+class ValidationTest(StubTestCase):
+    def problems(self, **entries):
+        spec = complete_spec(self.spec(**entries))
+        return [message for _, _, message in check_epochs([(0, spec)])]
+
+    def test_epochs(self):
+        self.assertEqual(self.problems(), [])
+        single = {'begin_epoch': '2016/01/01/00',
+                  'end_epoch': '2016/01/01/00'}
+        self.assertEqual(self.problems(**single),
+                         ["end_epoch is not after begin_epoch"])
+        for mode in (2, 3):
+            self.assertEqual(self.problems(analysis_mode=mode, **single), [])
+            self.assertEqual(self.problems(analysis_mode=mode,
+                                           end_epoch='2015/01/01/00'),
+                             ["end_epoch is before begin_epoch"])
+        self.assertEqual(len(self.problems(begin_epoch='2016/02/30/00')), 1)
+
+    def test_batch(self):
+        validate_batch([self.spec(i) for i in range(2)])
+        with self.assertRaises(ValueError):
+            validate_batch([self.spec(0), self.spec(0)])
+        with self.assertRaises(ValueError):
+            validate_batch([self.spec(switches=['1'] * 10)])
+
+    def test_input_switches(self):
+        spec = complete_spec(self.spec())
+        run = make_run(spec)
+        self.assertTrue(run.check_simulation())
+        run.set_master_config()
+        for switches in (['1'] * 10, ['2'] + ['1'] * 10):
+            with self.assertRaises(ValueError):
+                run.set_master_input(spec['orbit'], spec['begin_epoch'],
+                                     spec['end_epoch'], switches=switches)
@@ -1,5 +1,6 @@
-<<<<<<< HEAD
 import os
+import signal
+import subprocess
 
 def print_warning(message, category=UserWarning):  # , filename='', lineno=-1):
     """Prettier printing of warning messages.
@@ -17,7 +18,7 @@ def print_warning(message, category=UserWarning):  # , filename='', lineno=-1):
     print ' %s: %s' % (category.__name__, message)
 
 
-def create_folder(folder_name, path, sub_folders=None):
+def create_folder(folder_name, path, sub_folders=None, overwrite=None):
     """Creates a folder inside the specified location. Also subfolders can be
     specified.
     
@@ -44,6 +45,11 @@ def create_folder(folder_name, path, sub_folders=None):
         in this case the sub-folder Sub_1 has two sub-sub-folders
         'Sub_Sub_1' and 'Sub_Sub_2', whereas 'Sub_2' has one
         'Sub_Sub_1'.
+    - overwrite (bool):
+        what to do if the folder already exists. If None the user is asked
+        whether to continue, if True the folder is used anyway (the missing
+        sub-folders are created), if False it is left untouched. Use True or
+        False when running without a console (e.g. in worker processes).
     
     Returns
     -------
@@ -61,88 +67,131 @@ def create_folder(folder_name, path, sub_folders=None):
             os.makedirs('/'.join([path, folder_name]))
         return True
     except OSError:
-        print '/'.join([path, folder_name])
-        if os.path.isdir('/'.join([path, folder_name])):
-            print_warning("The folder already exists! The simulation will " +
-                          "overwrite the previous results.\n")
-        cont = raw_input("Do you want to continue? yes/no > ")
-        while cont.lower() not in ("yes", "no"):
-            cont = raw_input("Do you want to continue? yes/no > ")
-        if cont == "no":
+        if overwrite is False:
             return False
-        else:
-=======
-import os
+        if overwrite is None:
+            print '/'.join([path, folder_name])
+            if os.path.isdir('/'.join([path, folder_name])):
+                print_warning("The folder already exists! The simulation " +
+                              "will overwrite the previous results.\n")
+            cont = raw_input("Do you want to continue? yes/no > ")
+            while cont.lower() not in ("yes", "no"):
+                cont = raw_input("Do you want to continue? yes/no > ")
+            if cont == "no":
+                return False
+        for sub_folder in sub_folders or []:
+            if not os.path.isdir('/'.join([path, folder_name, sub_folder])):
+                os.makedirs('/'.join([path, folder_name, sub_folder]))
+        return True
+
+
+def link_folder(source, link_name):
+    """Creates a link to an existing folder, so that it can be accessed from a
+    different location without copying its content. Symbolic links are used
+    when available, otherwise on Windows a directory junction is created.
 
-def print_warning(message, category=UserWarning):  # , filename='', lineno=-1):
-    """Prettier printing of warning messages.
     Inputs
     ------
-    - message (str):
-        the warning message to be displayed
-    - category:
-        the warning category associated to the message.
-        Default value:
-            UserWarning
-        Examples:
-            UserWarning, SyntaxWarning, etc.
+    - source (str):
+        the path to the folder to be linked.
+    - link_name (str):
+        the path of the link to be created.
+
+    Returns
+    -------
+    - True:
+        if the link exists or has been created.
+    - False:
+        if the link could not be created. In this case the original folder
+        has to be used directly.
     """
-    print ' %s: %s' % (category.__name__, message)
+    if os.path.isdir(link_name):
+        return True
+    if not os.path.isdir(source):
+        print_warning("The folder %s does not exist." % source)
+        return False
+    try:
+        if hasattr(os, 'symlink'):
+            os.symlink(source, link_name)
+        elif os.name == 'nt':
+            with open(os.devnull, 'w') as devnull:
+                subprocess.check_call(['mklink', '/J',
+                                       os.path.normpath(link_name),
+                                       os.path.normpath(source)],
+                                      shell=True, stdout=devnull,
+                                      stderr=devnull)
+        else:
+            return False
+    except (OSError, subprocess.CalledProcessError):
+        print_warning("Could not link %s to %s." % (link_name, source))
+        return False
+    return True
 
 
-def create_folder(folder_name, path, sub_folders=None):
-    """Creates a folder inside the specified location. Also subfolders can be
-    specified.
-    
+def unlink_folder(link_name):
+    """Removes a link created by link_folder without touching the folder it
+    points to. On Windows directory junctions are removed with os.rmdir,
+    which only succeeds on the junction itself or on an empty folder, whereas
+    shutil.rmtree would delete the files behind the junction.
+
+    Returns
+    -------
+    - True:
+        if there is no longer anything at link_name.
+    - False:
+        if link_name is a real folder, which is left untouched.
+    """
+    if os.path.islink(link_name):
+        os.remove(link_name)
+    elif os.path.isdir(link_name):
+        try:
+            os.rmdir(link_name)
+        except OSError:
+            return False
+    return not os.path.lexists(link_name)
+
+
+def start_process(args, cwd=None):
+    """Starts a process in a new process group, so that the process and all
+    its children can be stopped with kill_process_tree. On Windows the
+    process is started through the shell.
+
     Inputs
     ------
-    - folder_name (str):
-        the name of the folder to be created.
-    - path (str):
-        the path to the location where the folder has to be created.
-    - sub_folders (list):
-        a list containing all the subfolders to be created inside the main
-        folder (folder_name). If sub-sub-folders has to be created the
-        complete path has to be specified.
-        Examples: supposing the main folder is 'Root' and the subfolders are 'Sub_1'
-        and 'Sub_2', and that the location of the folder 'Root' has to be
-        'C:/temp' we have:
-            create_folder('Root', 'C:/temp', ['Sub_1', 'Sub_2'])
+    - args (list):
+        the command to be executed.
+    - cwd (str):
+        the working directory of the process.
 
-        in case the sub-folders have sub-sub-folders we would have:
-            create_folder('Root', 'C:/temp', ['Sub_1/Sub_Sub_1',
-                                              'Sub_1/Sub_Sub_2'
-                                              'Sub_2/Sub_Sub_1'])
-
-        in this case the sub-folder Sub_1 has two sub-sub-folders
-        'Sub_Sub_1' and 'Sub_Sub_2', whereas 'Sub_2' has one
-        'Sub_Sub_1'.
-    
     Returns
     -------
-    - 0:
-        returns 0 when the folder did not exist before.
-    - 1:
-        returns 1 if the folder already existed.
-    Note: this is used later 
+    - process (subprocess.Popen)
+    """
+    if os.name == 'nt':
+        return subprocess.Popen(
+            args, cwd=cwd, shell=True,
+            creationflags=subprocess.CREATE_NEW_PROCESS_GROUP)
+    return subprocess.Popen(args, cwd=cwd, preexec_fn=os.setsid)
+
+
+def kill_process_tree(process):
+    """Stops a process started with start_process and all its children.
+
+    Inputs
+    ------
+    - process (subprocess.Popen):
+        the process to be stopped.
     """
+    if process.poll() is not None:
+        return
     try:
-        try:
-            for sub_folder in sub_folders:
-                os.makedirs('/'.join([path, folder_name, sub_folder]))
-        except TypeError:
-            os.makedirs('/'.join([path, folder_name]))
-        return True
-    except OSError:
-        print '/'.join([path, folder_name])
-        if os.path.isdir('/'.join([path, folder_name])):
-            print_warning("The folder already exists! The simulation will " +
-                          "overwrite the previous results.\n")
-        cont = raw_input("Do you want to continue? yes/no > ")
-        while cont.lower() not in ("yes", "no"):
-            cont = raw_input("Do you want to continue? yes/no > ")
-        if cont == "no":
-            return False
+        if os.name == 'nt':
+            with open(os.devnull, 'w') as devnull:
+                subprocess.call(['taskkill', '/F', '/T', '/PID',
+                                 str(process.pid)],
+                                stdout=devnull, stderr=devnull)
         else:
->>>>>>> a7a72265d0def9848445cca96d820f7f26b818db
-            return True
\ No newline at end of file
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    process.wait()